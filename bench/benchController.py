@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+# ============================================= #
+#                                               #
+# Copyright © 2023 JC`zic (Jean-Christophe Bos) #
+#             jczic.bos@gmail.com               #
+#                                               #
+# ============================================= #
+
+# Benchmarks of ESP32Controller against the pty fake device or a real one,
+# results are printed as JSON to be compared across commits:
+#
+#   python bench/benchController.py -o before.json
+#   python bench/benchController.py -o after.json -c before.json
+#   python bench/benchController.py -p /dev/ttyUSB0      (real device)
+#   python bench/benchController.py -u micropython       (unix port)
+
+
+from   os                import mkdir
+from   os.path           import abspath, dirname, join as pathJoin
+from   time              import perf_counter, time, sleep
+from   threading         import Event
+from   tempfile          import TemporaryDirectory
+from   statistics        import mean, median
+from   random            import Random
+import subprocess
+import platform
+import getopt
+import json
+import sys
+
+sys.path.insert(0, pathJoin(dirname(abspath(__file__)), '..', 'src'))
+
+from   esp32Controller   import ESP32Controller
+from   fakeDevice        import FakeDevice
+from   unixPortDevice    import UnixPortDevice
+
+
+# ===============================================================================
+# ===( ControllerBench )=========================================================
+# ===============================================================================
+
+class ControllerBench :
+
+    BENCH_NAMES              = ( 'connect',
+                                 'exeCodeREPL',
+                                 'execProgram',
+                                 'putFileContent',
+                                 'getFileContent',
+                                 'sendFile',
+                                 'recvFile' )
+
+    DEFAULT_BAUDRATE         = 115200
+    DEFAULT_REPEAT           = 5
+    DEFAULT_SIZE             = 16*1024
+    REPL_ROUND_TRIPS         = 20
+    PROGRAM_END_TIMEOUT_SEC  = 60
+    REMOTE_FILENAME          = '/_jamaBench.bin'
+
+    # ---------------------------------------------------------------------------
+
+    def __init__( self,
+                  devicePort = None,
+                  baudrate   = DEFAULT_BAUDRATE,
+                  latencySec = 0,
+                  repeat     = DEFAULT_REPEAT,
+                  size       = DEFAULT_SIZE,
+                  unixPort   = None ) :
+        self._devicePort = devicePort
+        self._unixPort   = unixPort
+        self._baudrate   = baudrate
+        self._latencySec = latencySec
+        self._repeat     = max(1, repeat)
+        self._size       = size
+        self._device     = None
+        self._tmpDir     = None
+        self._endEvent   = Event()
+        # Half random and half text so that compressed transfer modes are not flattered,
+        rnd              = Random(0)
+        text             = b''.join(b'line %05d : some program output\r\n' % i for i in range(size // 32 + 1))
+        self._data       = bytes(rnd.getrandbits(8) for _ in range(size // 2)) + text[:size - size // 2]
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _summary(samples, unit) :
+        return dict( unit   = unit,
+                     count  = len(samples),
+                     min    = round(min(samples), 3),
+                     median = round(median(samples), 3),
+                     mean   = round(mean(samples), 3),
+                     max    = round(max(samples), 3) )
+
+    # ---------------------------------------------------------------------------
+
+    def _connect(self) :
+        return ESP32Controller( self._devicePort,
+                                baudrate       = self._baudrate or self.DEFAULT_BAUDRATE,
+                                onEndOfProgram = lambda ctrl : self._endEvent.set(),
+                                onProgramError = lambda ctrl, err : self._endEvent.set() )
+
+    # ---------------------------------------------------------------------------
+
+    def _benchConnect(self, ctrl) :
+        # Measured on fresh connections, the shared one is closed meanwhile,
+        ctrl.Close()
+        samples = [ ]
+        for i in range(self._repeat) :
+            t = perf_counter()
+            c = self._connect()
+            samples.append((perf_counter() - t) * 1000)
+            c.Close()
+        return self._summary(samples, 'ms')
+
+    # ---------------------------------------------------------------------------
+
+    def _benchExeCodeREPL(self, ctrl) :
+        ctrl.ExeCodeREPL('1')
+        samples = [ ]
+        for i in range(self._repeat * self.REPL_ROUND_TRIPS) :
+            t = perf_counter()
+            ctrl.ExeCodeREPL('%d + 1' % i)
+            samples.append((perf_counter() - t) * 1000)
+        return self._summary(samples, 'ms')
+
+    # ---------------------------------------------------------------------------
+
+    def _benchExecProgram(self, ctrl) :
+        # Upload rate of a program of the benchmark size up to its end on the device,
+        lines   = [ 'x = %d\n' % i for i in range(self._size // 8 + 1) ]
+        code    = ''.join(lines)[:self._size - 16].rsplit('\n', 1)[0] + '\nprint(x)\n'
+        samples = [ ]
+        for i in range(self._repeat) :
+            self._endEvent.clear()
+            t = perf_counter()
+            ctrl.ExecProgram(code, '<bench>')
+            if not self._endEvent.wait(self.PROGRAM_END_TIMEOUT_SEC) :
+                raise Exception('Program has not ended.')
+            samples.append(len(code) / (perf_counter() - t))
+            while ctrl.IsProcessing() :
+                sleep(0.001)
+        return self._summary(samples, 'B/s')
+
+    # ---------------------------------------------------------------------------
+
+    def _benchPutFileContent(self, ctrl) :
+        samples = [ ]
+        for i in range(self._repeat) :
+            t = perf_counter()
+            ctrl.PutFileContent(self.REMOTE_FILENAME, self._data)
+            samples.append(len(self._data) / (perf_counter() - t))
+        return self._summary(samples, 'B/s')
+
+    # ---------------------------------------------------------------------------
+
+    def _benchGetFileContent(self, ctrl) :
+        ctrl.PutFileContent(self.REMOTE_FILENAME, self._data)
+        samples = [ ]
+        for i in range(self._repeat) :
+            t = perf_counter()
+            if ctrl.GetFileContent(self.REMOTE_FILENAME) != self._data :
+                raise Exception('Received content differs.')
+            samples.append(len(self._data) / (perf_counter() - t))
+        return self._summary(samples, 'B/s')
+
+    # ---------------------------------------------------------------------------
+
+    def _benchSendFile(self, ctrl) :
+        localFilename = pathJoin(self._tmpDir, 'send.bin')
+        with open(localFilename, 'wb') as f :
+            f.write(self._data)
+        samples = [ ]
+        for i in range(self._repeat) :
+            t = perf_counter()
+            ctrl.SendFile(localFilename, self.REMOTE_FILENAME)
+            samples.append(len(self._data) / (perf_counter() - t))
+        return self._summary(samples, 'B/s')
+
+    # ---------------------------------------------------------------------------
+
+    def _benchRecvFile(self, ctrl) :
+        ctrl.PutFileContent(self.REMOTE_FILENAME, self._data)
+        localFilename = pathJoin(self._tmpDir, 'recv.bin')
+        samples = [ ]
+        for i in range(self._repeat) :
+            t = perf_counter()
+            ctrl.RecvFile(self.REMOTE_FILENAME, localFilename)
+            samples.append(len(self._data) / (perf_counter() - t))
+            with open(localFilename, 'rb') as f :
+                if f.read() != self._data :
+                    raise Exception('Received file differs.')
+        return self._summary(samples, 'B/s')
+
+    # ---------------------------------------------------------------------------
+
+    def _getMeta(self) :
+        try :
+            commit = subprocess.run( [ 'git', 'rev-parse', '--short', 'HEAD' ],
+                                     cwd            = dirname(abspath(__file__)),
+                                     capture_output = True,
+                                     text           = True ).stdout.strip() or None
+        except :
+            commit = None
+        return dict( time       = round(time()),
+                     commit     = commit,
+                     python     = platform.python_version(),
+                     platform   = platform.platform(),
+                     device     = ( self._devicePort if not self._device else
+                                        'unix port' if self._unixPort else 'fake' ),
+                     baudrate   = self._baudrate,
+                     latencySec = self._latencySec,
+                     repeat     = self._repeat,
+                     size       = self._size )
+
+    # ---------------------------------------------------------------------------
+
+    def Run(self, names=None) :
+        names   = [ x for x in self.BENCH_NAMES if not names or x in names ]
+        results = { }
+        with TemporaryDirectory() as tmpDir :
+            self._tmpDir = tmpDir
+            if not self._devicePort :
+                mkdir(pathJoin(tmpDir, 'flash'))
+                if self._unixPort :
+                    self._device = UnixPortDevice( rootPath        = pathJoin(tmpDir, 'flash'),
+                                                   micropythonPath = self._unixPort )
+                else :
+                    self._device = FakeDevice( rootPath   = pathJoin(tmpDir, 'flash'),
+                                               baudrate   = self._baudrate,
+                                               latencySec = self._latencySec )
+                self._devicePort = self._device.Start()
+            try :
+                meta = self._getMeta()
+                for name in names :
+                    # Each benchmark gets its own connection, "connect" closes the one it gets,
+                    ctrl = self._connect()
+                    try :
+                        results[name] = getattr(self, '_bench' + name[0].upper() + name[1:])(ctrl)
+                    except Exception as ex :
+                        results[name] = dict(error=str(ex))
+                    finally :
+                        ctrl.Close()
+                try :
+                    ctrl = self._connect()
+                    ctrl.DeleteFileOrRecurDir(self.REMOTE_FILENAME)
+                    ctrl.Close()
+                except :
+                    pass
+            finally :
+                if self._device :
+                    self._device.Stop()
+                    self._device     = None
+                    self._devicePort = None
+        return dict(meta=meta, results=results)
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def Compare(base, current) :
+        # Returns text lines comparing medians, a positive change is an improvement,
+        lines = [ '%-16s %14s %14s %9s' % ('benchmark', 'base', 'current', 'change') ]
+        for name, res in current['results'].items() :
+            old = base.get('results', { }).get(name)
+            if 'median' not in res or not old or 'median' not in old or not old['median'] :
+                lines.append('%-16s %14s %14s %9s' % (name, '-', res.get('median', 'error'), '-'))
+                continue
+            change = (res['median'] - old['median']) / old['median'] * 100
+            if res['unit'] == 'ms' :
+                change = -change
+            lines.append( '%-16s %11s %-2s %11s %-2s %+8.1f%%' % ( name,
+                                                                   old['median'], old['unit'],
+                                                                   res['median'], res['unit'],
+                                                                   change ) )
+        return lines
+
+# ============================================================================
+# ===( MAIN  )================================================================
+# ============================================================================
+
+def _usage() :
+    print( 'Usage: python benchController.py [options]\n'                              +
+           '  -p, --port=PORT        real device port (default: pty fake device)\n'     +
+           '  -u, --unix-port=PATH   runs on the MicroPython unix port binary PATH\n'   +
+           '  -b, --baudrate=BAUD    link baudrate, 0 for an unthrottled fake device\n' +
+           '  -l, --latency=SEC      fake device latency per write\n'                   +
+           '  -n, --repeat=N         runs per benchmark\n'                              +
+           '  -s, --size=BYTES       transfer and program size\n'                       +
+           '  -t, --bench=NAMES      comma separated benchmarks (%s)\n' % ','.join(ControllerBench.BENCH_NAMES) +
+           '  -o, --output=FILE      also writes JSON results to FILE\n'                +
+           '  -c, --compare=FILE     compares with previous JSON results' )
+
+if __name__ == '__main__' :
+    try :
+        opts, args = getopt.getopt( sys.argv[1:], 'hp:u:b:l:n:s:t:o:c:',
+                                    [ 'help', 'port=', 'unix-port=', 'baudrate=', 'latency=', 'repeat=',
+                                      'size=', 'bench=', 'output=', 'compare=' ] )
+    except getopt.GetoptError as ex :
+        print(ex)
+        _usage()
+        sys.exit(2)
+    kwargs   = { }
+    names    = None
+    output   = None
+    compare  = None
+    for opt, arg in opts :
+        if opt in ('-h', '--help') :
+            _usage()
+            sys.exit(0)
+        elif opt in ('-p', '--port') :
+            kwargs['devicePort'] = arg
+        elif opt in ('-u', '--unix-port') :
+            kwargs['unixPort'] = arg
+        elif opt in ('-b', '--baudrate') :
+            kwargs['baudrate'] = int(arg)
+        elif opt in ('-l', '--latency') :
+            kwargs['latencySec'] = float(arg)
+        elif opt in ('-n', '--repeat') :
+            kwargs['repeat'] = int(arg)
+        elif opt in ('-s', '--size') :
+            kwargs['size'] = int(arg)
+        elif opt in ('-t', '--bench') :
+            names = [ x.strip() for x in arg.split(',') if x.strip() ]
+        elif opt in ('-o', '--output') :
+            output = arg
+        elif opt in ('-c', '--compare') :
+            compare = arg
+    report = ControllerBench(**kwargs).Run(names)
+    text   = json.dumps(report, indent=2)
+    print(text)
+    if output :
+        with open(output, 'w') as f :
+            f.write(text + '\n')
+    if compare :
+        with open(compare, 'r') as f :
+            base = json.load(f)
+        print('\n'.join(ControllerBench.Compare(base, report)), file=sys.stderr)
+
+# ============================================================================
+# ============================================================================
+# ============================================================================
@@ -0,0 +1,963 @@
+# -*- coding: utf-8 -*-
+
+# ============================================= #
+#                                               #
+# Copyright © 2023 JC`zic (Jean-Christophe Bos) #
+#             jczic.bos@gmail.com               #
+#                                               #
+# ============================================= #
+
+# Simulated MicroPython device speaking the REPL protocols on a Linux pty,
+# friendly and raw REPL (CTRL-A/B/C/D), raw-paste mode, soft and hard reboots,
+# with optional baudrate throttling and latency to mimic a real UART link.
+#
+#   dev  = FakeDevice(rootPath='/tmp/flash', baudrate=115200)
+#   port = dev.Start()
+#   ctrl = ESP32Controller(port)
+#
+# Code runs in the host Python interpreter with fake MicroPython modules
+# (os, sys, machine, esp32, network, ...), the flash filesystem is rootPath.
+
+
+from   pathlib           import Path
+from   time              import sleep, time
+from   _thread           import allocate_lock, start_new_thread, get_ident
+from   queue             import SimpleQueue
+import builtins
+import ctypes
+import traceback
+import os
+import sys
+import pty
+import tty
+import types
+import zlib
+import termios
+
+# ===============================================================================
+
+class FakeDeviceException(Exception) :
+    pass
+
+# ===============================================================================
+
+class _fakeSoftReset(BaseException) :
+    pass
+
+class _fakeHardReset(BaseException) :
+    pass
+
+# ===============================================================================
+
+class FakeDevice :
+
+    # ---------------------------------------------------------------------------
+
+    MACHINE        = 'ESP32 module with ESP32'
+    RELEASE        = '1.20.0'
+    VERSION        = 'v1.20.0 on 2023-04-26'
+    MPY_VERSION    = 6
+    BANNER         = 'MicroPython %s; %s\r\nType "help()" for more information.\r\n' % (VERSION, MACHINE)
+    RAW_BANNER     = 'raw REPL; CTRL-B to exit\r\n'
+    RAW_PASTE_BUF  = 256
+    NO_DEFLATE     = False
+    UART0_DISABLED = False
+
+    _displayHooks  = { }
+    _savedDispHook = None
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _displayHook(value) :
+        dev = FakeDevice._displayHooks.get(get_ident())
+        if dev is None :
+            FakeDevice._savedDispHook(value)
+        elif value is not None :
+            dev._txText(repr(value) + '\n')
+
+    # ---------------------------------------------------------------------------
+
+    def __init__( self,
+                  rootPath   = None,
+                  baudrate   = None,
+                  latencySec = 0,
+                  rawPaste   = True ) :
+        self._rootPath   = Path(rootPath) if rootPath else None
+        self._baudrate   = baudrate
+        self._uartBaud   = baudrate
+        self._latencySec = latencySec
+        self._rawPaste   = rawPaste
+        self._running    = False
+        self._execThread = None
+        self._rxQueue    = SimpleQueue()
+        self._lockTx     = allocate_lock()
+        self._nvs        = { }
+        self._kbdIntr    = 0x03
+        self._masterFD   = None
+        self._slaveFD    = None
+        self.BytesRecv   = 0
+        self.BytesSent   = 0
+        self._resetGlobals()
+
+    # ---------------------------------------------------------------------------
+
+    def Start(self) :
+        if self._running :
+            raise FakeDeviceException('Fake device already started.')
+        self._masterFD, self._slaveFD = pty.openpty()
+        tty.setraw(self._masterFD)
+        tty.setraw(self._slaveFD)
+        self._running = True
+        start_new_thread(self._threadRecv, ())
+        start_new_thread(self._threadREPL, ())
+        return self.GetPortName()
+
+    # ---------------------------------------------------------------------------
+
+    def Stop(self) :
+        if self._running :
+            self._running = False
+            self._rxQueue.put(None)
+            for fd in (self._masterFD, self._slaveFD) :
+                try :
+                    os.close(fd)
+                except :
+                    pass
+
+    # ---------------------------------------------------------------------------
+
+    def GetPortName(self) :
+        return os.ttyname(self._slaveFD)
+
+    # ---------------------------------------------------------------------------
+
+    _TERMIOS_BAUDS = { getattr(termios, 'B%d' % b) : b
+                       for b in (9600, 57600, 115200, 230400, 460800, 921600, 1500000, 2000000)
+                       if hasattr(termios, 'B%d' % b) }
+
+    def SetUARTBaudrate(self, baudrate) :
+        if not self._baudrate :
+            raise ValueError('UART(0) is disabled (dedicated to REPL)')
+        self._uartBaud = baudrate
+
+    def _linkGarbled(self) :
+        # Emulates a baudrate mismatch between the host port and the device UART,
+        if not self._baudrate :
+            return False
+        try :
+            hostBaud = self._TERMIOS_BAUDS.get(termios.tcgetattr(self._slaveFD)[5])
+        except :
+            return False
+        return hostBaud != self._uartBaud
+
+    def _throttle(self, size) :
+        if self._baudrate :
+            sleep(size * 10 / self._uartBaud)
+
+    # ---------------------------------------------------------------------------
+
+    def _threadRecv(self) :
+        while self._running :
+            try :
+                data = os.read(self._masterFD, 4096)
+            except :
+                break
+            if not data :
+                break
+            self._throttle(len(data))
+            self.BytesRecv += len(data)
+            if self._linkGarbled() :
+                data = bytes((c * 7 + 0x5A) & 0xFF for c in data)
+            for c in data :
+                if c == self._kbdIntr and self._execThread :
+                    self._interrupt()
+                else :
+                    self._rxQueue.put(c)
+        self._running = False
+
+    # ---------------------------------------------------------------------------
+
+    def _interrupt(self) :
+        ctypes.pythonapi.PyThreadState_SetAsyncExc( ctypes.c_ulong(self._execThread),
+                                                    ctypes.py_object(KeyboardInterrupt) )
+
+    # ---------------------------------------------------------------------------
+
+    def _rxChr(self) :
+        c = self._rxQueue.get()
+        if c is None :
+            raise SystemExit()
+        return c
+
+    # ---------------------------------------------------------------------------
+
+    def _tx(self, data) :
+        if isinstance(data, str) :
+            data = data.encode()
+        if data and self._running :
+            with self._lockTx :
+                if self._latencySec :
+                    sleep(self._latencySec)
+                self._throttle(len(data))
+                if self._linkGarbled() :
+                    data = bytes((c * 7 + 0x5A) & 0xFF for c in data)
+                try :
+                    os.write(self._masterFD, data)
+                    self.BytesSent += len(data)
+                except :
+                    pass
+
+    # ---------------------------------------------------------------------------
+
+    def _txText(self, text) :
+        self._tx(text.replace('\r\n', '\n').replace('\n', '\r\n'))
+
+    # ---------------------------------------------------------------------------
+
+    def _threadREPL(self) :
+        try :
+            self._tx(self.BANNER + '>>> ')
+            while self._running :
+                try :
+                    self._friendlyREPL()
+                except _fakeHardReset :
+                    self._hardReset()
+                except _fakeSoftReset :
+                    self._softReset()
+                    self._tx(self.BANNER + '>>> ')
+        except SystemExit :
+            pass
+
+    # ---------------------------------------------------------------------------
+
+    def _hardReset(self) :
+        self._resetGlobals()
+        self._uartBaud = self._baudrate
+        self._tx('ets Jun  8 2016 00:22:57\r\n\r\nrst:0xc (SW_CPU_RESET),boot:0x13 (SPI_FAST_FLASH_BOOT)\r\n')
+        self._tx(self.BANNER + '>>> ')
+
+    # ---------------------------------------------------------------------------
+
+    def _softReset(self) :
+        self._resetGlobals()
+        self._tx('MPY: soft reboot\r\n')
+
+    # ---------------------------------------------------------------------------
+
+    def _friendlyREPL(self) :
+        line = b''
+        while True :
+            c = self._rxChr()
+            if c == 0x01 :
+                self._rawREPL()
+                line = b''
+            elif c == 0x02 :
+                self._tx('\r\n' + self.BANNER + '>>> ')
+                line = b''
+            elif c == 0x03 :
+                self._tx('\r\n>>> ')
+                line = b''
+            elif c == 0x04 :
+                self._tx('\r\n')
+                self._softReset()
+                self._tx(self.BANNER + '>>> ')
+                line = b''
+            elif c == 0x0D :
+                self._tx('\r\n')
+                if line.strip() :
+                    self._execute(line, 'single', printEOF=False)
+                self._tx('>>> ')
+                line = b''
+            elif c >= 0x20 :
+                line += bytes([c])
+                self._tx(bytes([c]))
+
+    # ---------------------------------------------------------------------------
+
+    def _rawREPL(self) :
+        self._tx(self.RAW_BANNER)
+        while True :
+            self._tx('>')
+            line = bytearray()
+            while True :
+                c = self._rxChr()
+                if c == 0x01 :
+                    if len(line) == 2 and line[0] == 0x05 :
+                        self._rawPasteREPL(line[1])
+                        line = None
+                        break
+                    self._tx(self.RAW_BANNER)
+                    line = bytearray()
+                    self._tx('>')
+                elif c == 0x02 :
+                    self._tx('\r\n' + self.BANNER + '>>> ')
+                    return
+                elif c == 0x03 :
+                    line = bytearray()
+                elif c == 0x04 :
+                    break
+                else :
+                    line.append(c)
+            if line is None :
+                # Like the firmware, raw-paste mode ends with a raw REPL reset,
+                self._tx(self.RAW_BANNER)
+                continue
+            self._tx('OK')
+            if not line :
+                self._tx('\r\n')
+                self._softReset()
+                self._tx(self.RAW_BANNER)
+                continue
+            self._execute(bytes(line), 'exec', printEOF=True)
+
+    # ---------------------------------------------------------------------------
+
+    def _rawPasteREPL(self, cmd) :
+        if cmd != ord('A') or not self._rawPaste :
+            self._tx(b'R\x00')
+            return
+        self._tx(b'R\x01')
+        window = self.RAW_PASTE_BUF // 2
+        self._tx(bytes([window & 0xFF, window >> 8, 0x01]))
+        data     = bytearray()
+        consumed = 0
+        while True :
+            c = self._rxChr()
+            if c == 0x04 :
+                break
+            data.append(c)
+            consumed += 1
+            if consumed == window :
+                consumed = 0
+                self._tx(b'\x01')
+        self._tx(b'\x04')
+        self._execute(bytes(data), 'exec', printEOF=True)
+
+    # ---------------------------------------------------------------------------
+
+    def _execute(self, source, mode, printEOF) :
+        err = None
+        try :
+            try :
+                code = compile(source.decode(), '<stdin>', mode)
+            except SyntaxError as ex :
+                err = 'Traceback (most recent call last):\n' + \
+                      '  File "<stdin>", line %s\n' % ex.lineno + \
+                      'SyntaxError: invalid syntax\n'
+                code = None
+            if code :
+                self._execThread = get_ident()
+                FakeDevice._displayHooks[get_ident()] = self
+                try :
+                    exec(code, self._globals)
+                except (_fakeSoftReset, _fakeHardReset, SystemExit) :
+                    raise
+                except BaseException as ex :
+                    err = self._formatException(ex)
+                finally :
+                    self._execThread = None
+                    del FakeDevice._displayHooks[get_ident()]
+        except KeyboardInterrupt as ex :
+            err = self._formatException(ex)
+        if printEOF :
+            self._tx(b'\x04')
+            if err :
+                self._txText(err)
+            self._tx(b'\x04')
+        elif err :
+            self._txText(err)
+
+    # ---------------------------------------------------------------------------
+
+    def _formatException(self, ex) :
+        lines = [ 'Traceback (most recent call last):' ]
+        for frame in traceback.extract_tb(ex.__traceback__) :
+            if frame.filename != __file__ :
+                lines.append('  File "%s", line %s, in %s' % (frame.filename, frame.lineno, frame.name))
+        msg = str(ex)
+        if isinstance(ex, OSError) and ex.errno :
+            msg = '[Errno %s] %s' % (ex.errno, os.strerror(ex.errno).split(' (')[0])
+        lines.append('%s: %s' % (type(ex).__name__, msg))
+        return '\n'.join(lines) + '\n'
+
+    # ---------------------------------------------------------------------------
+
+    def _resetGlobals(self) :
+        self._modules = _fakeModules(self)
+        bltns = dict(builtins.__dict__)
+        bltns['print']      = self._print
+        bltns['open']       = self._open
+        bltns['__import__'] = self._import
+        bltns['help']       = self._help
+        bltns['compile']    = self._compile
+        self._globals = { '__name__'     : '__main__',
+                          '__builtins__' : bltns }
+
+    # ---------------------------------------------------------------------------
+
+    def _compile(self, source, filename, mode, *args, **kwargs) :
+        if mode == 'single' and isinstance(source, str) :
+            source += '\n'
+        return compile(source, filename, mode, *args, **kwargs)
+
+    # ---------------------------------------------------------------------------
+
+    def _print(self, *args, sep=' ', end='\n', file=None) :
+        self._txText(sep.join(str(a) for a in args) + end)
+
+    # ---------------------------------------------------------------------------
+
+    def _help(self, obj=None) :
+        if obj == 'modules' :
+            names = sorted(self._modules.Names())
+            for i in range(0, len(names), 4) :
+                self._txText(''.join(n.ljust(20) for n in names[i:i+4]).rstrip() + '\n')
+            self._txText('Plus any modules on the filesystem\n')
+
+    # ---------------------------------------------------------------------------
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0) :
+        mod = self._modules.Get(name)
+        if mod is None :
+            mod = self._importFromFS(name)
+        if mod is None :
+            raise ImportError("no module named '%s'" % name)
+        return mod
+
+    # ---------------------------------------------------------------------------
+
+    def _importFromFS(self, name) :
+        sysMods = self._modules.Get('sys').modules
+        if name in sysMods :
+            return sysMods[name]
+        for d in self._modules.Get('sys').path :
+            try :
+                with self._open('%s/%s.py' % (d or '.', name), 'r') as f :
+                    src = f.read()
+            except (OSError, ValueError) :
+                continue
+            mod = types.ModuleType(name)
+            mod.__dict__['__builtins__'] = self._globals['__builtins__']
+            sysMods[name] = mod
+            try :
+                exec(compile(src, name + '.py', 'exec'), mod.__dict__)
+            except :
+                del sysMods[name]
+                raise
+            return mod
+        return None
+
+    # ---------------------------------------------------------------------------
+
+    def HostPath(self, path) :
+        if not self._rootPath :
+            raise OSError(19, 'ENODEV')
+        parts = self._modules.AbsPath(path).split('/')
+        return self._rootPath.joinpath(*[ p for p in parts if p ])
+
+    # ---------------------------------------------------------------------------
+
+    def _open(self, path, mode='r', *args, **kwargs) :
+        vfs, vfsPath = self._modules.GetVfs(path)
+        if vfs :
+            return vfs.open(vfsPath, mode)
+        try :
+            return open(self.HostPath(path), mode, *args, **kwargs)
+        except FileNotFoundError :
+            raise OSError(2, 'ENOENT')
+        except IsADirectoryError :
+            raise OSError(21, 'EISDIR')
+
+# ===============================================================================
+
+class _fakeStream :
+
+    def __init__(self, device, stdin=False) :
+        self._device = device
+        self.buffer  = _fakeStreamBuffer(device)
+
+    def write(self, s) :
+        self._device._txText(s)
+        return len(s)
+
+    def read(self, n=1) :
+        return self.buffer.read(n).decode()
+
+    def readline(self) :
+        b = b''
+        while not b.endswith(b'\n') :
+            b += self.buffer.read(1)
+        return b.decode()
+
+# ===============================================================================
+
+class _fakeStreamBuffer :
+
+    def __init__(self, device) :
+        self._device = device
+
+    def write(self, b) :
+        self._device._tx(bytes(b))
+        return len(b)
+
+    def read(self, n=1) :
+        return bytes(self._device._rxChr() for _ in range(n))
+
+    def readinto(self, buf, n=None) :
+        n = len(buf) if n is None else n
+        for i in range(n) :
+            buf[i] = self._device._rxChr()
+        return n
+
+# ===============================================================================
+
+class _fakeModules :
+
+    def __init__(self, device) :
+        self._device = device
+        self._mods   = { }
+        self.cwd     = '/'
+        self.mounts  = { }
+        self._build()
+
+    def AbsPath(self, path) :
+        path = str(path)
+        if not path.startswith('/') :
+            path = self.cwd.rstrip('/') + '/' + path
+        parts = [ ]
+        for p in path.split('/') :
+            if p == '..' :
+                if parts :
+                    parts.pop()
+            elif p and p != '.' :
+                parts.append(p)
+        return '/' + '/'.join(parts)
+
+    def GetVfs(self, path) :
+        # Returns the mounted VFS holding path with the path inside it, or None and the absolute path,
+        path = self.AbsPath(path)
+        for mountPoint, vfs in self.mounts.items() :
+            if path == mountPoint or path.startswith(mountPoint + '/') :
+                return vfs, (path[len(mountPoint):] or '/')
+        return None, path
+
+    def Names(self) :
+        return list(self._mods.keys())
+
+    def Get(self, name) :
+        mod = self._mods.get(name)
+        if mod is None and name in _fakeModules._HOST_MODULES :
+            __import__(name)
+            mod = sys.modules[name]
+        return mod
+
+    _HOST_MODULES = ( 'struct', 'binascii', 'hashlib', 'json', 'zlib', 'math',
+                      'random', 'io', 'collections', 're', 'errno' )
+
+    def _mod(self, name, *aliases, **attrs) :
+        m = types.ModuleType(name)
+        for k, v in attrs.items() :
+            setattr(m, k, v)
+        self._mods[name] = m
+        for a in aliases :
+            self._mods[a] = m
+        return m
+
+    def _build(self) :
+        dev = self._device
+
+        def uname() :
+            return ( 'esp32', 'esp32', FakeDevice.RELEASE,
+                     FakeDevice.VERSION, FakeDevice.MACHINE )
+
+        def unameObj() :
+            return _fakeUname(uname())
+
+        def getcwd() :
+            return self.cwd
+
+        def chdir(path) :
+            vfs, vfsPath = self.GetVfs(path)
+            if vfs :
+                vfs.chdir(vfsPath)
+            elif not dev.HostPath(path).is_dir() :
+                raise OSError(2, 'ENOENT')
+            self.cwd = self.AbsPath(path)
+
+        def _wrap(func) :
+            def f(*args) :
+                try :
+                    return func(*args)
+                except FileNotFoundError :
+                    raise OSError(2, 'ENOENT')
+                except FileExistsError :
+                    raise OSError(17, 'EEXIST')
+                except NotADirectoryError :
+                    raise OSError(20, 'ENOTDIR')
+                except OSError as ex :
+                    if ex.errno is None :
+                        # Raised by a mounted VFS,
+                        raise
+                    raise OSError(ex.errno, 'E')
+            return f
+
+        def ilistdir(path='') :
+            vfs, vfsPath = self.GetVfs(path or self.cwd)
+            if vfs :
+                yield from vfs.ilistdir(vfsPath)
+                return
+            hp = dev.HostPath(path or self.cwd)
+            for e in sorted(os.scandir(hp), key=lambda e: e.name) :
+                if e.is_dir() :
+                    yield (e.name, 0x4000, 0, 0)
+                else :
+                    yield (e.name, 0x8000, 0, e.stat().st_size)
+
+        def listdir(path='') :
+            return [ e[0] for e in ilistdir(path) ]
+
+        def stat(path) :
+            vfs, vfsPath = self.GetVfs(path)
+            if vfs :
+                return vfs.stat(vfsPath)
+            st = os.stat(dev.HostPath(path))
+            mode = 0x4000 if os.path.isdir(dev.HostPath(path)) else 0x8000
+            return (mode, 0, 0, 0, 0, 0, st.st_size, int(st.st_atime), int(st.st_mtime), int(st.st_ctime))
+
+        def statvfs(path) :
+            vfs, vfsPath = self.GetVfs(path)
+            if vfs :
+                return vfs.statvfs(vfsPath)
+            return (4096, 4096, 512, 400, 400, 0, 0, 0, 0, 255)
+
+        def mkdir(path) :
+            vfs, vfsPath = self.GetVfs(path)
+            if vfs :
+                return vfs.mkdir(vfsPath)
+            os.mkdir(dev.HostPath(path))
+
+        def rmdir(path) :
+            vfs, vfsPath = self.GetVfs(path)
+            if vfs :
+                return vfs.rmdir(vfsPath)
+            os.rmdir(dev.HostPath(path))
+
+        def remove(path) :
+            vfs, vfsPath = self.GetVfs(path)
+            if vfs :
+                return vfs.remove(vfsPath)
+            if dev.HostPath(path).is_dir() :
+                raise OSError(21, 'EISDIR')
+            os.remove(dev.HostPath(path))
+
+        def rename(src, dst) :
+            vfs, vfsPath = self.GetVfs(src)
+            if vfs :
+                return vfs.rename(vfsPath, self.GetVfs(dst)[1])
+            os.rename(dev.HostPath(src), dev.HostPath(dst))
+
+        def mount(vfs, mountPoint, readonly=False) :
+            mountPoint = self.AbsPath(mountPoint)
+            if mountPoint in self.mounts or mountPoint == '/' :
+                raise OSError(1, 'EPERM')
+            vfs.mount(readonly, False)
+            self.mounts[mountPoint] = vfs
+
+        def umount(mountPoint) :
+            vfs = self.mounts.pop(self.AbsPath(mountPoint), None)
+            if vfs is None :
+                raise OSError(22, 'EINVAL')
+            vfs.umount()
+
+        class VfsFat :
+            @staticmethod
+            def mkfs(dev) :
+                raise OSError(19, 'ENODEV')
+
+        self._mod( 'os', 'uos',
+                   uname    = unameObj,
+                   getcwd   = getcwd,
+                   chdir    = _wrap(chdir),
+                   ilistdir = _wrap(lambda path='' : iter(list(ilistdir(path)))),
+                   listdir  = _wrap(listdir),
+                   stat     = _wrap(stat),
+                   statvfs  = statvfs,
+                   mkdir    = _wrap(mkdir),
+                   rmdir    = _wrap(rmdir),
+                   remove   = _wrap(remove),
+                   rename   = _wrap(rename),
+                   mount    = mount,
+                   umount   = umount,
+                   VfsFat   = VfsFat,
+                   sep      = '/' )
+
+        self._mod( 'sys', 'usys',
+                   stdout         = _fakeStream(dev),
+                   stdin          = _fakeStream(dev),
+                   stderr         = _fakeStream(dev),
+                   platform       = 'esp32',
+                   implementation = types.SimpleNamespace( name    = 'micropython',
+                                                           version = (1, 20, 0),
+                                                           mpy     = FakeDevice.MPY_VERSION | (10 << 10) ),
+                   version        = '3.4.0; MicroPython %s' % FakeDevice.VERSION,
+                   modules        = { },
+                   path           = [ '', '/lib' ],
+                   exit           = sys.exit )
+
+        class _builtins :
+            # Module view of the REPL builtins, these are renewed with the globals on reset,
+            def __getattr__(self, name) :
+                try :
+                    return dev._globals['__builtins__'][name]
+                except KeyError :
+                    raise AttributeError(name)
+            def __setattr__(self, name, value) :
+                dev._globals['__builtins__'][name] = value
+            def __delattr__(self, name) :
+                try :
+                    del dev._globals['__builtins__'][name]
+                except KeyError :
+                    raise AttributeError(name)
+        self._mods['builtins'] = _builtins()
+
+        t0 = time()
+        def ticks_ms() :
+            return int((time() - t0) * 1000) & 0x3FFFFFFF
+        def fakeSleep(sec) :
+            end = time() + sec
+            while time() < end :
+                sleep(min(0.010, max(0, end - time())))
+        self._mod( 'time', 'utime',
+                   time       = lambda : int(time()),
+                   ticks_ms   = ticks_ms,
+                   ticks_us   = lambda : int((time() - t0) * 1000000) & 0x3FFFFFFF,
+                   ticks_diff = lambda a, b : a - b,
+                   ticks_add  = lambda a, b : a + b,
+                   sleep      = fakeSleep,
+                   sleep_ms   = lambda ms : fakeSleep(ms / 1000),
+                   sleep_us   = lambda us : fakeSleep(us / 1000000),
+                   localtime  = lambda *a : __import__('time').localtime(*a)[:8],
+                   gmtime     = lambda *a : __import__('time').gmtime(*a)[:8],
+                   mktime     = lambda t : int(__import__('time').mktime(tuple(t) + (0,)*(9-len(t)))) )
+
+        self._mod( 'gc',
+                   collect   = lambda : None,
+                   mem_alloc = lambda : 32000,
+                   mem_free  = lambda : 100000,
+                   enable    = lambda : None,
+                   disable   = lambda : None )
+
+        class _poll :
+            def register(self, obj, mask=1) :
+                pass
+            def poll(self, timeoutMS=-1) :
+                end = time() + (timeoutMS / 1000 if timeoutMS >= 0 else 1e9)
+                while dev._rxQueue.empty() :
+                    if time() >= end :
+                        return [ ]
+                    sleep(0.001)
+                return [ (None, 1) ]
+        self._mod( 'select', 'uselect',
+                   poll   = _poll,
+                   POLLIN = 1 )
+
+        class DeflateIO :
+            def __init__(self, stream, fmt=0, wbits=0, close=False) :
+                if fmt != 1 or not 5 <= wbits <= 15 :
+                    raise ValueError()
+                self._s, self._w = stream, wbits
+                self._d, self._c = None, None
+                self._buf, self._eof = b'', False
+            def readinto(self, b) :
+                if self._d is None :
+                    self._d = zlib.decompressobj(-self._w)
+                while not self._buf and not self._eof :
+                    raw = bytearray(256)
+                    n   = self._s.readinto(raw)
+                    if not n :
+                        self._buf, self._eof = self._d.flush(), True
+                    else :
+                        self._buf = self._d.decompress(bytes(raw[:n]))
+                        self._eof = self._d.eof
+                n = min(len(b), len(self._buf))
+                b[:n] = self._buf[:n]
+                self._buf = self._buf[n:]
+                return n
+            def read(self, n=-1) :
+                b = bytearray(n if n > 0 else 65536)
+                return bytes(b[:self.readinto(b)])
+            def write(self, d) :
+                if self._c is None :
+                    self._c = zlib.compressobj(9, zlib.DEFLATED, -self._w)
+                self._s.write(self._c.compress(bytes(d)))
+                return len(d)
+            def close(self) :
+                if self._c is not None :
+                    self._s.write(self._c.flush())
+                    self._c = None
+        if not dev.NO_DEFLATE :
+            self._mod( 'deflate',
+                       DeflateIO = DeflateIO,
+                       AUTO = 0, RAW = 1, ZLIB = 2, GZIP = 3 )
+
+        self._mod( 'micropython',
+                   const       = lambda x : x,
+                   opt_level   = lambda *a : 0,
+                   kbd_intr    = lambda c : setattr(dev, '_kbdIntr', c),
+                   mem_info    = lambda *a : None )
+
+        def softReset() :
+            raise _fakeSoftReset()
+        def hardReset() :
+            raise _fakeHardReset()
+        class Pin :
+            IN, OUT = 1, 3
+            def __init__(self, num, *args, **kwargs) :
+                if num not in range(0, 40) or num in (20, 24, 28, 29, 30, 31) :
+                    raise ValueError('invalid pin')
+                self._num = num
+            def value(self, v=None) :
+                return 0 if v is None else None
+        class SDCard :
+            def __init__(self, *args, **kwargs) :
+                raise OSError(16, 'ESP_ERR_TIMEOUT')
+        class UART :
+            def __init__(self, num, baudrate=None, **kwargs) :
+                if num == 0 and (dev.UART0_DISABLED or baudrate is None) :
+                    raise ValueError('UART(0) is disabled (dedicated to REPL)')
+                if num == 0 :
+                    dev.SetUARTBaudrate(baudrate)
+        class _mem32 :
+            def __getitem__(self, addr) :
+                return 0
+            def __setitem__(self, addr, v) :
+                if addr == 0x3FF40014 :
+                    d = ((v & 0xFFFFF) << 4) | ((v >> 20) & 0xF)
+                    rate = (80000000 << 4) / d
+                    dev.SetUARTBaudrate(min(FakeDevice._TERMIOS_BAUDS.values(), key=lambda b : abs(b - rate)))
+        self._mod( 'machine', 'umachine',
+                   unique_id  = lambda : b'\x24\x0a\xc4\x12\x34\x56',
+                   freq       = lambda f=None : 160000000 if f is None else None,
+                   reset      = hardReset,
+                   soft_reset = softReset,
+                   Pin        = Pin,
+                   SDCard     = SDCard,
+                   UART       = UART,
+                   mem32      = _mem32() )
+
+        nvs = dev._nvs
+        class NVS :
+            def __init__(self, ns) :
+                self._d = nvs.setdefault(ns, { })
+            def set_i32(self, k, v) :
+                self._d[k] = int(v)
+            def set_blob(self, k, v) :
+                self._d[k] = bytes(v.encode() if isinstance(v, str) else v)
+            def get_i32(self, k) :
+                v = self._d.get(k)
+                if not isinstance(v, int) :
+                    raise OSError(-4354, 'ESP_ERR_NVS_NOT_FOUND')
+                return v
+            def get_blob(self, k, buf) :
+                v = self._d.get(k)
+                if not isinstance(v, bytes) :
+                    raise OSError(-4354, 'ESP_ERR_NVS_NOT_FOUND')
+                buf[:len(v)] = v
+                return len(v)
+            def erase_key(self, k) :
+                if k not in self._d :
+                    raise OSError(-4354, 'ESP_ERR_NVS_NOT_FOUND')
+                del self._d[k]
+            def commit(self) :
+                pass
+        class _partition :
+            def __init__(self, *info) :
+                self._info = info
+            def info(self) :
+                return self._info
+        class Partition :
+            TYPE_APP, TYPE_DATA = 0, 1
+            @staticmethod
+            def find(t) :
+                if t == 0 :
+                    return [ _partition(0, 0, 0x10000, 0x1F0000, 'factory', False) ]
+                return [ _partition(1, 2, 0x9000, 0x6000, 'nvs', False),
+                         _partition(1, 1, 0xF000, 0x1000, 'phy_init', False),
+                         _partition(1, 129, 0x200000, 0x200000, 'vfs', False) ]
+        self._mod( 'esp32',
+                   NVS             = NVS,
+                   Partition       = Partition,
+                   raw_temperature = lambda : 120 )
+
+        self._mod( 'esp',
+                   flash_size = lambda : 4 * 1024 * 1024 )
+
+        class WLAN :
+            _state = { }
+            def __init__(self, iface=0) :
+                self._s = WLAN._state.setdefault(iface, dict(active=False))
+                self._iface = iface
+            def active(self, a=None) :
+                if a is None :
+                    return self._s['active']
+                self._s['active'] = bool(a)
+                return self._s['active']
+            def config(self, *args, **kwargs) :
+                if args :
+                    if args[0] == 'mac' :
+                        return bytes([0x24, 0x0a, 0xc4, 0x12, 0x34, 0x56 + self._iface])
+                    if args[0] in ('ssid', 'essid') :
+                        return 'ESP_123456' if self._iface else ''
+                    raise ValueError('unknown config param')
+            def ifconfig(self) :
+                return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+            def isconnected(self) :
+                return False
+            def status(self, p=None) :
+                if p == 'stations' :
+                    return [ ]
+                if p == 'rssi' :
+                    raise OSError(-1, 'not connected')
+                return 1000
+            def scan(self) :
+                return [ (b'FakeNet', b'\x00\x11\x22\x33\x44\x55', 6, -60, 3, False) ]
+            def connect(self, *args) :
+                pass
+        self._mod( 'network',
+                   WLAN            = WLAN,
+                   STA_IF          = 0,
+                   AP_IF           = 1,
+                   STAT_CONNECTING = 1001 )
+
+        self._mod( 'ubinascii', **{ k : getattr(__import__('binascii'), k)
+                                     for k in ('hexlify', 'unhexlify', 'a2b_base64', 'b2a_base64', 'crc32') } )
+        self._mod( 'uhashlib',  sha256 = __import__('hashlib').sha256 )
+        self._mod( 'ujson',     dumps  = __import__('json').dumps,
+                                loads  = __import__('json').loads )
+        self._mod( 'ustruct',   pack   = __import__('struct').pack,
+                                unpack = __import__('struct').unpack,
+                                calcsize = __import__('struct').calcsize )
+        self._mod( 'uplatform', platform = lambda : 'MicroPython-1.20.0-xtensa-IDFv4.4.4-with-newlib3.3.0' )
+
+# ===============================================================================
+
+class _fakeUname(tuple) :
+
+    @property
+    def sysname(self)  : return self[0]
+    @property
+    def nodename(self) : return self[1]
+    @property
+    def release(self)  : return self[2]
+    @property
+    def version(self)  : return self[3]
+    @property
+    def machine(self)  : return self[4]
+
+# ===============================================================================
+
+FakeDevice._savedDispHook = sys.displayhook
+sys.displayhook           = FakeDevice._displayHook
+
+# ===============================================================================
@@ -0,0 +1,562 @@
+# -*- coding: utf-8 -*-
+
+# ============================================= #
+#                                               #
+# Copyright © 2023 JC`zic (Jean-Christophe Bos) #
+#             jczic.bos@gmail.com               #
+#                                               #
+# ============================================= #
+
+# Runs on the MicroPython unix port, started by unixPortDevice.py:
+#   micropython unixPortBoot.py <flash root path>
+# The unix port has no raw REPL, this script serves the friendly and raw REPL
+# on stdin/stdout like a board, mounts the flash root path on "/" and stubs
+# the ESP32 only modules (esp, esp32, machine, network, bluetooth).
+# States are reported to the host on the control fd (JAMA_CTRL_FD):
+#   E/e  : user code starts/ends,  K/k : CTRL-C interrupt enabled/disabled,
+#   N... : NVS content (JSON) to keep across hard resets.
+
+import sys
+import os
+import io
+import gc
+import json
+import builtins
+import micropython
+from   collections import namedtuple
+
+HARD_RESET_EXIT_CODE = 42
+MACHINE              = 'ESP32 module (unix port) with ESP32'
+BANNER               = 'MicroPython %s; %s\r\nType "help()" for more information.\r\n'
+RAW_BANNER           = b'raw REPL; CTRL-B to exit\r\n'
+RAW_PASTE_WINDOW     = 128
+
+_rootPath = (sys.argv[1] if len(sys.argv) > 1 else '.')
+_ctrl     = open('/dev/fd/%s' % os.getenv('JAMA_CTRL_FD'), 'wb')
+_nvs      = json.loads(os.getenv('JAMA_NVS') or '{}')
+_stdin    = sys.stdin.buffer
+_stdout   = sys.stdout.buffer
+_print    = builtins.print
+_mounts   = [ ]
+_g        = { }
+_state    = dict(hardReset=False, freq=160000000)
+
+# ============================================================================
+# ===( Host link )============================================================
+# ============================================================================
+
+def _ctrlSend(msg) :
+    _ctrl.write(msg + b'\n')
+
+def _rx() :
+    b = _stdin.read(1)
+    if not b :
+        # Host bridge closed,
+        sys.exit(0)
+    return b[0]
+
+def _tx(data) :
+    if isinstance(data, str) :
+        data = data.encode()
+    _stdout.write(data)
+
+def _txText(text) :
+    _tx(text.replace('\r\n', '\n').replace('\n', '\r\n'))
+
+def _devicePrint(*args, sep=' ', end='\n', file=None) :
+    # Boards output "\r\n" for text, the unix port only "\n",
+    if file is not None :
+        return _print(*args, sep=sep, end=end, file=file)
+    _txText(sep.join([ str(x) for x in args ]) + end)
+
+def _kbdIntr(c) :
+    # CTRL-C is turned into SIGINT by the host bridge, the unix port SIGINT handler must stay,
+    _ctrlSend(b'K' if c == 3 else b'k')
+
+# ============================================================================
+# ===( Module stubs )=========================================================
+# ============================================================================
+
+def _stubModule(names, attrs) :
+    # Attributes are given as a dict, the real os module has a "name" attribute,
+    mod = type(names[0], (), { })
+    for k in attrs :
+        setattr(mod, k, attrs[k])
+    for n in names :
+        sys.modules[n] = mod
+    return mod
+
+def _installStubs() :
+
+    # --- os ---
+    unameResult = namedtuple('uname_result', ('sysname', 'nodename', 'release', 'version', 'machine'))
+    osAttrs     = { }
+    for k in dir(os) :
+        if not k.startswith('__') :
+            osAttrs[k] = getattr(os, k)
+    try :
+        import vfs
+        mount, umount = vfs.mount, vfs.umount
+    except ImportError :
+        mount, umount = os.mount, os.umount
+    def osMount(obj, mountPoint, readonly=False) :
+        mount(obj, mountPoint, readonly=readonly)
+        _mounts.append(mountPoint)
+    def osUmount(mountPoint) :
+        umount(mountPoint)
+        if mountPoint in _mounts :
+            _mounts.remove(mountPoint)
+    v = sys.implementation.version
+    osAttrs.update( uname  = lambda : unameResult( 'esp32', 'esp32',
+                                                   '%s.%s.%s' % v[:3],
+                                                   'v%s.%s.%s on unix port' % v[:3],
+                                                   MACHINE ),
+                    mount  = osMount,
+                    umount = osUmount )
+    _stubModule(('os', 'uos'), osAttrs)
+
+    # --- micropython ---
+    mpAttrs = { }
+    for k in dir(micropython) :
+        if not k.startswith('__') :
+            mpAttrs[k] = getattr(micropython, k)
+    mpAttrs['kbd_intr'] = _kbdIntr
+    _stubModule(('micropython', ), mpAttrs)
+
+    # --- machine ---
+    pinValues = { }
+    class Pin :
+        IN, OUT, OPEN_DRAIN             = 1, 3, 7
+        PULL_UP, PULL_DOWN              = 2, 1
+        IRQ_RISING, IRQ_FALLING         = 1, 2
+        def __init__(self, num, mode=-1, pull=-1, value=None, **kwargs) :
+            if num not in range(40) or num in (20, 24, 28, 29, 30, 31) :
+                raise ValueError('invalid pin')
+            self._num = num
+            if value is not None :
+                pinValues[num] = (1 if value else 0)
+        def init(self, *args, **kwargs) :
+            pass
+        def value(self, v=None) :
+            if v is None :
+                return pinValues.get(self._num, 0)
+            pinValues[self._num] = (1 if v else 0)
+        def on(self) :
+            self.value(1)
+        def off(self) :
+            self.value(0)
+        def irq(self, *args, **kwargs) :
+            pass
+        def __call__(self, v=None) :
+            return self.value(v)
+    class ADC :
+        ATTN_0DB, ATTN_2_5DB, ATTN_6DB, ATTN_11DB = 0, 1, 2, 3
+        WIDTH_9BIT, WIDTH_10BIT, WIDTH_11BIT, WIDTH_12BIT = 0, 1, 2, 3
+        def __init__(self, pin, **kwargs) :
+            self._pin = pin
+        def atten(self, a) :
+            pass
+        def width(self, w) :
+            pass
+        def read(self) :
+            return 2048
+        def read_u16(self) :
+            return 32768
+        def read_uv(self) :
+            return 1650000
+    class DAC :
+        def __init__(self, pin, **kwargs) :
+            pass
+        def write(self, v) :
+            pass
+    class PWM :
+        def __init__(self, pin, freq=5000, duty=512, **kwargs) :
+            self._freq, self._duty = freq, duty
+        def freq(self, f=None) :
+            if f is None :
+                return self._freq
+            self._freq = f
+        def duty(self, d=None) :
+            if d is None :
+                return self._duty
+            self._duty = d
+        def duty_u16(self, d=None) :
+            if d is None :
+                return self._duty * 64
+            self._duty = d // 64
+        def deinit(self) :
+            pass
+    class I2C :
+        def __init__(self, *args, **kwargs) :
+            pass
+        def scan(self) :
+            return [ ]
+    class SPI :
+        def __init__(self, *args, **kwargs) :
+            pass
+        def init(self, *args, **kwargs) :
+            pass
+        def write(self, buf) :
+            pass
+        def read(self, n, write=0) :
+            return bytes(n)
+        def deinit(self) :
+            pass
+    class UART :
+        def __init__(self, num, baudrate=115200, **kwargs) :
+            if num == 0 :
+                raise ValueError('UART(0) is disabled (dedicated to REPL)')
+            self._buf = b''
+        def init(self, *args, **kwargs) :
+            pass
+        def write(self, buf) :
+            # Loopback, as if TX and RX were wired,
+            self._buf += bytes(buf)
+            return len(buf)
+        def any(self) :
+            return len(self._buf)
+        def read(self, n=-1) :
+            if not self._buf :
+                return None
+            n = (len(self._buf) if n < 0 else n)
+            b, self._buf = self._buf[:n], self._buf[n:]
+            return b
+        def deinit(self) :
+            pass
+    class SDCard :
+        def __init__(self, *args, **kwargs) :
+            raise OSError(19)
+    class Mem32 :
+        def __getitem__(self, addr) :
+            return 0
+        def __setitem__(self, addr, value) :
+            pass
+    def freq(f=None) :
+        if f is None :
+            return _state['freq']
+        _state['freq'] = f
+    def reset() :
+        _state['hardReset'] = True
+        raise SystemExit()
+    def softReset() :
+        raise SystemExit()
+    _stubModule( ('machine', 'umachine'), dict(
+                 unique_id    = lambda : b'\x24\x0a\xc4\x00\x00\x01',
+                 freq         = freq,
+                 reset        = reset,
+                 soft_reset   = softReset,
+                 reset_cause  = lambda : 4,
+                 idle         = lambda : None,
+                 Pin          = Pin,
+                 ADC          = ADC,
+                 DAC          = DAC,
+                 PWM          = PWM,
+                 I2C          = I2C,
+                 SoftI2C      = I2C,
+                 SPI          = SPI,
+                 SoftSPI      = SPI,
+                 UART         = UART,
+                 SDCard       = SDCard,
+                 mem32        = Mem32() ) )
+
+    # --- esp / esp32 ---
+    class NVS :
+        def __init__(self, namespace) :
+            self._d = _nvs.setdefault(namespace, { })
+        def set_i32(self, key, value) :
+            self._d[key] = int(value)
+        def set_blob(self, key, value) :
+            if isinstance(value, str) :
+                value = value.encode()
+            self._d[key] = [ bytes(value).hex() ]
+        def get_i32(self, key) :
+            v = self._d.get(key)
+            if not isinstance(v, int) :
+                raise OSError(-4354, 'ESP_ERR_NVS_NOT_FOUND')
+            return v
+        def get_blob(self, key, buf) :
+            v = self._d.get(key)
+            if not isinstance(v, list) :
+                raise OSError(-4354, 'ESP_ERR_NVS_NOT_FOUND')
+            v = bytes.fromhex(v[0])
+            buf[:len(v)] = v
+            return len(v)
+        def erase_key(self, key) :
+            if key not in self._d :
+                raise OSError(-4354, 'ESP_ERR_NVS_NOT_FOUND')
+            del self._d[key]
+        def commit(self) :
+            _ctrlSend(b'N' + json.dumps(_nvs).encode())
+    class PartitionInfo :
+        def __init__(self, *info) :
+            self._info = info
+        def info(self) :
+            return self._info
+    class Partition :
+        TYPE_APP, TYPE_DATA = 0, 1
+        @staticmethod
+        def find(type=TYPE_APP, subtype=0xFF, label=None) :
+            if type == 0 :
+                return [ PartitionInfo(0, 0, 0x10000, 0x1F0000, 'factory', False) ]
+            return [ PartitionInfo(1, 2, 0x9000, 0x6000, 'nvs', False),
+                     PartitionInfo(1, 1, 0xF000, 0x1000, 'phy_init', False),
+                     PartitionInfo(1, 129, 0x200000, 0x200000, 'vfs', False) ]
+    _stubModule( ('esp32', ), dict(
+                 NVS             = NVS,
+                 Partition       = Partition,
+                 raw_temperature = lambda : 120,
+                 mcu_temperature = lambda : 49,
+                 hall_sensor     = lambda : 0 ) )
+    _stubModule( ('esp', ), dict(
+                 flash_size = lambda : 4*1024*1024,
+                 osdebug    = lambda *args : None ) )
+
+    # --- network ---
+    wlanStates = { }
+    class WLAN :
+        def __init__(self, iface=0) :
+            self._iface = iface
+            self._s     = wlanStates.setdefault(iface, dict(active=False))
+        def active(self, a=None) :
+            if a is not None :
+                self._s['active'] = bool(a)
+            return self._s['active']
+        def config(self, *args, **kwargs) :
+            if args :
+                if args[0] == 'mac' :
+                    return bytes([ 0x24, 0x0a, 0xc4, 0x00, 0x00, 0x01 + self._iface ])
+                if args[0] in ('ssid', 'essid') :
+                    return ('ESP_000001' if self._iface else '')
+                raise ValueError('unknown config param')
+        def ifconfig(self, *args) :
+            return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+        def isconnected(self) :
+            return False
+        def status(self, param=None) :
+            if param == 'stations' :
+                return [ ]
+            if param == 'rssi' :
+                raise OSError(-1, 'not connected')
+            return 1000
+        def scan(self) :
+            return [ (b'UnixPortNet', b'\x00\x11\x22\x33\x44\x55', 6, -60, 3, False) ]
+        def connect(self, *args, **kwargs) :
+            pass
+        def disconnect(self) :
+            pass
+    def LAN(*args, **kwargs) :
+        raise ValueError('no Ethernet PHY')
+    _stubModule( ('network', ), dict(
+                 WLAN            = WLAN,
+                 LAN             = LAN,
+                 STA_IF          = 0,
+                 AP_IF           = 1,
+                 STAT_IDLE       = 1000,
+                 STAT_CONNECTING = 1001,
+                 STAT_GOT_IP     = 1010 ) )
+
+    # --- bluetooth ---
+    bleState = dict(active=False)
+    class BLE :
+        def active(self, a=None) :
+            if a is not None :
+                bleState['active'] = bool(a)
+            return bleState['active']
+        def config(self, *args, **kwargs) :
+            if args and args[0] == 'mac' :
+                return (0, bytes([ 0x24, 0x0a, 0xc4, 0x00, 0x00, 0x03 ]))
+        def irq(self, handler) :
+            pass
+        def gap_scan(self, *args, **kwargs) :
+            pass
+        def gap_advertise(self, *args, **kwargs) :
+            pass
+    _stubModule(('bluetooth', 'ubluetooth'), dict(BLE = BLE))
+
+# ============================================================================
+# ===( REPL )=================================================================
+# ============================================================================
+
+class _SoftReset(Exception) :
+    pass
+
+def _boot() :
+    global _g
+    for mountPoint in list(_mounts) :
+        try :
+            sys.modules['os'].umount(mountPoint)
+        except OSError :
+            pass
+    for name in list(sys.modules) :
+        if name not in _bootModules :
+            del sys.modules[name]
+    _g = { '__name__' : '__main__' }
+    os.chdir('/')
+    gc.collect()
+
+def _softReboot() :
+    _tx(b'MPY: soft reboot\r\n')
+    _boot()
+
+def _formatException(ex) :
+    s = io.StringIO()
+    sys.print_exception(ex, s)
+    return s.getvalue()
+
+def _execute(source, mode, printEOF) :
+    # Returns False if the code has requested a soft reset,
+    err   = None
+    reset = False
+    try :
+        code = compile(source, '<stdin>', mode)
+        # Like on boards, CTRL-C is enabled again for each execution,
+        _ctrlSend(b'K')
+        _ctrlSend(b'E')
+        try :
+            exec(code, _g)
+        finally :
+            _ctrlSend(b'e')
+    except SystemExit :
+        reset = True
+    except BaseException as ex :
+        err = _formatException(ex)
+    if printEOF :
+        _tx(b'\x04')
+        if err :
+            _txText(err)
+        _tx(b'\x04')
+    elif err :
+        _txText(err)
+    if reset :
+        if _state['hardReset'] :
+            sys.exit(HARD_RESET_EXIT_CODE)
+        raise _SoftReset()
+
+def _rawPasteREPL(cmd) :
+    if cmd != ord('A') :
+        _tx(b'R\x00')
+        return
+    _tx(b'R\x01' + RAW_PASTE_WINDOW.to_bytes(2, 'little') + b'\x01')
+    data     = bytearray()
+    consumed = 0
+    while True :
+        c = _rx()
+        if c == 0x04 :
+            break
+        data.append(c)
+        consumed += 1
+        if consumed == RAW_PASTE_WINDOW :
+            consumed = 0
+            _tx(b'\x01')
+    _tx(b'\x04')
+    _execute(bytes(data), 'exec', printEOF=True)
+
+def _rawREPL() :
+    # Returns when CTRL-B goes back to the friendly REPL,
+    _tx(RAW_BANNER)
+    while True :
+        _tx(b'>')
+        line = bytearray()
+        while True :
+            c = _rx()
+            if c == 0x01 :
+                if len(line) == 2 and line[0] == 0x05 :
+                    try :
+                        _rawPasteREPL(line[1])
+                    except _SoftReset :
+                        _softReboot()
+                    line = None
+                    break
+                _tx(RAW_BANNER)
+                line = bytearray()
+                _tx(b'>')
+            elif c == 0x02 :
+                _tx(b'\r\n' + _banner())
+                return
+            elif c == 0x03 :
+                line = bytearray()
+            elif c == 0x04 :
+                break
+            else :
+                line.append(c)
+        if line is None :
+            # Like the firmware, raw-paste mode ends with a raw REPL reset,
+            _tx(RAW_BANNER)
+            continue
+        _tx(b'OK')
+        if not line :
+            _tx(b'\r\n')
+            _softReboot()
+            _tx(RAW_BANNER)
+            continue
+        try :
+            _execute(bytes(line), 'exec', printEOF=True)
+        except _SoftReset :
+            # Like on boards, the raw REPL stays active after a soft reset requested by the code,
+            _softReboot()
+            _tx(RAW_BANNER)
+        except KeyboardInterrupt :
+            # Interrupt received just after the end of the code,
+            pass
+
+def _friendlyREPL() :
+    _tx(_banner() + b'>>> ')
+    line = b''
+    while True :
+        c = _rx()
+        if c == 0x01 :
+            _rawREPL()
+            _tx(b'>>> ')
+            line = b''
+        elif c == 0x02 :
+            _tx(b'\r\n' + _banner() + b'>>> ')
+            line = b''
+        elif c == 0x03 :
+            _tx(b'\r\n>>> ')
+            line = b''
+        elif c == 0x04 :
+            _tx(b'\r\n')
+            raise _SoftReset()
+        elif c == 0x0D :
+            _tx(b'\r\n')
+            if line.strip() :
+                _execute(line + b'\n', 'single', printEOF=False)
+            _tx(b'>>> ')
+            line = b''
+        elif c in (0x08, 0x7F) :
+            if line :
+                line = line[:-1]
+                _tx(b'\x08 \x08')
+        elif c >= 0x20 :
+            line += bytes([ c ])
+            _tx(bytes([ c ]))
+
+def _banner() :
+    v = sys.implementation.version
+    return (BANNER % ('v%s.%s.%s' % v[:3], MACHINE)).encode()
+
+# ============================================================================
+# ===( Boot )=================================================================
+# ============================================================================
+
+try :
+    import vfs as _vfs
+except ImportError :
+    _vfs = os
+_vfs.umount('/')
+_vfs.mount(_vfs.VfsPosix(_rootPath), '/')
+os.chdir('/')
+sys.path.clear()
+sys.path.extend([ '', '.frozen', '/lib' ])
+builtins.print = _devicePrint
+_installStubs()
+_bootModules = list(sys.modules)
+_boot()
+
+while True :
+    try :
+        _friendlyREPL()
+    except _SoftReset :
+        _softReboot()
+    except KeyboardInterrupt :
+        pass
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+# ============================================= #
+#                                               #
+# Copyright © 2023 JC`zic (Jean-Christophe Bos) #
+#             jczic.bos@gmail.com               #
+#                                               #
+# ============================================= #
+
+# MicroPython unix port behind a pty, as a local stand-in for a board,
+# real MicroPython code runs with stubbed ESP32 modules (see unixPortBoot.py):
+#
+#   dev  = UnixPortDevice(rootPath='/tmp/flash')
+#   port = dev.Start()
+#   ctrl = ESP32Controller(port)
+#
+# The bridge forwards the pty to the process stdin/stdout and turns CTRL-C
+# into SIGINT while user code runs with the interrupt enabled. A hard reset
+# (machine.reset) restarts the process like a reboot.
+
+
+from   os.path           import abspath, dirname, join as pathJoin, isdir
+from   shutil            import which
+from   select            import select
+from   signal            import SIGINT
+from   time              import sleep
+from   _thread           import allocate_lock, start_new_thread
+import subprocess
+import json
+import os
+import pty
+import tty
+
+
+# ===============================================================================
+# ===( UnixPortDeviceException )=================================================
+# ===============================================================================
+
+class UnixPortDeviceException(Exception) :
+    pass
+
+# ===============================================================================
+# ===( UnixPortDevice )==========================================================
+# ===============================================================================
+
+class UnixPortDevice :
+
+    MICROPYTHON_FILENAME     = 'micropython'
+    BOOT_FILENAME            = pathJoin(dirname(abspath(__file__)), 'unixPortBoot.py')
+    HARD_RESET_EXIT_CODE     = 42
+    RESET_BANNER             = b'ets Jun  8 2016 00:22:57\r\n\r\n' + \
+                               b'rst:0xc (SW_CPU_RESET),boot:0x13 (SPI_FAST_FLASH_BOOT)\r\n'
+    RESTART_DELAY_SEC        = 0.100
+
+    # ---------------------------------------------------------------------------
+
+    def __init__( self,
+                  rootPath,
+                  micropythonPath = None,
+                  heapSize        = None ) :
+        self._rootPath        = abspath(rootPath)
+        self._micropythonPath = (micropythonPath or which(self.MICROPYTHON_FILENAME))
+        self._heapSize        = heapSize
+        self._running         = False
+        self._proc            = None
+        self._ctrlFD          = None
+        self._ctrlBuf         = b''
+        self._inCode          = False
+        self._kbdIntr         = True
+        self._nvs             = { }
+        self._lockCtrl        = allocate_lock()
+        self._lockProc        = allocate_lock()
+        self._masterFD        = None
+        self._slaveFD         = None
+        self.Restarts         = 0
+        if not self._micropythonPath :
+            raise UnixPortDeviceException('MicroPython unix port binary "%s" not found.' % self.MICROPYTHON_FILENAME)
+        if not isdir(self._rootPath) :
+            raise UnixPortDeviceException('Flash root path "%s" is not a directory.' % self._rootPath)
+
+    # ---------------------------------------------------------------------------
+
+    def Start(self) :
+        if self._running :
+            raise UnixPortDeviceException('Unix port device already started.')
+        self._masterFD, self._slaveFD = pty.openpty()
+        tty.setraw(self._masterFD)
+        tty.setraw(self._slaveFD)
+        self._running = True
+        self._startProcess()
+        start_new_thread(self._threadHostToDevice, ())
+        start_new_thread(self._threadDeviceToHost, ())
+        return self.GetPortName()
+
+    # ---------------------------------------------------------------------------
+
+    def Stop(self) :
+        if self._running :
+            self._running = False
+            self._stopProcess()
+            for fd in (self._masterFD, self._slaveFD) :
+                try :
+                    os.close(fd)
+                except :
+                    pass
+
+    # ---------------------------------------------------------------------------
+
+    def GetPortName(self) :
+        return os.ttyname(self._slaveFD)
+
+    # ---------------------------------------------------------------------------
+
+    def _startProcess(self) :
+        ctrlR, ctrlW = os.pipe()
+        args = [ self._micropythonPath ]
+        if self._heapSize :
+            args += [ '-X', 'heapsize=%s' % self._heapSize ]
+        env  = dict( os.environ,
+                     JAMA_CTRL_FD = str(ctrlW),
+                     JAMA_NVS     = json.dumps(self._nvs) )
+        try :
+            proc = subprocess.Popen( args + [ self.BOOT_FILENAME, self._rootPath ],
+                                     stdin    = subprocess.PIPE,
+                                     stdout   = subprocess.PIPE,
+                                     stderr   = subprocess.STDOUT,
+                                     pass_fds = (ctrlW, ),
+                                     env      = env,
+                                     bufsize  = 0 )
+        except OSError as ex :
+            os.close(ctrlR)
+            raise UnixPortDeviceException('Cannot start "%s" (%s).' % (self._micropythonPath, ex))
+        finally :
+            os.close(ctrlW)
+        os.set_blocking(ctrlR, False)
+        with self._lockCtrl :
+            self._ctrlFD  = ctrlR
+            self._ctrlBuf = b''
+            self._inCode  = False
+            self._kbdIntr = True
+        with self._lockProc :
+            self._proc = proc
+
+    # ---------------------------------------------------------------------------
+
+    def _stopProcess(self) :
+        with self._lockProc :
+            proc, self._proc = self._proc, None
+        if proc :
+            try :
+                proc.kill()
+                proc.wait()
+            except :
+                pass
+        with self._lockCtrl :
+            fd, self._ctrlFD = self._ctrlFD, None
+        if fd is not None :
+            try :
+                os.close(fd)
+            except :
+                pass
+
+    # ---------------------------------------------------------------------------
+
+    def _readCtrl(self) :
+        # Must be called with _lockCtrl, processes all the states already sent by the device,
+        if self._ctrlFD is None :
+            return
+        while True :
+            try :
+                data = os.read(self._ctrlFD, 4096)
+            except BlockingIOError :
+                break
+            except OSError :
+                break
+            if not data :
+                break
+            self._ctrlBuf += data
+        lines = self._ctrlBuf.split(b'\n')
+        self._ctrlBuf = lines.pop()
+        for line in lines :
+            if line == b'E' :
+                self._inCode = True
+            elif line == b'e' :
+                self._inCode = False
+            elif line == b'K' :
+                self._kbdIntr = True
+            elif line == b'k' :
+                self._kbdIntr = False
+            elif line.startswith(b'N') :
+                try :
+                    self._nvs = json.loads(line[1:])
+                except ValueError :
+                    pass
+
+    # ---------------------------------------------------------------------------
+
+    def _threadHostToDevice(self) :
+        while self._running :
+            try :
+                data = os.read(self._masterFD, 4096)
+            except :
+                break
+            if not data :
+                break
+            while data :
+                with self._lockCtrl :
+                    # States written before any device output are always read here first,
+                    self._readCtrl()
+                    interrupt = (self._inCode and self._kbdIntr)
+                idx = (data.find(b'\x03') if interrupt else -1)
+                buf, data = ( (data[:idx], data[idx+1:]) if idx >= 0 else (data, b'') )
+                with self._lockProc :
+                    proc = self._proc
+                if not proc :
+                    continue
+                try :
+                    if buf :
+                        proc.stdin.write(buf)
+                    if idx >= 0 :
+                        proc.send_signal(SIGINT)
+                except :
+                    pass
+        self._running = False
+
+    # ---------------------------------------------------------------------------
+
+    def _threadDeviceToHost(self) :
+        while self._running :
+            with self._lockProc :
+                proc = self._proc
+            if not proc :
+                break
+            try :
+                fds = [ proc.stdout ] + ([ self._ctrlFD ] if self._ctrlFD is not None else [ ])
+                r   = select(fds, [ ], [ ], 0.5)[0]
+            except :
+                r = [ ]
+            if self._ctrlFD in r :
+                with self._lockCtrl :
+                    self._readCtrl()
+            if proc.stdout not in r :
+                continue
+            try :
+                data = proc.stdout.read(4096)
+            except :
+                data = b''
+            if data :
+                with self._lockCtrl :
+                    # Keeps states in order with the output that follows them,
+                    self._readCtrl()
+                try :
+                    os.write(self._masterFD, data)
+                except :
+                    break
+                continue
+            # The process has ended, hard reset (or crash) then reboot,
+            if not self._running :
+                break
+            self._stopProcess()
+            try :
+                os.write(self._masterFD, self.RESET_BANNER)
+            except :
+                break
+            sleep(self.RESTART_DELAY_SEC)
+            self.Restarts += 1
+            try :
+                self._startProcess()
+            except UnixPortDeviceException :
+                break
+        self._running = False
+
+# ===============================================================================
+# ===============================================================================
+# ===============================================================================
@@ -10,6 +10,8 @@
 
 from   microWebSrv     import MicroWebSrv
 from   esp32Controller import *
+from   terminalOutput  import TerminalOutput
+from   outputCapture   import OutputCapture, OutputCaptureReader, OutputCaptureException
 from   random          import random
 from   queue           import SimpleQueue
 from   hashlib         import sha256
@@ -21,6 +23,7 @@ import webview
 import asyncio
 import webbrowser
 import esptoolProc
+import mpyCrossProc
 import json
 import conf
 import sys
@@ -43,6 +46,14 @@ class Application :
         self._deviceReadyToCmd   = False
         self._wsMsgQueue         = SimpleQueue()
         self._contentTransfer    = None
+        self._dirTreeCache       = ESP32DirTreeCache()
+        self._deviceMpyVer       = None
+        self._termOutput         = TerminalOutput( onFlush         = self._onTerminalOutputFlush,
+                                                   batchSec        = conf.TERMINAL_BATCH_SEC,
+                                                   maxBytesPerSec  = conf.TERMINAL_MAX_BYTES_PER_SEC,
+                                                   maxPendingBytes = conf.TERMINAL_MAX_PENDING_BYTES )
+        self._outputCapture      = None
+        self._ctrlStatsDumpTime  = 0
         self._cleanAfterJamaFunc = False
         self._canCloseSoftware   = False
 
@@ -152,6 +163,10 @@ class Application :
     # ------------------------------------------------------------------------
 
     def _wsSendCmd(self, cmdName, oArg=None) :
+        if cmdName != 'EXEC-CODE-RECV' :
+            # Terminal output still batched must reach the UI before any other command,
+            # it is sent in order within the rate limit,
+            self._termOutput.Flush()
         if self._ws :
             o = {
                 "CMD" : cmdName,
@@ -281,6 +296,14 @@ class Application :
                 self._removeConfig(arg)
             elif cmd == 'REMOVE-BOOT-CFG' :
                 self._removeBootConfig()
+            elif cmd == 'GET-CAPTURE-SESSIONS' :
+                self._sendCaptureSessions()
+            elif cmd == 'READ-CAPTURE' :
+                self._sendCaptureData(arg['id'], arg.get('offset', 0), arg.get('size'), arg.get('time'))
+            elif cmd == 'SEARCH-CAPTURE' :
+                self._sendCaptureSearch(arg['id'], arg['pattern'], arg.get('regex', False), arg.get('offset', 0))
+            elif cmd == 'GET-CTRL-STATS' :
+                self._sendCtrlStats()
             elif cmd == "CLOSE-SOFTWARE" :
                 self._closeSoftware()
             elif cmd == "OPEN-URL" :
@@ -337,6 +360,38 @@ class Application :
 
     # ------------------------------------------------------------------------
 
+    def _getLastDevicePorts(self) :
+        ports = self._loadFromJSONFile(conf.LAST_DEVICE_PORTS_FILENAME)
+        if not isinstance(ports, dict) :
+            return [ ]
+        ports = sorted(ports.values(), key=lambda x : x['time'], reverse=True)
+        return [ x['port'] for x in ports ]
+
+    # ------------------------------------------------------------------------
+
+    def _saveLastDevicePort(self) :
+        ports = self._loadFromJSONFile(conf.LAST_DEVICE_PORTS_FILENAME)
+        if not isinstance(ports, dict) :
+            ports = { }
+        try :
+            uid = self.esp32Ctrl.GetUniqueID()
+        except :
+            return
+        ports[uid] = dict( port = self.esp32Ctrl.GetDevicePort(),
+                           time = time() )
+        self._saveToJSONFile(ports, conf.LAST_DEVICE_PORTS_FILENAME)
+
+    # ------------------------------------------------------------------------
+
+    def _installDeviceAgent(self) :
+        if conf.DEVICE_AGENT_AUTO_INSTALL and not self.esp32Ctrl.GetAgentVersion() :
+            try :
+                self.esp32Ctrl.InstallAgent()
+            except :
+                pass
+
+    # ------------------------------------------------------------------------
+
     def _connectSerial(self, devicePort, reconn=False) :
         if not self.esp32Ctrl :
             Err            = None
@@ -347,6 +402,7 @@ class Application :
                 try :
                     self.esp32Ctrl = ESP32Controller( devicePort        = devicePort,
                                                       connectTimeoutSec = 7,
+                                                      upgradeBaudrate   = conf.DEVICE_UPGRADE_BAUDRATE,
                                                       onConnProgress    = onConnProgress,
                                                       onSerialConnError = self._onSerialConnError,
                                                       onTerminalRecv    = self._onTerminalRecv,
@@ -359,7 +415,9 @@ class Application :
             else :
                 if not reconn :
                     self._wsSendCmd('SHOW-WAIT', 'Search for a device to connect to...')
-                self.esp32Ctrl = ESP32Controller.GetFirstAvailableESP32Ctrl( onSerialConnError = self._onSerialConnError,
+                self.esp32Ctrl = ESP32Controller.GetFirstAvailableESP32Ctrl( upgradeBaudrate   = conf.DEVICE_UPGRADE_BAUDRATE,
+                                                                             preferredPorts    = self._getLastDevicePorts(),
+                                                                             onSerialConnError = self._onSerialConnError,
                                                                              onTerminalRecv    = self._onTerminalRecv,
                                                                              onEndOfProgram    = self._onEndOfProgram,
                                                                              onProgramError    = self._onProgramError,
@@ -367,15 +425,24 @@ class Application :
                                                                              onDeviceReset     = self._onDeviceReset )
             self._wsSendCmd('HIDE-WAIT')
             if self.esp32Ctrl :
+                self._dirTreeCache.Clear()
+                self._deviceMpyVer = None
                 self._wsSendCmd('SERIAL-CONNECTION', self.esp32Ctrl.GetDevicePort())
                 self._wsSendCmd('DEVICE-INFO', dict( deviceMCU    = self.esp32Ctrl.GetDeviceMCU(),
                                                      deviceModule = self.esp32Ctrl.GetDeviceModule() ))
-                self._wsSendCmd('SHOW-ALERT', "Port %s connected to %s." % (self.esp32Ctrl.GetDevicePort(), self.esp32Ctrl.GetDeviceMCU()))
+                self._wsSendCmd('SHOW-ALERT', "Port %s connected to %s at %s bauds." % ( self.esp32Ctrl.GetDevicePort(),
+                                                                                         self.esp32Ctrl.GetDeviceMCU(),
+                                                                                         self.esp32Ctrl.GetBaudrate() ))
+                self._saveLastDevicePort()
+                self._startOutputCapture()
+                self._installDeviceAgent()
                 self._sendFlashRootPath()
                 self._sendPinsList()
                 self._sendSDCardConf(silence=True)
                 self._sendAutoInfo()
                 self._deviceReadyToCmd = True
+                if reconn :
+                    self._resumePendingTransfers()
                 return True
             else :
                 if not reconn :
@@ -410,6 +477,8 @@ class Application :
     def _disconnectSerial(self, killEsp32Ctrl=False) :
         if self.esp32Ctrl and self.esp32Ctrl.IsConnected() :
             self.esp32Ctrl.Close(killEsp32Ctrl)
+            self._dirTreeCache.Clear()
+            self._stopOutputCapture()
             self._wsSendCmd('SERIAL-CONNECTION', None)
             self._wsSendCmd('SHOW-ALERT', 'Port %s disconnected from %s.' % (self.esp32Ctrl.GetDevicePort(), self.esp32Ctrl.GetDeviceMCU()))
             self._wsSendCmd('EXEC-CODE-END', False)
@@ -420,6 +489,8 @@ class Application :
     # ------------------------------------------------------------------------
 
     def _onSerialConnError(self, esp32Ctrl) :
+        self._dirTreeCache.Clear()
+        self._stopOutputCapture()
         self._wsSendCmd('SERIAL-CONNECTION', None)
         self._wsSendCmd('SHOW-ERROR', 'You have been disconnected from the device.')
         self._wsSendCmd('EXEC-CODE-END', False)
@@ -430,29 +501,65 @@ class Application :
         
     # ------------------------------------------------------------------------
 
+    def _startOutputCapture(self) :
+        self._stopOutputCapture()
+        if conf.OUTPUT_CAPTURE :
+            try :
+                deviceName = self.esp32Ctrl.GetUniqueID()
+            except :
+                deviceName = self.esp32Ctrl.GetDevicePort()
+            try :
+                self._outputCapture = OutputCapture( rootPath     = conf.DIRECTORY_OUTPUT_CAPTURES,
+                                                     deviceName   = deviceName,
+                                                     segmentBytes = conf.OUTPUT_CAPTURE_SEGMENT_BYTES,
+                                                     maxBytes     = conf.OUTPUT_CAPTURE_MAX_BYTES )
+            except OutputCaptureException :
+                return
+            self._termOutput.AddCaptureSink(self._outputCapture.Write)
+
+    # ------------------------------------------------------------------------
+
+    def _stopOutputCapture(self) :
+        capture = self._outputCapture
+        if capture :
+            self._outputCapture = None
+            self._termOutput.RemoveCaptureSink(capture.Write)
+            capture.Close()
+
+    # ------------------------------------------------------------------------
+
     def _onTerminalRecv(self, esp32Ctrl, text) :
+        self._termOutput.Write(text)
+
+    # ------------------------------------------------------------------------
+
+    def _onTerminalOutputFlush(self, text) :
         self._wsSendCmd('EXEC-CODE-RECV', text)
         
     # ------------------------------------------------------------------------
 
     def _onEndOfProgram(self, esp32Ctrl) :
+        self._dirTreeCache.Clear()
         self._wsSendCmd('EXEC-CODE-END', True)
         
     # ------------------------------------------------------------------------
 
     def _onProgramError(self, esp32Ctrl, error) :
+        self._dirTreeCache.Clear()
         self._wsSendCmd('EXEC-CODE-ERROR', error)
         self._wsSendCmd('EXEC-CODE-END', False)
         
     # ------------------------------------------------------------------------
 
     def _onProgramStopped(self, esp32Ctrl) :
+        self._dirTreeCache.Clear()
         self._wsSendCmd('EXEC-CODE-STOPPED')
         self._wsSendCmd('EXEC-CODE-END', False)
         
     # ------------------------------------------------------------------------
 
     def _onDeviceReset(self, esp32Ctrl) :
+        self._dirTreeCache.Clear()
         self._wsSendCmd('DEVICE-RESET')
         self._wsSendCmd('EXEC-CODE-END', False)
         self._wsSendCmd('SHOW-ALERT', 'The device has been reset!')
@@ -497,12 +604,15 @@ class Application :
         if self._ableToUseDevice() :
             try :
                 self.esp32Ctrl.SendFile(localFilename, remoteFilename, self._sendFileProgress)
+                self._dirTreeCache.SetEntry(remoteFilename, os.stat(localFilename).st_size)
                 self._wsSendCmd('HIDE-PROGRESS')
             except ESP32ControllerException as esp32CtrlEx :
+                self._dirTreeCache.InvalidateEntry(remoteFilename)
                 self._wsSendCmd('HIDE-PROGRESS')
                 if self.esp32Ctrl :
                     self._wsSendCmd('SHOW-ERROR', str(esp32CtrlEx))
             except :
+                self._dirTreeCache.InvalidateEntry(remoteFilename)
                 self._wsSendCmd('HIDE-PROGRESS')
                 self._wsSendCmd('SHOW-ERROR', 'An error has occurred.')
 
@@ -513,6 +623,27 @@ class Application :
 
     # ------------------------------------------------------------------------
 
+    def _resumePendingTransfers(self) :
+        for transfer in self.esp32Ctrl.GetPendingTransfers() :
+            if transfer['direction'] == 'send' :
+                cbProgress = self._sendFileProgress
+            else :
+                cbProgress = self._recvFileProgress
+            if transfer['direction'] == 'send' :
+                self._dirTreeCache.InvalidateEntry(transfer['remoteFilename'])
+            try :
+                self.esp32Ctrl.ResumePendingTransfer(transfer['id'], cbProgress)
+                self._wsSendCmd('HIDE-PROGRESS')
+                self._wsSendCmd('SHOW-ALERT', 'Interrupted transfer of %s has been resumed and completed.' % transfer['remoteFilename'])
+            except :
+                self._wsSendCmd('HIDE-PROGRESS')
+                if not self.esp32Ctrl or not self.esp32Ctrl.IsConnected() :
+                    break
+                self.esp32Ctrl.CancelPendingTransfer(transfer['id'])
+                self._wsSendCmd('SHOW-ERROR', 'Interrupted transfer of %s cannot be resumed.' % transfer['remoteFilename'])
+
+    # ------------------------------------------------------------------------
+
     def _downloadFile(self, remoteFilename) :
         if self._ableToUseDevice() :
             filename = remoteFilename.split('/')[-1]
@@ -542,7 +673,15 @@ class Application :
     def _sendFileContent(self, remoteFilename) :
         if self._ableToUseDevice() :
             try :
-                self.esp32Ctrl.GetFileContent(remoteFilename, self._getFileContentProgress)
+                fileSize = [ 0 ]
+                def onProgress(progress, size) :
+                    if not progress :
+                        fileSize[0] = size
+                progress = 0
+                with self.esp32Ctrl.OpenRemoteFile(remoteFilename, onProgress) as f :
+                    for buf in f :
+                        progress += len(buf)
+                        self._getFileContentProgress(progress, fileSize[0], buf)
                 self._wsSendCmd('HIDE-PROGRESS')
                 self._wsSendCmd('END-OF-GET-FILE-CONTENT')
             except :
@@ -574,9 +713,12 @@ class Application :
                     self.esp32Ctrl.PutFileContent( self._contentTransfer['name'],
                                                    self._contentTransfer['data'],
                                                    self._putFileContentProgress )
+                    self._dirTreeCache.SetEntry( self._contentTransfer['name'],
+                                                 len(self._contentTransfer['data']) )
                     self._wsSendCmd('HIDE-PROGRESS')
                     self._wsSendCmd('END-OF-FILE-CONTENT-DATA')
                 except :
+                    self._dirTreeCache.InvalidateEntry(self._contentTransfer['name'])
                     self._wsSendCmd('HIDE-PROGRESS')
                     self._wsSendCmd('SHOW-ERROR', 'An error has occurred.')
 
@@ -611,6 +753,78 @@ class Application :
 
     # ------------------------------------------------------------------------
 
+    def _openCaptureReader(self, sessionID) :
+        # Session IDs are "device/session" and must stay in the captures directory,
+        root = conf.DIRECTORY_OUTPUT_CAPTURES.resolve()
+        path = (root / str(sessionID)).resolve()
+        if path.parent.parent != root :
+            raise OutputCaptureException('Invalid capture session "%s".' % sessionID)
+        if self._outputCapture and self._outputCapture.GetSessionID() == str(sessionID) :
+            # Pending output of the live session is readable right away,
+            self._outputCapture.Flush()
+        return OutputCaptureReader(str(path))
+
+    # ------------------------------------------------------------------------
+
+    def _sendCaptureSessions(self) :
+        sessions = OutputCapture.GetSessions(str(conf.DIRECTORY_OUTPUT_CAPTURES))
+        liveID   = (self._outputCapture.GetSessionID() if self._outputCapture else None)
+        for session in sessions :
+            session['live'] = (session['id'] == liveID)
+        self._wsSendCmd('CAPTURE-SESSIONS', sessions)
+
+    # ------------------------------------------------------------------------
+
+    def _sendCaptureData(self, sessionID, offset=0, size=None, t=None) :
+        try :
+            reader = self._openCaptureReader(sessionID)
+            if t is not None :
+                offset = reader.GetOffsetAtTime(float(t))
+            size = min(int(size or conf.OUTPUT_CAPTURE_PAGE_BYTES), conf.OUTPUT_CAPTURE_PAGE_BYTES)
+            data = reader.Read(int(offset), size)
+            data.update(id=sessionID, totalSize=reader.GetSize())
+            self._wsSendCmd('CAPTURE-DATA', data)
+        except OutputCaptureException as ex :
+            self._wsSendCmd('SHOW-ERROR', str(ex))
+        except :
+            self._wsSendCmd('SHOW-ERROR', 'An error has occurred.')
+
+    # ------------------------------------------------------------------------
+
+    def _sendCaptureSearch(self, sessionID, pattern, regex=False, offset=0) :
+        try :
+            reader  = self._openCaptureReader(sessionID)
+            results = reader.Search(pattern, regex=regex, offset=int(offset))
+            self._wsSendCmd('CAPTURE-SEARCH-RESULTS', dict( id      = sessionID,
+                                                            pattern = pattern,
+                                                            results = results ))
+        except OutputCaptureException as ex :
+            self._wsSendCmd('SHOW-ERROR', str(ex))
+        except :
+            self._wsSendCmd('SHOW-ERROR', 'An error has occurred.')
+
+    # ------------------------------------------------------------------------
+
+    def _sendCtrlStats(self) :
+        # Counters only, the device is not queried and can be processing,
+        if self.esp32Ctrl :
+            self._wsSendCmd('CTRL-STATS', self.esp32Ctrl.GetStats())
+        else :
+            self._wsSendCmd('CTRL-STATS', None)
+
+    # ------------------------------------------------------------------------
+
+    def _dumpCtrlStats(self) :
+        if conf.CTRL_STATS_DUMP and self.esp32Ctrl and self.esp32Ctrl.IsConnected() \
+           and time() - self._ctrlStatsDumpTime >= conf.CTRL_STATS_DUMP_SEC :
+            self._ctrlStatsDumpTime = time()
+            try :
+                self.esp32Ctrl.DumpStats(str(conf.CTRL_STATS_DUMP_FILENAME))
+            except :
+                pass
+
+    # ------------------------------------------------------------------------
+
     def _sendFlashRootPath(self) :
         if self._ableToUseDevice() :
             try :
@@ -620,14 +834,36 @@ class Application :
 
     # ------------------------------------------------------------------------
 
+    def _invalidateFlashRootEntries(self, *names) :
+        # Forgets the cached entries written by an operation in the flash root (and the root listing),
+        try :
+            rootPath = self.esp32Ctrl.GetFlashRootPath()
+            for name in names :
+                self._dirTreeCache.InvalidateEntry('%s/%s' % (rootPath, name))
+        except :
+            self._dirTreeCache.Clear()
+
+    # ------------------------------------------------------------------------
+
+    def _getSDCardMountPoint(self) :
+        conf = self.esp32Ctrl.GetSDCardConf()
+        return (conf['mountPoint'] if conf else None)
+
+    # ------------------------------------------------------------------------
+
     def _sendListDir(self, path) :
         if self._ableToUseDevice(silence=True) :
             try :
-                try :
-                    entries = self.esp32Ctrl.GetListDir(path)
-                except :
-                    path    = self.esp32Ctrl.GetFlashRootPath()
-                    entries = self.esp32Ctrl.GetListDir(path)
+                entries = self._dirTreeCache.GetListDir(path)
+                if entries is None :
+                    # Only the opened directory is fetched, deeper levels are cached when opened,
+                    try :
+                        tree = self.esp32Ctrl.GetDirTree(path, maxDepth=1, mtimes=False)
+                    except :
+                        path = self.esp32Ctrl.GetFlashRootPath()
+                        tree = self.esp32Ctrl.GetDirTree(path, maxDepth=1, mtimes=False)
+                    self._dirTreeCache.Update(tree)
+                    entries = self._dirTreeCache.GetListDir(path)
                 self._wsSendCmd('LIST-DIR', dict( path = path, entries = entries ))
             except :
                 self._wsSendCmd('SHOW-ERROR', 'An error has occurred.')
@@ -638,7 +874,9 @@ class Application :
         if self._ableToUseDevice() :
             try :
                 self.esp32Ctrl.CreateDir(path)
+                self._dirTreeCache.SetEntry(path)
             except :
+                self._dirTreeCache.InvalidateEntry(path)
                 self._wsSendCmd('SHOW-ERROR', 'Unable to create this directory.')
 
     # ------------------------------------------------------------------------
@@ -647,7 +885,10 @@ class Application :
         if self._ableToUseDevice() :
             try :
                 self.esp32Ctrl.RenameFileOrDir(srcPath, dstPath)
+                self._dirTreeCache.MoveEntry(srcPath, dstPath)
             except :
+                self._dirTreeCache.InvalidateEntry(srcPath)
+                self._dirTreeCache.InvalidateEntry(dstPath)
                 self._wsSendCmd('SHOW-ERROR', 'Unable to rename this element.')
 
     # ------------------------------------------------------------------------
@@ -656,7 +897,9 @@ class Application :
         if self._ableToUseDevice() :
             try :
                 self.esp32Ctrl.DeleteFileOrRecurDir(path)
+                self._dirTreeCache.RemoveEntry(path)
             except :
+                self._dirTreeCache.InvalidateEntry(path)
                 self._wsSendCmd('SHOW-ERROR', 'Unable to remove this element.')
 
     # ------------------------------------------------------------------------
@@ -676,13 +919,15 @@ class Application :
             if not silence :
                 self._wsSendCmd('SHOW-WAIT', 'Updating informations...')
             try :
-                o = dict( uid        = self.esp32Ctrl.GetUniqueID(),
-                          freq       = self.esp32Ctrl.GetMHzFreq(),
-                          flashSize  = self.esp32Ctrl.GetFlashSize(),
-                          os         = self.esp32Ctrl.GetPlatformInfo(),
-                          partitions = self.esp32Ctrl.GetPartitions(),
-                          pins       = self.esp32Ctrl.GetPinsState(),
-                          bootcfg    = self.esp32Ctrl.CheckAllConfigurations() )
+                nfo = self.esp32Ctrl.GetInfos( [ 'UniqueID', 'MHzFreq', 'FlashSize', 'PlatformInfo',
+                                                 'Partitions', 'PinsState', 'AllConfigurations' ] )
+                o = dict( uid        = nfo['UniqueID'],
+                          freq       = nfo['MHzFreq'],
+                          flashSize  = nfo['FlashSize'],
+                          os         = nfo['PlatformInfo'],
+                          partitions = nfo['Partitions'],
+                          pins       = nfo['PinsState'],
+                          bootcfg    = nfo['AllConfigurations'] )
                 if not silence :
                     self._wsSendCmd('HIDE-WAIT')
                 self._wsSendCmd('SYS-INFO', o)
@@ -698,18 +943,24 @@ class Application :
             if not silence :
                 self._wsSendCmd('SHOW-WAIT', 'Updating informations...')
             try :
-                wifiSTACnf = self.esp32Ctrl.GetWiFiConfig(ap=False)
-                wifiAPCnf  = self.esp32Ctrl.GetWiFiConfig(ap=True)
-                internetOk = self.esp32Ctrl.GetInternetOk()
-                try :
-                    bleActive = self.esp32Ctrl.GetBLEActive()
-                    bleMAC    = self.esp32Ctrl.GetBLEMacAddr()
-                except :
+                nfo = self.esp32Ctrl.GetInfos( [ 'WiFiSTAActive', 'WiFiSTAMacAddr', 'WiFiSTAConfig',
+                                                 'WiFiAPActive',  'WiFiAPMacAddr',  'WiFiAPConfig',
+                                                 'ETHInfo', 'BLEActive', 'BLEMacAddr', 'InternetOk' ],
+                                               raiseOnError = False )
+                for name, value in nfo.items() :
+                    if isinstance(value, Exception) and not name.startswith('BLE') :
+                        raise value
+                if isinstance(nfo['BLEActive'], Exception) or isinstance(nfo['BLEMacAddr'], Exception) :
                     bleActive = False
                     bleMAC    = 'Not available'
+                else :
+                    bleActive = nfo['BLEActive']
+                    bleMAC    = nfo['BLEMacAddr']
+                wifiSTACnf = nfo['WiFiSTAConfig']
+                wifiAPCnf  = nfo['WiFiAPConfig']
                 o = dict( wifiSTA = dict(
-                              active  = self.esp32Ctrl.GetWiFiActive(ap=False),
-                              mac     = self.esp32Ctrl.GetWiFiMacAddr(ap=False),
+                              active  = nfo['WiFiSTAActive'],
+                              mac     = nfo['WiFiSTAMacAddr'],
                               ssid    = wifiSTACnf['ssid'],
                               ip      = wifiSTACnf['ip'],
                               mask    = wifiSTACnf['mask'],
@@ -717,20 +968,20 @@ class Application :
                               dns     = wifiSTACnf['dns']
                           ),
                           wifiAP = dict(
-                              active  = self.esp32Ctrl.GetWiFiActive(ap=True),
-                              mac     = self.esp32Ctrl.GetWiFiMacAddr(ap=True),
+                              active  = nfo['WiFiAPActive'],
+                              mac     = nfo['WiFiAPMacAddr'],
                               ssid    = wifiAPCnf['ssid'],
                               ip      = wifiAPCnf['ip'],
                               mask    = wifiAPCnf['mask'],
                               gateway = wifiAPCnf['gateway'],
                               dns     = wifiAPCnf['dns']
                           ),
-                          eth = self.esp32Ctrl.GetETHInfo(),
+                          eth = nfo['ETHInfo'],
                           ble = dict(
                               active  = bleActive,
                               mac     = bleMAC
                           ),
-                          internetOK = internetOk
+                          internetOK = nfo['InternetOk']
                 )
                 if not silence :
                     self._wsSendCmd('HIDE-WAIT')
@@ -819,7 +1070,10 @@ class Application :
         if self._ableToUseDevice() :
             self._wsSendCmd('SHOW-WAIT', 'Saving Wi-Fi configuration...')
             try :
-                self.esp32Ctrl.SaveWiFiSTACfg(ssid, key)
+                try :
+                    self.esp32Ctrl.SaveWiFiSTACfg(ssid, key)
+                finally :
+                    self._invalidateFlashRootEntries('boot.py', ESP32Controller.BOOT_CONFIG_MPY_FILENAME)
                 self._wsSendCmd('HIDE-WAIT')
             except :
                 self._wsSendCmd('HIDE-WAIT')
@@ -849,7 +1103,10 @@ class Application :
         if self._ableToUseDevice() :
             self._wsSendCmd('SHOW-WAIT', 'Saving Wi-Fi AP configuration...')
             try :
-                self.esp32Ctrl.SaveWiFiAPCfg(ssid, auth, key, maxcli)
+                try :
+                    self.esp32Ctrl.SaveWiFiAPCfg(ssid, auth, key, maxcli)
+                finally :
+                    self._invalidateFlashRootEntries('boot.py', ESP32Controller.BOOT_CONFIG_MPY_FILENAME)
                 self._wsSendCmd('HIDE-WAIT')
             except :
                 self._wsSendCmd('HIDE-WAIT')
@@ -883,7 +1140,10 @@ class Application :
         if self._ableToUseDevice() :
             self._wsSendCmd('SHOW-WAIT', 'Saving Ethernet configuration...')
             try :
-                self.esp32Ctrl.SaveETHCfg(driver, addr, mdc, mdio, power)
+                try :
+                    self.esp32Ctrl.SaveETHCfg(driver, addr, mdc, mdio, power)
+                finally :
+                    self._invalidateFlashRootEntries('boot.py', ESP32Controller.BOOT_CONFIG_MPY_FILENAME)
                 self._wsSendCmd('HIDE-WAIT')
             except :
                 self._wsSendCmd('HIDE-WAIT')
@@ -919,12 +1179,46 @@ class Application :
 
     # ------------------------------------------------------------------------
 
+    def _compileProgram(self, code, codeFilename=None) :
+        # Returns the .mpy bytecode of the program or None to send its source,
+        # programs testing __name__ keep running as "__main__" from the source,
+        if not conf.DEVICE_PRECOMPILE_MPY or code.find('\n') == -1 or code.find('__name__') >= 0 :
+            return None
+        try :
+            if not mpyCrossProc.GetVersion() :
+                return None
+            if not self._deviceMpyVer :
+                self._deviceMpyVer = self.esp32Ctrl.GetPlatformInfo()['mpyver']
+            sourceName = ('<%s>' % codeFilename if codeFilename else ESP32Controller.DEFAULT_CODE_FILENAME)
+            return mpyCrossProc.Compile(code, sourceName, self._deviceMpyVer)
+        except :
+            return None
+
+    # ------------------------------------------------------------------------
+
+    def _execProgram(self, code, codeFilename, cbProgress) :
+        mpyData = self._compileProgram(code, codeFilename)
+        if conf.DEVICE_PROGRAM_CACHE :
+            self.esp32Ctrl.ExecCachedProgram( code         = code,
+                                              codeFilename = codeFilename,
+                                              cbProgress   = cbProgress,
+                                              mpyData      = mpyData )
+        elif mpyData :
+            self.esp32Ctrl.ExecMpyProgram( mpyData      = mpyData,
+                                           codeFilename = codeFilename,
+                                           cbProgress   = cbProgress,
+                                           code         = code )
+        else :
+            self.esp32Ctrl.ExecProgram( code         = code,
+                                        codeFilename = codeFilename,
+                                        cbProgress   = cbProgress )
+
+    # ------------------------------------------------------------------------
+
     def _execCode(self, code, codeFilename=None) :
         if self._ableToUseDevice() :
             try :
-                self.esp32Ctrl.ExecProgram( code         = code,
-                                            codeFilename = codeFilename,
-                                            cbProgress   = self._execCodeProgress )
+                self._execProgram(code, codeFilename, self._execCodeProgress)
             except :
                 self._wsSendCmd('EXEC-CODE-END', False)
                 self._wsSendCmd('SHOW-ERROR', 'An error has occurred.')
@@ -1276,9 +1570,7 @@ class Application :
                 filename = config['filename']
                 with open(filename, 'rb') as f :
                     code = f.read().decode() + '\n'
-                self.esp32Ctrl.ExecProgram( code         = code,
-                                            codeFilename = 'JAMA-FUNC',
-                                            cbProgress   = self._execJamaFuncProgress )
+                self._execProgram(code, 'JAMA-FUNC', self._execJamaFuncProgress)
                 self._cleanAfterJamaFunc = True
             except :
                 self._wsSendCmd('HIDE-PROGRESS')
@@ -1362,7 +1654,10 @@ class Application :
         if self._ableToUseDevice() :
             try :
                 self._wsSendCmd('SHOW-WAIT', 'Attempts to download and install "%s" package...' % packageName)
-                self.esp32Ctrl.InstallPackage(packageName)
+                try :
+                    self.esp32Ctrl.InstallPackage(packageName)
+                finally :
+                    self._invalidateFlashRootEntries('lib')
                 self._wsSendCmd('HIDE-WAIT')
             except :
                 self._wsSendCmd('HIDE-WAIT')
@@ -1396,7 +1691,10 @@ class Application :
         if self._ableToUseDevice() :
             self._wsSendCmd('SHOW-WAIT', 'Saving MCU configuration...')
             try :
-                self.esp32Ctrl.SaveMCUCfg(freq)
+                try :
+                    self.esp32Ctrl.SaveMCUCfg(freq)
+                finally :
+                    self._invalidateFlashRootEntries('boot.py', ESP32Controller.BOOT_CONFIG_MPY_FILENAME)
                 self._wsSendCmd('HIDE-WAIT')
                 self._sendSysInfo(False)
             except :
@@ -1423,7 +1721,11 @@ class Application :
         if self._ableToUseDevice() :
             try :
                 self._wsSendCmd('SHOW-WAIT', 'Format SD card...')
-                if self.esp32Ctrl.FormatSDCard() :
+                mountPoint = self._getSDCardMountPoint()
+                formated   = self.esp32Ctrl.FormatSDCard()
+                if mountPoint :
+                    self._dirTreeCache.InvalidateEntry(mountPoint)
+                if formated :
                     self._sendSDCardConf(silence=True)
                     self._wsSendCmd('HIDE-WAIT')
                     self._wsSendCmd('SHOW-INFO', 'The SD card has been formated.')
@@ -1457,7 +1759,9 @@ class Application :
     def _mountSDCard(self, mountPointName) :
         if self._ableToUseDevice() :
             try :
-                if self.esp32Ctrl.MountSDCardFileSystem(mountPointName) :
+                mounted = self.esp32Ctrl.MountSDCardFileSystem(mountPointName)
+                self._dirTreeCache.InvalidateEntry(mountPointName)
+                if mounted :
                     self._wsSendCmd('SHOW-ALERT', 'The SD card has been mounted.')
                     self._sendSDCardConf()
                     self._wsSendCmd('SD-CARD-MOUNTED')
@@ -1472,7 +1776,10 @@ class Application :
         if self._ableToUseDevice() :
             self._wsSendCmd('SHOW-WAIT', 'Saving SD card configuration...')
             try :
-                self.esp32Ctrl.SaveSDCardCfg(mountpt)
+                try :
+                    self.esp32Ctrl.SaveSDCardCfg(mountpt)
+                finally :
+                    self._invalidateFlashRootEntries('boot.py', ESP32Controller.BOOT_CONFIG_MPY_FILENAME)
                 self._wsSendCmd('HIDE-WAIT')
             except :
                 self._wsSendCmd('HIDE-WAIT')
@@ -1483,7 +1790,11 @@ class Application :
     def _umountSDCard(self) :
         if self._ableToUseDevice() :
             try :
-                if self.esp32Ctrl.UmountSDCardFileSystem() :
+                mountPoint = self._getSDCardMountPoint()
+                umounted   = self.esp32Ctrl.UmountSDCardFileSystem()
+                if mountPoint :
+                    self._dirTreeCache.InvalidateEntry(mountPoint)
+                if umounted :
                     self._sendSDCardConf()
                 else :
                     self._wsSendCmd('SHOW-ERROR', 'Impossible to umount the file system of the SD card.')
@@ -1495,7 +1806,11 @@ class Application :
     def _releaseSDCard(self) :
         if self._ableToUseDevice() :
             try :
-                if self.esp32Ctrl.ReleaseSDCard() :
+                mountPoint = self._getSDCardMountPoint()
+                released   = self.esp32Ctrl.ReleaseSDCard()
+                if mountPoint :
+                    self._dirTreeCache.InvalidateEntry(mountPoint)
+                if released :
                     self._sendSDCardConf(silence=True)
                 else :
                     self._wsSendCmd('SHOW-ERROR', 'Unable to release the SD card.')
@@ -1508,7 +1823,10 @@ class Application :
         if self._ableToUseDevice() :
             self._wsSendCmd('SHOW-WAIT', 'Removing boot configuration...')
             try :
-                self.esp32Ctrl.RemoveBootConfig()
+                try :
+                    self.esp32Ctrl.RemoveBootConfig()
+                finally :
+                    self._invalidateFlashRootEntries('boot.py', ESP32Controller.BOOT_CONFIG_MPY_FILENAME)
                 self._wsSendCmd('HIDE-WAIT')
                 self._sendSysInfo(False)
             except :
@@ -1521,7 +1839,10 @@ class Application :
         if self._ableToUseDevice() :
             self._wsSendCmd('SHOW-WAIT', 'Removing configuration...')
             try :
-                self.esp32Ctrl.RemoveConfiguration(cfgName)
+                try :
+                    self.esp32Ctrl.RemoveConfiguration(cfgName)
+                finally :
+                    self._invalidateFlashRootEntries('boot.py', ESP32Controller.BOOT_CONFIG_MPY_FILENAME)
                 self._wsSendCmd('HIDE-WAIT')
                 self._sendSysInfo(False)
             except :
@@ -1580,6 +1901,9 @@ class Application :
                     continue
             if self._deviceReadyToCmd :
                 self._sendAutoInfo()
+            if self._outputCapture :
+                self._outputCapture.Flush(wait=False)
+            self._dumpCtrlStats()
             gc.collect()
 
     # ------------------------------------------------------------------------
@@ -1605,6 +1929,7 @@ class Application :
         if not conf.IS_WIN32 :
             print('Starts %s v%s on %s' % (conf.APPLICATION_TITLE, conf.APPLICATION_STR_VERSION, conf.OS_NAME))
         try :
+            self._termOutput.Start()
             self._webSrv.Start(threaded=True)
             try :
                 webview.start( self._appRun,
@@ -1627,6 +1952,8 @@ class Application :
                        'Application error:\n' +
                        'Unable to initialize internal Web server for UI...' +
                        '%s\n' % ex )
+        self._termOutput.Close()
+        self._stopOutputCapture()
         self._appRunning = False
 
 # ============================================================================
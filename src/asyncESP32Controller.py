@@ -0,0 +1,795 @@
+# -*- coding: utf-8 -*-
+
+# ============================================= #
+#                                               #
+# Copyright © 2023 JC`zic (Jean-Christophe Bos) #
+#             jczic.bos@gmail.com               #
+#                                               #
+# ============================================= #
+
+
+from   esp32Controller   import ESP32Controller, ESP32REPLStreamParser, ESP32ControllerException, \
+                                ESP32ControllerSerialConnException, ESP32ControllerAlreadyProcessingException, \
+                                ESP32ControllerCodeException, ESP32ControllerDecodeException
+from   serial            import Serial
+from   os                import stat, read as osRead, write as osWrite, set_blocking
+from   time              import time
+from   ast               import literal_eval
+from   json              import loads as jsonLoads
+import asyncio
+
+# ===============================================================================
+# ===( AsyncESP32Controller )====================================================
+# ===============================================================================
+
+class AsyncESP32Controller :
+
+    # ---------------------------------------------------------------------------
+
+    CONNECT_TIMEOUT_SEC      = 3
+    KILL_AFTER_INTERRUPT_SEC = ESP32Controller.KILL_AFTER_INTERRUPT_SEC
+    READ_CHUNK_SIZE          = 4096
+
+    RESULT_TEXT              = ESP32Controller.RESULT_TEXT
+    RESULT_LITERAL           = ESP32Controller.RESULT_LITERAL
+    RESULT_JSON              = ESP32Controller.RESULT_JSON
+    RESULT_AUTO              = ESP32Controller.RESULT_AUTO
+
+    TRANSFER_WINDOW          = ESP32Controller.TRANSFER_WINDOW
+    TRANSFER_TIMEOUT_SEC     = ESP32Controller.TRANSFER_TIMEOUT_SEC
+    TRANSFER_MAX_RETRIES     = ESP32Controller.TRANSFER_MAX_RETRIES
+    TRANSFER_DRAIN_SEC       = ESP32Controller.TRANSFER_DRAIN_SEC
+
+    # ---------------------------------------------------------------------------
+
+    def __init__( self,
+                  devicePort,
+                  baudrate          = 115200,
+                  useRawPaste       = True,
+                  onSerialConnError = None,
+                  onTerminalRecv    = None,
+                  onEndOfProgram    = None,
+                  onProgramError    = None,
+                  onProgramStopped  = None,
+                  onDeviceReset     = None ) :
+
+        self._devicePort         = devicePort
+        self._baudrate           = baudrate
+        self._onSerialConnError  = onSerialConnError
+        self._onTerminalRecv     = onTerminalRecv
+        self._onEndOfProgram     = onEndOfProgram
+        self._onProgramError     = onProgramError
+        self._onProgramStopped   = onProgramStopped
+        self._onDeviceReset      = onDeviceReset
+        self._repl               = None
+        self._fd                 = None
+        self._loop               = None
+        self._isConnected        = False
+        self._rawPasteWinSize    = (None if useRawPaste else 0)
+        self._replResultEnd      = b'\x04>'
+        self._machineModule      = ''
+        self._machineMCU         = ''
+        self._agentVersion       = None
+        self._inProcess          = False
+        self._inCode             = False
+        self._inCodeFileName     = None
+        self._processIdle        = None
+        self._parser             = ESP32REPLStreamParser()
+        self._rxBuffer           = bytearray()
+        self._rxWaiter           = None
+
+    # ---------------------------------------------------------------------------
+
+    async def __aenter__(self) :
+        await self.Open()
+        return self
+
+    # ---------------------------------------------------------------------------
+
+    async def __aexit__(self, excType, excValue, traceback) :
+        await self.Close()
+
+    # ---------------------------------------------------------------------------
+
+    async def Open(self, connectTimeoutSec=CONNECT_TIMEOUT_SEC) :
+        if self._isConnected :
+            return
+        self._loop        = asyncio.get_running_loop()
+        self._processIdle = asyncio.Event()
+        self._processIdle.set()
+        try :
+            self._repl = Serial( port      = self._devicePort,
+                                 baudrate  = self._baudrate,
+                                 timeout   = 0,
+                                 rtscts    = 0,
+                                 dsrdtr    = 0,
+                                 xonxoff   = False,
+                                 exclusive = True )
+        except :
+            raise ESP32ControllerException('Cannot open serial port "%s".' % self._devicePort)
+        try :
+            # Serial data is read and written on the event loop through the non-blocking fd,
+            self._fd = self._repl.fileno()
+            set_blocking(self._fd, False)
+        except :
+            self._repl.close()
+            raise ESP32ControllerException('Asynchronous serial is not supported on this platform.')
+        self._isConnected = True
+        self._loop.add_reader(self._fd, self._onReadable)
+        self._beginProcess()
+        try :
+            try :
+                self._repl.rts = 0
+                self._repl.dtr = 0
+            except :
+                pass
+            await self._write(b'\x03\x03')
+            await self._switchToRawMode(timeoutSec=connectTimeoutSec)
+            machineNfo          = await self._exeCodeREPL('import uos; [x.strip() for x in uos.uname().machine.split("with")]')
+            self._machineModule = (machineNfo[0] if len(machineNfo) >= 1 else '')
+            self._machineMCU    = (machineNfo[1] if len(machineNfo) >= 2 else '')
+            await self._ensureJamaObjExists()
+            await self._detectAgent()
+        except ESP32ControllerSerialConnException :
+            raise
+        except :
+            self._closeSerial()
+            raise ESP32ControllerException('The device on the "%s" port is not compatible.' % self._devicePort)
+        finally :
+            self._endProcess()
+
+    # ---------------------------------------------------------------------------
+
+    async def Close(self) :
+        if self._isConnected :
+            saveSCE = self._onSerialConnError
+            self._onSerialConnError = None
+            try :
+                await self.InterruptProgram()
+                self._beginProcess()
+                await self._switchToNormalMode()
+            except :
+                pass
+            self._onSerialConnError = saveSCE
+            self._closeSerial()
+
+    # ---------------------------------------------------------------------------
+
+    def _closeSerial(self) :
+        if self._fd is not None :
+            try :
+                self._loop.remove_reader(self._fd)
+                self._loop.remove_writer(self._fd)
+            except :
+                pass
+            self._fd = None
+        try :
+            self._repl.close()
+        except :
+            pass
+        self._isConnected = False
+        self._inCode      = False
+        self._endProcess()
+        self._wakeUpReader()
+
+    # ---------------------------------------------------------------------------
+
+    def _raiseConnectionError(self) :
+        if self._isConnected :
+            self._closeSerial()
+            if self._onSerialConnError :
+                self._onSerialConnError(self)
+            raise ESP32ControllerSerialConnException('Serial connection error.')
+        else :
+            raise ESP32ControllerSerialConnException('Serial not connected.')
+
+    # ---------------------------------------------------------------------------
+
+    def _beginProcess(self) :
+        if self._inProcess :
+            raise ESP32ControllerAlreadyProcessingException('Already processing.')
+        self._inProcess = True
+        self._processIdle.clear()
+
+    # ---------------------------------------------------------------------------
+
+    def _endProcess(self) :
+        self._inProcess = False
+        if self._processIdle :
+            self._processIdle.set()
+
+    # ---------------------------------------------------------------------------
+
+    def _onReadable(self) :
+        try :
+            data = osRead(self._fd, self.READ_CHUNK_SIZE)
+        except (BlockingIOError, InterruptedError) :
+            return
+        except :
+            data = b''
+        if not data :
+            self._closeSerial()
+            if self._onSerialConnError :
+                self._onSerialConnError(self)
+        else :
+            self._onData(data)
+
+    # ---------------------------------------------------------------------------
+
+    def _onData(self, data) :
+        if self._inProcess and not self._inCode :
+            # A command is waiting for its response,
+            self._rxBuffer += data
+            self._wakeUpReader()
+            return
+        for event, arg in self._parser.Feed(data) :
+            if event == ESP32REPLStreamParser.EVENT_OUTPUT :
+                if self._onTerminalRecv :
+                    self._onTerminalRecv(self, arg)
+            elif event in ( ESP32REPLStreamParser.EVENT_END,
+                            ESP32REPLStreamParser.EVENT_ERROR,
+                            ESP32REPLStreamParser.EVENT_RESET ) :
+                self._inCode = False
+                if not self._inProcess :
+                    self._beginProcess()
+                self._loop.create_task(self._processEndOfProgram(event, arg))
+                break
+
+    # ---------------------------------------------------------------------------
+
+    async def _processEndOfProgram(self, event, arg) :
+        try :
+            if event == ESP32REPLStreamParser.EVENT_RESET :
+                await self._switchToRawMode()
+                await self._ensureJamaObjExists()
+                await self._detectAgent()
+            else :
+                await self._switchToNormalMode()
+                await self._switchToRawMode()
+        except ESP32ControllerSerialConnException :
+            return
+        except ESP32ControllerException :
+            pass
+        finally :
+            self._endProcess()
+        if event == ESP32REPLStreamParser.EVENT_END :
+            if self._onEndOfProgram :
+                self._onEndOfProgram(self)
+        elif event == ESP32REPLStreamParser.EVENT_ERROR :
+            errMsg = ESP32Controller._programErrorMessage(arg, self._inCodeFileName)
+            if errMsg.find('KeyboardInterrupt:') >= 0 :
+                if self._onProgramStopped :
+                    self._onProgramStopped(self)
+            elif self._onProgramError :
+                self._onProgramError(self, errMsg)
+        elif self._onDeviceReset :
+            self._onDeviceReset(self)
+
+    # ---------------------------------------------------------------------------
+
+    def _wakeUpReader(self) :
+        waiter, self._rxWaiter = self._rxWaiter, None
+        if waiter and not waiter.done() :
+            waiter.set_result(None)
+
+    # ---------------------------------------------------------------------------
+
+    async def _waitData(self, maxTime) :
+        if not self._isConnected :
+            self._raiseConnectionError()
+        timeoutSec = maxTime - time()
+        if timeoutSec <= 0 :
+            raise ESP32ControllerException('Timeout...')
+        self._rxWaiter = self._loop.create_future()
+        try :
+            await asyncio.wait_for(self._rxWaiter, timeoutSec)
+        except asyncio.TimeoutError :
+            raise ESP32ControllerException('Timeout...')
+        if not self._isConnected :
+            self._raiseConnectionError()
+
+    # ---------------------------------------------------------------------------
+
+    async def _serialReadUntil(self, endBytes, timeoutSec=1) :
+        maxTime = time() + timeoutSec
+        start   = 0
+        while True :
+            i = self._rxBuffer.find(endBytes, start)
+            if i >= 0 :
+                i += len(endBytes)
+                b  = bytes(self._rxBuffer[:i])
+                del self._rxBuffer[:i]
+                return b.decode()
+            start = max(len(self._rxBuffer) - len(endBytes) + 1, 0)
+            await self._waitData(maxTime)
+
+    # ---------------------------------------------------------------------------
+
+    async def _serialRead(self, size, timeoutSec=1) :
+        maxTime = time() + timeoutSec
+        while len(self._rxBuffer) < size :
+            await self._waitData(maxTime)
+        b = bytes(self._rxBuffer[:size])
+        del self._rxBuffer[:size]
+        return b
+
+    # ---------------------------------------------------------------------------
+
+    async def _serialDrain(self, idleSec=TRANSFER_DRAIN_SEC) :
+        while True :
+            size = len(self._rxBuffer)
+            await asyncio.sleep(idleSec)
+            if len(self._rxBuffer) == size :
+                self._rxBuffer.clear()
+                return
+
+    # ---------------------------------------------------------------------------
+
+    async def _write(self, data) :
+        if not self._isConnected :
+            self._raiseConnectionError()
+        data = memoryview(data)
+        while data :
+            try :
+                n    = osWrite(self._fd, data)
+                data = data[n:]
+            except (BlockingIOError, InterruptedError) :
+                # Output buffer full, waits until the fd is writable again,
+                writable = self._loop.create_future()
+                self._loop.add_writer(self._fd, lambda : writable.done() or writable.set_result(None))
+                try :
+                    await writable
+                finally :
+                    if self._fd is not None :
+                        self._loop.remove_writer(self._fd)
+            except :
+                self._raiseConnectionError()
+
+    # ---------------------------------------------------------------------------
+
+    async def _switchToRawMode(self, timeoutSec=1) :
+        timeoutExists = False
+        maxTime       = (time() + timeoutSec)
+        while True :
+            await self._write(b'\x01')
+            try :
+                r = await self._serialReadUntil(b'exit\r\n>', timeoutSec=0.250)
+                if r.endswith(ESP32Controller.RAW_PASTE_RESULT_END.decode()) :
+                    # Banner of an interrupted raw-paste execution, the answer to CTRL-A follows,
+                    await self._serialReadUntil(b'exit\r\n>', timeoutSec=0.250)
+                break
+            except ESP32ControllerSerialConnException :
+                raise
+            except :
+                timeoutExists = True
+                if time() >= maxTime :
+                    raise ESP32ControllerException('Timeout...')
+        if timeoutExists :
+            await self._serialDrain(0.250)
+
+    # ---------------------------------------------------------------------------
+
+    async def _switchToNormalMode(self, timeoutSec=1) :
+        await self._write(b'\x02')
+        await self._serialReadUntil(b'\r\n>>> ', timeoutSec)
+
+    # ---------------------------------------------------------------------------
+
+    async def _negotiateRawPaste(self) :
+        await self._write(b'\x05A\x01')
+        r = await self._serialRead(2)
+        if r == b'R\x01' :
+            winSize = int.from_bytes(await self._serialRead(2), 'little')
+            if self._rawPasteWinSize is None :
+                self._rawPasteWinSize = winSize
+            return winSize
+        if r == b'R\x00' :
+            await self._serialReadUntil(b'>')
+        else :
+            await self._serialReadUntil(b'exit\r\n>')
+        self._rawPasteWinSize = 0
+        return 0
+
+    # ---------------------------------------------------------------------------
+
+    async def _rawPasteWrite(self, data, winSize, cbProgress=None, bufSize=2048) :
+        size      = len(data)
+        winRemain = winSize
+        progress  = 0
+        while progress < size :
+            while not winRemain or self._rxBuffer :
+                b = await self._serialRead(1, timeoutSec=3)
+                if b == b'\x01' :
+                    winRemain += winSize
+                elif b == b'\x04' :
+                    await self._write(b'\x04')
+                    return
+                else :
+                    raise ESP32ControllerException('Data error during raw-paste transfer.')
+            buf = data[ progress : progress + min(winRemain, bufSize) ]
+            await self._write(buf)
+            winRemain -= len(buf)
+            progress  += len(buf)
+            if cbProgress :
+                cbProgress(progress, size)
+        await self._write(b'\x04')
+        await self._serialReadUntil(b'\x04', timeoutSec=3)
+
+    # ---------------------------------------------------------------------------
+
+    async def _rawWrite(self, data, cbProgress=None, bufSize=2048) :
+        size     = len(data)
+        progress = 0
+        while progress < size :
+            buf = data[ progress : progress + bufSize ]
+            await self._write(buf)
+            progress += len(buf)
+            if cbProgress :
+                cbProgress(progress, size)
+        await self._write(b'\x04')
+        if await self._serialRead(2, timeoutSec=3) != b'OK' :
+            raise ESP32ControllerException('Data error on serial connection.')
+
+    # ---------------------------------------------------------------------------
+
+    async def _sendCodeToREPL(self, data, cbProgress=None, bufSize=2048) :
+        if cbProgress :
+            cbProgress(0, len(data))
+        winSize = ((await self._negotiateRawPaste()) if self._rawPasteWinSize != 0 else 0)
+        if winSize :
+            self._replResultEnd = ESP32Controller.RAW_PASTE_RESULT_END
+            await self._rawPasteWrite(data, winSize, cbProgress, bufSize)
+        else :
+            self._replResultEnd = b'\x04>'
+            await self._rawWrite(data, cbProgress, bufSize)
+
+    # ---------------------------------------------------------------------------
+
+    def _decodeREPLResult(self, r, resultFormat) :
+        if resultFormat == self.RESULT_TEXT :
+            return r
+        try :
+            if resultFormat == self.RESULT_JSON :
+                return jsonLoads(r)
+            return literal_eval(r.strip())
+        except Exception as ex :
+            if resultFormat == self.RESULT_AUTO :
+                return r
+            raise ESP32ControllerDecodeException( 'Cannot decode %s result (%s): %s' % ( resultFormat,
+                                                                                        type(ex).__name__,
+                                                                                        repr(r[:80]) ) )
+
+    # ---------------------------------------------------------------------------
+
+    async def _readREPLResult(self, timeoutSec=1, prefix='', resultFormat=RESULT_LITERAL) :
+        r = prefix + await self._serialReadUntil(self._replResultEnd, timeoutSec=timeoutSec)
+        r = ESP32Controller._splitREPLResult(r)
+        if r :
+            return self._decodeREPLResult(r, resultFormat)
+        return None
+
+    # ---------------------------------------------------------------------------
+
+    async def _exeCodeREPL(self, code, timeoutSec=1, resultFormat=RESULT_LITERAL) :
+        if not code :
+            return None
+        if code.find('\n') == -1 :
+            code = 'exec(compile(%s,"<ReplCmd>","single"))' % repr(code)
+        await self._sendCodeToREPL(code.encode())
+        return await self._readREPLResult(timeoutSec, resultFormat=resultFormat)
+
+    # ---------------------------------------------------------------------------
+
+    async def _ensureJamaObjExists(self) :
+        await self._exeCodeREPL('if globals().get("___jama") is None : ___jama = dict()')
+
+    # ---------------------------------------------------------------------------
+
+    async def _detectAgent(self) :
+        modName = ESP32Controller.AGENT_MPY_FILENAME.rsplit('.', 1)[0]
+        try :
+            ver = await self._exeCodeREPL( 'try :\n'                                 +
+                                           '  print(__import__(%s).VERSION)\n' % repr(modName) +
+                                           'except :\n'                              +
+                                           '  print(None)' )
+        except ESP32ControllerCodeException :
+            ver = None
+        self._agentVersion = (ver if ver == ESP32Controller.AGENT_VERSION else None)
+        return ver
+
+    # ---------------------------------------------------------------------------
+
+    async def _process(self, coro) :
+        # Runs a device command exclusively (the stream is not parsed meanwhile),
+        if not self._isConnected :
+            coro.close()
+            self._raiseConnectionError()
+        try :
+            self._beginProcess()
+        except :
+            coro.close()
+            raise
+        self._rxBuffer.clear()
+        try :
+            return await coro
+        finally :
+            self._endProcess()
+
+    # ---------------------------------------------------------------------------
+
+    def IsConnected(self) :
+        return self._isConnected
+
+    # ---------------------------------------------------------------------------
+
+    def IsProcessing(self) :
+        return self._inProcess
+
+    # ---------------------------------------------------------------------------
+
+    def GetDevicePort(self) :
+        return self._devicePort
+
+    # ---------------------------------------------------------------------------
+
+    def GetDeviceModule(self) :
+        return self._machineModule
+
+    # ---------------------------------------------------------------------------
+
+    def GetDeviceMCU(self) :
+        return self._machineMCU
+
+    # ---------------------------------------------------------------------------
+
+    def GetAgentVersion(self) :
+        return self._agentVersion
+
+    # ---------------------------------------------------------------------------
+
+    async def ExeCodeREPL(self, code, timeoutSec=1, resultFormat=RESULT_AUTO) :
+        if not code :
+            return None
+        return await self._process(self._exeCodeREPL(code, timeoutSec, resultFormat))
+
+    # ---------------------------------------------------------------------------
+
+    async def ExecProgram(self, code, codeFilename=None, cbProgress=None, bufSize=2048) :
+        if not code :
+            return
+        if not self._isConnected :
+            self._raiseConnectionError()
+        self._beginProcess()
+        if not codeFilename :
+            codeFilename = ESP32Controller.DEFAULT_CODE_FILENAME
+        self._inCodeFileName = codeFilename
+        if code.find('\n') == -1 :
+            code = 'exec(compile(%s,%s,"single"))' % (repr(code), repr(codeFilename))
+        self._rxBuffer.clear()
+        try :
+            await self._sendCodeToREPL(code.encode(), cbProgress, bufSize)
+        except :
+            self._endProcess()
+            raise
+        # From now on, the stream is parsed and the callbacks are called by the reader,
+        self._inCode = True
+        self._parser.Reset(inCode=True)
+        data = bytes(self._rxBuffer)
+        self._rxBuffer.clear()
+        if data :
+            self._onData(data)
+
+    # ---------------------------------------------------------------------------
+
+    async def WaitEndOfProgram(self, timeoutSec=None) :
+        try :
+            await asyncio.wait_for(self._processIdle.wait(), timeoutSec)
+            return True
+        except asyncio.TimeoutError :
+            return False
+
+    # ---------------------------------------------------------------------------
+
+    async def InterruptProgram(self) :
+        await self._write(b'\x03\x03')
+        return await self.WaitEndOfProgram(self.KILL_AFTER_INTERRUPT_SEC)
+
+    # ---------------------------------------------------------------------------
+
+    async def _sendStreamRepr(self, stream, size, remoteFilename, cbProgress, bufSize) :
+        try :
+            await self._exeCodeREPL('f=open(%s, "wb")' % repr(remoteFilename))
+        except ESP32ControllerCodeException :
+            raise ESP32ControllerException('Cannot create remote file "%s"' % remoteFilename)
+        progress = 0
+        while True :
+            buf = stream.read(bufSize)
+            if not buf :
+                break
+            progress += len(buf)
+            try :
+                await self._exeCodeREPL('f.write(%s)' % repr(buf), timeoutSec=3)
+            except ESP32ControllerCodeException :
+                raise ESP32ControllerException('Cannot write content to remote file "%s"' % remoteFilename)
+            if cbProgress :
+                cbProgress(progress, size)
+        try :
+            await self._exeCodeREPL( 'f.close()\n' +
+                                     'del f' )
+        except :
+            pass
+
+    # ---------------------------------------------------------------------------
+
+    async def _sendStreamFramed(self, stream, size, remoteFilename, cbProgress, bufSize) :
+        await self._sendCodeToREPL(ESP32Controller._framedSendCode(remoteFilename, False, bufSize, None).encode())
+        r = await self._serialRead(3, timeoutSec=3)
+        if r != b'\x06\xff\xff' :
+            try :
+                await self._readREPLResult(timeoutSec=3, prefix=r.decode('ISO-8859-1'))
+            except ESP32ControllerCodeException as ex :
+                if ESP32Controller._isFramedTransferUnsupported(str(ex)) :
+                    return False
+                raise ESP32ControllerException('Cannot create remote file "%s"' % remoteFilename)
+            raise ESP32ControllerException('Data error on serial connection.')
+        window   = self.TRANSFER_WINDOW
+        pending  = { }
+        base     = 0
+        nextSeq  = 0
+        eof      = False
+        progress = 0
+        errors   = 0
+        while True :
+            while not eof and nextSeq - base < window :
+                buf   = stream.read(bufSize)
+                frame = ESP32Controller._buildTransferFrame(nextSeq, buf)
+                pending[nextSeq] = (frame, len(buf))
+                await self._write(frame)
+                nextSeq += 1
+                eof      = not buf
+            if base == nextSeq :
+                break
+            try :
+                r = await self._serialRead(3, timeoutSec=self.TRANSFER_TIMEOUT_SEC)
+            except ESP32ControllerSerialConnException :
+                raise
+            except ESP32ControllerException :
+                r = None
+            if r and r[0] == 0x06 :
+                seq = base + ((int.from_bytes(r[1:], 'little') - base) & 0xFFFF)
+                while base <= seq and base < nextSeq :
+                    progress += pending.pop(base)[1]
+                    base     += 1
+                    errors    = 0
+                if cbProgress :
+                    cbProgress(progress, size)
+                continue
+            if r and r[0] == 0x04 :
+                await self._readREPLResult(timeoutSec=3, prefix=r.decode('ISO-8859-1'))
+                raise ESP32ControllerException('Data error on serial connection.')
+            # NAK, timeout or unexpected data: goes back to stop-and-wait and retransmits,
+            errors += 1
+            if errors > self.TRANSFER_MAX_RETRIES :
+                raise ESP32ControllerException('Cannot write content to remote file "%s"' % remoteFilename)
+            window = 1
+            if r and r[0] == 0x15 :
+                base = base + ((int.from_bytes(r[1:], 'little') - base) & 0xFFFF)
+            await self._serialDrain()
+            for seq in range(base, nextSeq) :
+                await self._write(pending[seq][0])
+        try :
+            await self._readREPLResult(timeoutSec=3)
+        except ESP32ControllerCodeException :
+            raise ESP32ControllerException('Cannot write content to remote file "%s"' % remoteFilename)
+        return True
+
+    # ---------------------------------------------------------------------------
+
+    async def _sendFile(self, localFilename, remoteFilename, cbProgress, bufSize) :
+        try :
+            fileSize = stat(localFilename)[6]
+            f = open(localFilename, 'rb')
+        except :
+            raise ESP32ControllerException('Cannot open local file "%s"' % localFilename)
+        try :
+            if cbProgress :
+                cbProgress(0, fileSize)
+            if not await self._sendStreamFramed(f, fileSize, remoteFilename, cbProgress, bufSize) :
+                f.seek(0)
+                await self._sendStreamRepr(f, fileSize, remoteFilename, cbProgress, bufSize)
+            return fileSize
+        finally :
+            f.close()
+
+    # ---------------------------------------------------------------------------
+
+    async def SendFile(self, localFilename, remoteFilename, cbProgress=None, bufSize=2048) :
+        return await self._process(self._sendFile(localFilename, remoteFilename, cbProgress, bufSize))
+
+    # ---------------------------------------------------------------------------
+
+    async def GetFlashRootPath(self) :
+        return await self._process(self._exeCodeREPL( 'from os import getcwd\n'             +
+                                                      '__d = getcwd()\n'                    +
+                                                      'print(repr(__d[:__d.index("/")]))\n' +
+                                                      'del __d\n' ))
+
+    # ---------------------------------------------------------------------------
+
+    async def GetListDir(self, path) :
+        entries = await self._process(self._exeCodeREPL( 'from os import ilistdir\n' +
+                                                         '__ent = [ ]\n'             +
+                                                         '__x = None\n'              +
+                                                         'for __x in ilistdir(%s) :\n' % repr(path) +
+                                                         '  __ent.append(__x)\n'     +
+                                                         'print(__ent)\n'            +
+                                                         'del __x\n'                 +
+                                                         'del __ent\n',
+                                                         timeoutSec = 3 ))
+        entries.sort( key = lambda entry: (entry[1] == 0x8000) )
+        r = { }
+        for x in entries :
+            r[x[0]] = (x[3] if x[1] == 0x8000 else None)
+        return r
+
+    # ---------------------------------------------------------------------------
+
+    async def GetInfos(self, names, timeoutSec=10, raiseOnError=True) :
+        agentModName = ( ESP32Controller.AGENT_MPY_FILENAME.rsplit('.', 1)[0] if self._agentVersion else None )
+        code         = ESP32Controller._buildInfosCode(names, agentModName)
+        results      = await self._process(self._exeCodeREPL(code, timeoutSec=timeoutSec, resultFormat=self.RESULT_JSON))
+        return ESP32Controller._infosFromResults(names, results, raiseOnError)
+
+    # ---------------------------------------------------------------------------
+
+    async def _getInfo(self, name) :
+        return (await self.GetInfos([name]))[name]
+
+    # ---------------------------------------------------------------------------
+
+    async def GetUniqueID(self) :
+        return await self._getInfo('UniqueID')
+
+    # ---------------------------------------------------------------------------
+
+    async def GetMHzFreq(self) :
+        return await self._getInfo('MHzFreq')
+
+    # ---------------------------------------------------------------------------
+
+    async def GetFlashSize(self) :
+        return await self._getInfo('FlashSize')
+
+    # ---------------------------------------------------------------------------
+
+    async def GetPlatformInfo(self) :
+        return await self._getInfo('PlatformInfo')
+
+    # ---------------------------------------------------------------------------
+
+    async def GetPartitions(self) :
+        return await self._getInfo('Partitions')
+
+    # ---------------------------------------------------------------------------
+
+    async def GetMemInfo(self) :
+        return await self._getInfo('MemInfo')
+
+    # ---------------------------------------------------------------------------
+
+    async def GetMCUTemp(self) :
+        return await self._getInfo('MCUTemp')
+
+    # ---------------------------------------------------------------------------
+
+    async def GetUptimeMin(self) :
+        return await self._getInfo('UptimeMin')
+
+    # ---------------------------------------------------------------------------
+
+    async def GetNetworksMinInfo(self) :
+        return await self._getInfo('NetworksMinInfo')
+
+# ===============================================================================
+# ===============================================================================
+# ===============================================================================
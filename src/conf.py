@@ -45,9 +45,30 @@ elif IS_WIN32 :
 DIRECTORY_CONTENT_JAMA_FUNCS     = Path('Jama Funcs')
 DIRECTORY_IMPORTED_JAMA_FUNCS    = DIRECTORY_FILES / 'Jama Funcs'
 JAMA_FUNCS_TEMPLATE_FILENAME     = Path('Jama Funcs - Template.py')
+LAST_DEVICE_PORTS_FILENAME       = DIRECTORY_FILES / 'Last Device Ports.json'
+DIRECTORY_MPY_CACHE              = DIRECTORY_FILES / 'MPY Cache'
+DIRECTORY_OUTPUT_CAPTURES        = DIRECTORY_FILES / 'Output Captures'
+CTRL_STATS_DUMP_FILENAME         = DIRECTORY_FILES / 'Controller Stats.jsonl'
 
 RECURRENT_TIMER_APP_SEC          = 5
 
+TERMINAL_BATCH_SEC               = 0.016
+TERMINAL_MAX_BYTES_PER_SEC       = 128*1024
+TERMINAL_MAX_PENDING_BYTES       = 256*1024
+
+OUTPUT_CAPTURE                   = False
+OUTPUT_CAPTURE_SEGMENT_BYTES     = 16*1024*1024
+OUTPUT_CAPTURE_MAX_BYTES         = 1024*1024*1024
+OUTPUT_CAPTURE_PAGE_BYTES        = 64*1024
+
+CTRL_STATS_DUMP                  = False
+CTRL_STATS_DUMP_SEC              = 60
+
+DEVICE_AGENT_AUTO_INSTALL        = False
+DEVICE_UPGRADE_BAUDRATE          = False
+DEVICE_PRECOMPILE_MPY            = False
+DEVICE_PROGRAM_CACHE             = False
+
 CONTENT_PATH                     = Path( ( sys.executable if IS_MACOS and IS_IN_BUNDLE
                                            else __file__ ) ) \
                                    .resolve() \
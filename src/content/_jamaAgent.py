@@ -0,0 +1,150 @@
+VERSION = 2
+
+def _jsonable(v) :
+    if isinstance(v, (bytes, bytearray)) :
+        from ubinascii import hexlify
+        return hexlify(v).decode()
+    if isinstance(v, (list, tuple)) :
+        return [_jsonable(x) for x in v]
+    if isinstance(v, dict) :
+        return { str(k) : _jsonable(x) for k, x in v.items() }
+    return v
+
+def dumps(v) :
+    import ujson
+    return ujson.dumps(_jsonable(v))
+
+def call(funcName, *args) :
+    return dumps(globals()[funcName](*args))
+
+def memInfo(gcCollect=False) :
+    import gc
+    if gcCollect :
+        gc.collect()
+    return [gc.mem_alloc(), gc.mem_free()]
+
+def mcuTemp() :
+    from esp32 import raw_temperature
+    return raw_temperature()
+
+def uptimeMs() :
+    from time import ticks_ms
+    return ticks_ms()
+
+def uniqueID() :
+    import machine, ubinascii
+    return ubinascii.hexlify(machine.unique_id()).decode()
+
+def freq() :
+    from machine import freq
+    return freq()
+
+def flashSize() :
+    from esp import flash_size
+    return flash_size()
+
+def platformInfo() :
+    import uos, sys
+    try :
+        import uplatform
+        platform = uplatform.platform()
+    except :
+        platform = None
+    try :
+        mpyVer = sys.implementation.mpy
+    except :
+        mpyVer = sys.implementation._mpy
+    return [platform, tuple(uos.uname()), mpyVer]
+
+def partitions() :
+    from esp32 import Partition
+    p = [ ]
+    for x in Partition.find(Partition.TYPE_APP) :
+        p.append(x.info())
+    for x in Partition.find(Partition.TYPE_DATA) :
+        p.append(x.info())
+    return p
+
+def pinsState() :
+    from machine import Pin
+    p = { }
+    for i in range(50) :
+        try :
+            p[i] = Pin(i).value()
+        except :
+            pass
+    return p
+
+def listDir(path) :
+    from os import ilistdir
+    return [x for x in ilistdir(path)]
+
+def networksMinInfo() :
+    import network
+    r = dict()
+    try :
+        r["staRSSI"] = network.WLAN(network.STA_IF).status("rssi")
+    except :
+        pass
+    try :
+        r["apStaCount"] = len(network.WLAN(network.AP_IF).status("stations"))
+    except :
+        pass
+    try :
+        r["ethStatus"] = network.LAN().status()
+    except :
+        pass
+    return r
+
+def _wlan(ap) :
+    import network
+    return network.WLAN(network.AP_IF if ap else network.STA_IF)
+
+def wifiActive(ap=False) :
+    return _wlan(ap).active()
+
+def wifiMacAddr(ap=False) :
+    return _wlan(ap).config("mac")
+
+def wifiConfig(ap=False) :
+    wl = _wlan(ap)
+    try :
+        ssid = wl.config("ssid")
+    except :
+        ssid = wl.config("essid")
+    return [ssid, wl.ifconfig()]
+
+def apClientsAddr() :
+    return [x[0] for x in _wlan(True).status("stations")]
+
+def ethInfo() :
+    import network
+    if not hasattr(network, "LAN") :
+        return None
+    try :
+        lan = network.LAN()
+        return [lan.config("mac"), lan.status(), lan.ifconfig()]
+    except :
+        return [ ]
+
+def bleActive() :
+    import bluetooth
+    return bluetooth.BLE().active()
+
+def internetOk() :
+    import network
+    try :
+        lanOk = network.LAN().status() == 5
+    except :
+        lanOk = False
+    if lanOk or network.WLAN(network.STA_IF).isconnected() :
+        import socket
+        s = socket.socket()
+        try :
+            s.connect(socket.getaddrinfo("google.com", 80)[0][-1])
+            return True
+        except :
+            return False
+        finally :
+            s.close()
+    return False
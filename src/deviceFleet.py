@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+
+# ============================================= #
+#                                               #
+# Copyright © 2023 JC`zic (Jean-Christophe Bos) #
+#             jczic.bos@gmail.com               #
+#                                               #
+# ============================================= #
+
+
+from   esp32Controller   import ESP32Controller, ESP32ControllerException, \
+                                ESP32ControllerCodeException, ESP32ControllerAlreadyProcessingException
+from   time              import time
+from   queue             import SimpleQueue, Empty
+from   threading         import Condition
+from   _thread           import start_new_thread
+
+
+# ===============================================================================
+# ===( DeviceFleetException )====================================================
+# ===============================================================================
+
+class DeviceFleetException(Exception) :
+    pass
+
+# ===============================================================================
+# ===( DeviceFleet )=============================================================
+# ===============================================================================
+
+class DeviceFleet :
+
+    CONNECT_TIMEOUT_SEC      = 3
+    RECONNECT_INTERVAL_SEC   = 3
+    HEALTH_CHECK_SEC         = 5
+    OPEN_TIMEOUT_SEC         = 30
+
+    _JOB_RECONNECT           = 'reconnect'
+    _JOB_STOP                = 'stop'
+
+    # ---------------------------------------------------------------------------
+
+    def __init__( self,
+                  devicePorts,
+                  baudrate             = 115200,
+                  upgradeBaudrate      = False,
+                  autoReconnect        = True,
+                  onDeviceConnected    = None,
+                  onDeviceDisconnected = None,
+                  onTerminalRecv       = None,
+                  onEndOfProgram       = None,
+                  onProgramError       = None,
+                  onProgramStopped     = None,
+                  onDeviceReset        = None ) :
+
+        self._baudrate             = baudrate
+        self._upgradeBaudrate      = upgradeBaudrate
+        self._autoReconnect        = autoReconnect
+        self._onDeviceConnected    = onDeviceConnected
+        self._onDeviceDisconnected = onDeviceDisconnected
+        self._onTerminalRecv       = onTerminalRecv
+        self._onEndOfProgram       = onEndOfProgram
+        self._onProgramError       = onProgramError
+        self._onProgramStopped     = onProgramStopped
+        self._onDeviceReset        = onDeviceReset
+        self._running              = True
+        self._cond                 = Condition()
+        self._devices              = { }
+
+        for port in devicePorts :
+            self._devices[port] = dict( port       = port,
+                                        ctrl       = None,
+                                        queue      = SimpleQueue(),
+                                        attempted  = False,
+                                        running    = True,
+                                        lastError  = None,
+                                        calls      = 0,
+                                        errors     = 0,
+                                        totalSec   = 0.0,
+                                        maxSec     = 0.0,
+                                        reconnects = 0 )
+        for dev in self._devices.values() :
+            start_new_thread(self._threadDevice, (dev, ))
+        # Waits for the first connection attempt of each device (done in parallel),
+        with self._cond :
+            self._cond.wait_for( lambda : all(dev['attempted'] for dev in self._devices.values()),
+                                 timeout = self.OPEN_TIMEOUT_SEC )
+
+    # ---------------------------------------------------------------------------
+
+    def __del__(self) :
+        self.Close()
+
+    # ---------------------------------------------------------------------------
+
+    def _connectDevice(self, dev) :
+        port = dev['port']
+        try :
+            dev['ctrl'] = ESP32Controller( devicePort        = port,
+                                           baudrate          = self._baudrate,
+                                           connectTimeoutSec = self.CONNECT_TIMEOUT_SEC,
+                                           upgradeBaudrate   = self._upgradeBaudrate,
+                                           onSerialConnError = lambda ctrl : self._onSerialConnError(dev),
+                                           onTerminalRecv    = lambda ctrl, text : self._callback(self._onTerminalRecv, port, text),
+                                           onEndOfProgram    = lambda ctrl : self._callback(self._onEndOfProgram, port),
+                                           onProgramError    = lambda ctrl, err : self._callback(self._onProgramError, port, err),
+                                           onProgramStopped  = lambda ctrl : self._callback(self._onProgramStopped, port),
+                                           onDeviceReset     = lambda ctrl : self._callback(self._onDeviceReset, port) )
+            dev['lastError'] = None
+        except Exception as ex :
+            dev['ctrl']      = None
+            dev['lastError'] = str(ex)
+        with self._cond :
+            dev['attempted'] = True
+            self._cond.notify_all()
+        if dev['ctrl'] :
+            self._callback(self._onDeviceConnected, port)
+        return (dev['ctrl'] is not None)
+
+    # ---------------------------------------------------------------------------
+
+    def _disconnectDevice(self, dev, kill=False) :
+        ctrl, dev['ctrl'] = dev['ctrl'], None
+        if ctrl :
+            try :
+                ctrl.Close(kill)
+            except :
+                pass
+            self._callback(self._onDeviceDisconnected, dev['port'])
+
+    # ---------------------------------------------------------------------------
+
+    def _onSerialConnError(self, dev) :
+        # Called from the controller reader thread, the device thread does the reconnection,
+        dev['queue'].put(self._JOB_RECONNECT)
+
+    # ---------------------------------------------------------------------------
+
+    def _callback(self, cb, port, *args) :
+        if cb :
+            try :
+                cb(port, *args)
+            except :
+                pass
+
+    # ---------------------------------------------------------------------------
+
+    def _threadDevice(self, dev) :
+        self._connectDevice(dev)
+        while self._running :
+            if not dev['ctrl'] and self._autoReconnect :
+                try :
+                    job = dev['queue'].get(timeout=self.RECONNECT_INTERVAL_SEC)
+                except Empty :
+                    job = None
+                if job is None or job == self._JOB_RECONNECT :
+                    if self._running and self._connectDevice(dev) :
+                        dev['reconnects'] += 1
+                    continue
+            else :
+                try :
+                    job = dev['queue'].get(timeout=self.HEALTH_CHECK_SEC)
+                except Empty :
+                    self._checkDevice(dev)
+                    continue
+            if job == self._JOB_STOP :
+                break
+            if job == self._JOB_RECONNECT :
+                self._disconnectDevice(dev, kill=True)
+                continue
+            self._runJob(dev, *job)
+        self._disconnectDevice(dev)
+        with self._cond :
+            dev['running'] = False
+            self._cond.notify_all()
+
+    # ---------------------------------------------------------------------------
+
+    def _checkDevice(self, dev) :
+        ctrl = dev['ctrl']
+        if ctrl and not ctrl.IsProcessing() :
+            try :
+                ctrl.ExeCodeREPL('0', resultFormat=ESP32Controller.RESULT_LITERAL)
+            except (ESP32ControllerCodeException, ESP32ControllerAlreadyProcessingException) :
+                pass
+            except ESP32ControllerException as ex :
+                # The device no longer responds, it will be reconnected,
+                dev['lastError'] = str(ex)
+                self._disconnectDevice(dev, kill=True)
+
+    # ---------------------------------------------------------------------------
+
+    def _runJob(self, dev, funcName, args, kwargs, batch) :
+        startTime = time()
+        try :
+            if not dev['ctrl'] :
+                raise DeviceFleetException( 'Device on port "%s" not connected (%s).' % ( dev['port'],
+                                                                                         dev['lastError'] ) )
+            r = dict( ok    = True,
+                      value = getattr(dev['ctrl'], funcName)(*args, **kwargs) )
+        except Exception as ex :
+            r = dict( ok    = False,
+                      error = '%s: %s' % (type(ex).__name__, ex) )
+        sec          = time() - startTime
+        r['seconds'] = round(sec, 4)
+        dev['calls']    += 1
+        dev['errors']   += (0 if r['ok'] else 1)
+        dev['totalSec'] += sec
+        dev['maxSec']    = max(dev['maxSec'], sec)
+        with batch['cond'] :
+            batch['results'][dev['port']] = r
+            batch['pending'] -= 1
+            batch['cond'].notify_all()
+
+    # ---------------------------------------------------------------------------
+
+    def _getPorts(self, ports) :
+        if ports is None :
+            return list(self._devices.keys())
+        for port in ports :
+            if port not in self._devices :
+                raise DeviceFleetException('Unknown device port "%s".' % port)
+        return list(ports)
+
+    # ---------------------------------------------------------------------------
+
+    def _dispatch(self, jobs, waitTimeoutSec) :
+        # jobs: { port: (funcName, args, kwargs) }, each device thread runs its own job,
+        if not self._running :
+            raise DeviceFleetException('Device fleet closed.')
+        for funcName, __, __ in jobs.values() :
+            if not funcName[:1].isupper() or not callable(getattr(ESP32Controller, funcName, None)) :
+                raise DeviceFleetException('Unknown controller function "%s".' % funcName)
+        batch = dict( results = { },
+                      pending = len(jobs),
+                      cond    = Condition() )
+        for port, job in jobs.items() :
+            self._devices[port]['queue'].put(job + (batch, ))
+        with batch['cond'] :
+            batch['cond'].wait_for(lambda : not batch['pending'], timeout=waitTimeoutSec)
+            results = dict(batch['results'])
+        timeout = dict( ok      = False,
+                        error   = 'Timeout',
+                        seconds = waitTimeoutSec )
+        return { port : results.get(port, timeout) for port in jobs }
+
+    # ---------------------------------------------------------------------------
+
+    def Run(self, funcName, *args, ports=None, waitTimeoutSec=None, **kwargs) :
+        return self._dispatch( { port : (funcName, args, kwargs) for port in self._getPorts(ports) },
+                               waitTimeoutSec )
+
+    # ---------------------------------------------------------------------------
+
+    def ExeCodeREPL(self, code, timeoutSec=1, ports=None) :
+        return self.Run('ExeCodeREPL', code, timeoutSec, ports=ports)
+
+    # ---------------------------------------------------------------------------
+
+    def ExecProgram(self, code, codeFilename=None, ports=None) :
+        return self.Run('ExecProgram', code, codeFilename, ports=ports)
+
+    # ---------------------------------------------------------------------------
+
+    def InterruptProgram(self, ports=None) :
+        # Not queued: the device threads can be blocked in a running program,
+        r = { }
+        for port in self._getPorts(ports) :
+            ctrl = self._devices[port]['ctrl']
+            try :
+                if not ctrl :
+                    raise DeviceFleetException('Device on port "%s" not connected.' % port)
+                ctrl.InterruptProgram()
+                r[port] = dict(ok=True, value=None)
+            except Exception as ex :
+                r[port] = dict(ok=False, error='%s: %s' % (type(ex).__name__, ex))
+        return r
+
+    # ---------------------------------------------------------------------------
+
+    def SendFile(self, localFilename, remoteFilename, ports=None) :
+        return self.Run('SendFile', localFilename, remoteFilename, ports=ports)
+
+    # ---------------------------------------------------------------------------
+
+    def RecvFile(self, remoteFilename, localFilenameFormat, ports=None) :
+        # localFilenameFormat can contain "{port}" to receive one file per device,
+        jobs = { }
+        for port in self._getPorts(ports) :
+            localFilename = localFilenameFormat.format(port=port.replace('/', '_').replace('\\', '_'))
+            jobs[port]    = ('RecvFile', (remoteFilename, localFilename), { })
+        return self._dispatch(jobs, None)
+
+    # ---------------------------------------------------------------------------
+
+    def GetFileContent(self, remoteFilename, ports=None) :
+        return self.Run('GetFileContent', remoteFilename, ports=ports)
+
+    # ---------------------------------------------------------------------------
+
+    def PutFileContent(self, remoteFilename, contentData, ports=None) :
+        return self.Run('PutFileContent', remoteFilename, contentData, ports=ports)
+
+    # ---------------------------------------------------------------------------
+
+    def SyncDir(self, localPath, remotePath, ports=None, **kwargs) :
+        return self.Run('SyncDir', localPath, remotePath, ports=ports, **kwargs)
+
+    # ---------------------------------------------------------------------------
+
+    def GetPorts(self) :
+        return list(self._devices.keys())
+
+    # ---------------------------------------------------------------------------
+
+    def GetConnectedPorts(self) :
+        return [ port for port, dev in self._devices.items() if dev['ctrl'] ]
+
+    # ---------------------------------------------------------------------------
+
+    def GetController(self, port) :
+        return self._devices[self._getPorts([port])[0]]['ctrl']
+
+    # ---------------------------------------------------------------------------
+
+    def GetStats(self) :
+        devices = { }
+        for port, dev in self._devices.items() :
+            devices[port] = dict( connected  = (dev['ctrl'] is not None),
+                                  lastError  = dev['lastError'],
+                                  calls      = dev['calls'],
+                                  errors     = dev['errors'],
+                                  avgSec     = round(dev['totalSec'] / max(dev['calls'], 1), 4),
+                                  maxSec     = round(dev['maxSec'], 4),
+                                  reconnects = dev['reconnects'] )
+        calls = sum(x['calls'] for x in devices.values())
+        return dict( devices   = devices,
+                     connected = sum(1 for x in devices.values() if x['connected']),
+                     calls     = calls,
+                     errors    = sum(x['errors'] for x in devices.values()),
+                     avgSec    = round(sum(dev['totalSec'] for dev in self._devices.values()) / max(calls, 1), 4),
+                     maxSec    = max([x['maxSec'] for x in devices.values()] + [0]) )
+
+    # ---------------------------------------------------------------------------
+
+    def Close(self) :
+        if self._running :
+            self._running = False
+            for dev in self._devices.values() :
+                dev['queue'].put(self._JOB_STOP)
+            with self._cond :
+                self._cond.wait_for( lambda : not any(dev['running'] for dev in self._devices.values()),
+                                     timeout = self.CONNECT_TIMEOUT_SEC + 2 )
+
+# ===============================================================================
+# ===============================================================================
+# ===============================================================================
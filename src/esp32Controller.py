@@ -11,10 +11,26 @@
 from   serial            import Serial
 from   serial.tools      import list_ports
 from   time              import sleep, time
-from   os                import stat
-from   binascii          import hexlify
+from   os                import stat, pipe, read as osRead, write as osWrite, close as osClose, \
+                                walk, makedirs, remove as osRemove, scandir
+from   stat              import S_ISDIR
+from   os.path           import join as pathJoin, isdir, relpath, realpath
+from   shutil            import rmtree
+from   fnmatch           import fnmatch
+from   hashlib           import sha256
+from   select            import select
+from   io                import BytesIO, RawIOBase
+from   struct            import pack, unpack
+from   binascii          import hexlify, unhexlify, crc32, a2b_base64, b2a_base64
+from   ast               import literal_eval
+from   json              import loads as jsonLoads, dumps as jsonDumps
 from   _thread           import allocate_lock, start_new_thread
-from   threading         import Event
+from   threading         import Condition
+from   codecs            import getincrementaldecoder
+from   zlib              import compressobj, decompressobj, DEFLATED
+from   errno             import EACCES, EINVAL, EIO
+from   bisect            import bisect_left
+from   functools         import wraps
 
 # ===============================================================================
 
@@ -30,19 +46,666 @@ class ESP32ControllerAlreadyProcessingException(ESP32ControllerException) :
 class ESP32ControllerCodeException(ESP32ControllerException) :
     pass
 
+class ESP32ControllerDecodeException(ESP32ControllerException) :
+    pass
+
+# ===============================================================================
+
+class ESP32REPLStreamParser :
+
+    # ---------------------------------------------------------------------------
+
+    STATE_IDLE    = 'idle'      # Not in code: everything received is terminal output,
+    STATE_STDOUT  = 'stdout'    # In code (after "OK"): program output until \x04,
+    STATE_STDERR  = 'stderr'    # Error output until the second \x04,
+    STATE_PROMPT  = 'prompt'    # Waiting for the raw REPL ">" after \x04\x04 (banner after raw-paste),
+
+    EVENT_OUTPUT  = 'output'
+    EVENT_END     = 'end'
+    EVENT_ERROR   = 'error'
+    EVENT_RESET   = 'reset'
+    EVENT_REQUEST = 'request'   # Host mount request line sent by the code after \x18,
+
+    RESET_PROMPT    = b'\r\n>>> '
+    RAW_REPL_BANNER = b'raw REPL; CTRL-B to exit\r\n'
+
+    # ---------------------------------------------------------------------------
+
+    def __init__(self) :
+        self._decoder = getincrementaldecoder('UTF-8')(errors='replace')
+        self.Reset()
+
+    # ---------------------------------------------------------------------------
+
+    def Reset(self, inCode=False, mountRequests=False) :
+        # Host mount requests are only parsed while a host directory is mounted,
+        # otherwise \x18 is a program output byte like any other,
+        self._state         = (self.STATE_STDOUT if inCode else self.STATE_IDLE)
+        self._mountRequests = mountRequests
+        self._stderr        = [ ]
+        self._prompt        = [ ]
+        self._request       = None
+        self._tail          = b''
+        self._decoder.reset()
+
+    # ---------------------------------------------------------------------------
+
+    def GetState(self) :
+        return self._state
+
+    # ---------------------------------------------------------------------------
+
+    def _flushOutput(self, out, events, final=False) :
+        if out :
+            data       = b''.join(out)
+            self._tail = (self._tail + data)[-len(self.RESET_PROMPT):]
+            out.clear()
+        else :
+            data = b''
+        text = self._decoder.decode(data, final)
+        if text :
+            events.append((self.EVENT_OUTPUT, text))
+
+    # ---------------------------------------------------------------------------
+
+    def Feed(self, data) :
+        events = [ ]
+        out    = [ ]
+        size   = len(data)
+        i      = 0
+        while i < size :
+            if self._request is not None :
+                # The code waits for the response, nothing else follows the request line,
+                j = data.find(b'\n', i)
+                if j == -1 :
+                    self._request.append(data[i:])
+                    break
+                self._request.append(data[i:j])
+                events.append((self.EVENT_REQUEST, b''.join(self._request).rstrip(b'\r')))
+                self._request = None
+                i = j + 1
+                continue
+            if self._state == self.STATE_PROMPT :
+                # Firmware sends "raw REPL; CTRL-B to exit\r\n" before ">" after a raw-paste execution,
+                j = data.find(b'>', i)
+                if j == -1 :
+                    self._prompt.append(data[i:])
+                    break
+                self._prompt.append(data[i:j])
+                text         = b''.join(self._prompt)
+                self._prompt = [ ]
+                if text.endswith(self.RAW_REPL_BANNER) :
+                    text = text[:-len(self.RAW_REPL_BANNER)]
+                if text :
+                    out.append(text)
+                i = j + 1
+                self._flushOutput(out, events, final=True)
+                err          = b''.join(self._stderr)
+                self._stderr = [ ]
+                self._state  = self.STATE_IDLE
+                if err :
+                    events.append((self.EVENT_ERROR, err.decode('UTF-8', 'replace')))
+                else :
+                    events.append((self.EVENT_END, None))
+                continue
+            j = data.find(b'\x04', i)
+            if j == -1 :
+                j = size
+            if self._state == self.STATE_STDOUT and self._mountRequests :
+                k = data.find(b'\x18', i, j)
+                if k != -1 :
+                    if k > i :
+                        out.append(data[i:k])
+                    self._flushOutput(out, events)
+                    self._request = [ ]
+                    i = k + 1
+                    continue
+            if self._state == self.STATE_STDERR :
+                self._stderr.append(data[i:j])
+            elif j > i :
+                out.append(data[i:j])
+            if j < size :
+                if self._state == self.STATE_STDOUT :
+                    self._state = self.STATE_STDERR
+                elif self._state == self.STATE_STDERR :
+                    self._state = self.STATE_PROMPT
+            i = j + 1
+        reset = False
+        if out and self._state in (self.STATE_IDLE, self.STATE_STDOUT) :
+            size = len(self.RESET_PROMPT)
+            last = b''.join(out)
+            if (self._tail + last).endswith(self.RESET_PROMPT) :
+                # Soft reboot banner ends with the friendly REPL prompt,
+                cut = min(size, len(last))
+                out = [ last[:-cut] + self.RESET_PROMPT[size-cut:size-4] ]
+                reset = True
+        self._flushOutput(out, events, final=reset)
+        if reset :
+            self._tail   = b''
+            self._stderr = [ ]
+            self._state  = self.STATE_IDLE
+            events.append((self.EVENT_RESET, None))
+        return events
+
+# ===============================================================================
+
+class ESP32RemoteFile(RawIOBase) :
+
+    # ---------------------------------------------------------------------------
+
+    def __init__(self, chunks, onClose) :
+        super().__init__()
+        self._chunks  = chunks
+        self._onClose = onClose
+        self._stats   = None
+        self._pos     = 0
+        self._buf     = b''
+        try :
+            # Gets the first chunk now so that opening errors are raised here,
+            self._buf = self._nextChunk()
+        except :
+            self.close()
+            raise
+
+    # ---------------------------------------------------------------------------
+
+    def _nextChunk(self) :
+        if self._chunks is None :
+            return b''
+        try :
+            return next(self._chunks)
+        except StopIteration as ex :
+            self._stats  = ex.value
+            self._chunks = None
+            self._endTransfer()
+            return b''
+
+    # ---------------------------------------------------------------------------
+
+    def _endTransfer(self) :
+        onClose, self._onClose = self._onClose, None
+        if onClose :
+            onClose()
+
+    # ---------------------------------------------------------------------------
+
+    def readable(self) :
+        return True
+
+    # ---------------------------------------------------------------------------
+
+    def read(self, size=-1) :
+        if size is None or size < 0 :
+            return self.readall()
+        if self.closed :
+            raise ValueError('I/O operation on closed file.')
+        while self._pos >= len(self._buf) :
+            self._buf = self._nextChunk()
+            self._pos = 0
+            if not self._buf :
+                return b''
+        b          = self._buf[self._pos : self._pos + size]
+        self._pos += len(b)
+        return b
+
+    # ---------------------------------------------------------------------------
+
+    def readinto(self, b) :
+        data          = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    # ---------------------------------------------------------------------------
+
+    def readall(self) :
+        return b''.join(self)
+
+    # ---------------------------------------------------------------------------
+
+    def __iter__(self) :
+        if self.closed :
+            raise ValueError('I/O operation on closed file.')
+        if self._pos < len(self._buf) :
+            b         = self._buf[self._pos:]
+            self._buf = b''
+            self._pos = 0
+            yield b
+        while True :
+            b = self._nextChunk()
+            if not b :
+                break
+            yield b
+
+    # ---------------------------------------------------------------------------
+
+    def close(self) :
+        if not self.closed :
+            chunks, self._chunks = self._chunks, None
+            try :
+                if chunks :
+                    chunks.close()
+            finally :
+                self._endTransfer()
+                super().close()
+
+    # ---------------------------------------------------------------------------
+
+    def GetStats(self) :
+        return self._stats
+
+# ===============================================================================
+
+class ESP32SendStream :
+
+    # ---------------------------------------------------------------------------
+
+    def __init__(self, stream, prefix, wbits=None) :
+        # Source of an upload whose first bytes were already read from the stream (prefix),
+        # with wbits, the content is deflated on the fly as the sender reads it,
+        self._stream  = stream
+        self._prefix  = prefix
+        self._z       = (compressobj(9, DEFLATED, -wbits) if wbits else None)
+        self._buf     = b''
+        self._eof     = False
+        self._srcPos  = 0
+        self._outPos  = 0
+        self._outEnds = [ ]
+        self._srcEnds = [ ]
+
+    # ---------------------------------------------------------------------------
+
+    def _readSource(self, size) :
+        if self._prefix :
+            b            = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+        else :
+            b = self._stream.read(size)
+        self._srcPos += len(b)
+        return b
+
+    # ---------------------------------------------------------------------------
+
+    def read(self, size) :
+        if not self._z :
+            return self._readSource(size)
+        while len(self._buf) < size and not self._eof :
+            b = self._readSource(size)
+            if b :
+                b = self._z.compress(b)
+            else :
+                b         = self._z.flush()
+                self._eof = True
+            self._buf    += b
+            self._outPos += len(b)
+            self._outEnds.append(self._outPos)
+            self._srcEnds.append(self._srcPos)
+        b         = self._buf[:size]
+        self._buf = self._buf[size:]
+        return b
+
+    # ---------------------------------------------------------------------------
+
+    def GetSourcePos(self, outPos) :
+        # Source bytes read to produce the first outPos bytes of output,
+        if not self._z :
+            return outPos
+        i = bisect_left(self._outEnds, outPos)
+        return (self._srcEnds[i] if i < len(self._srcEnds) else self._srcPos)
+
+# ===============================================================================
+
+class ESP32DirTreeCache :
+
+    # ---------------------------------------------------------------------------
+
+    def __init__(self) :
+        self._dirs = { }
+        self._lock = allocate_lock()
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _normPath(path) :
+        return path.rstrip('/')
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _splitPath(path) :
+        path = ESP32DirTreeCache._normPath(path)
+        i    = path.rfind('/')
+        return path[:max(i, 0)], path[i+1:]
+
+    # ---------------------------------------------------------------------------
+
+    def _removeSubTree(self, path) :
+        path = self._normPath(path)
+        for dirPath in list(self._dirs) :
+            if dirPath == path or dirPath.startswith(path + '/') :
+                del self._dirs[dirPath]
+
+    # ---------------------------------------------------------------------------
+
+    def Clear(self) :
+        with self._lock :
+            self._dirs.clear()
+
+    # ---------------------------------------------------------------------------
+
+    def Update(self, tree) :
+        # tree comes from ESP32Controller.GetDirTree,
+        with self._lock :
+            for dirPath, entries in tree.items() :
+                self._dirs[self._normPath(dirPath)] = { name : x[0] for name, x in entries.items() }
+
+    # ---------------------------------------------------------------------------
+
+    def GetListDir(self, path) :
+        # Same result as ESP32Controller.GetListDir or None if the directory is not cached,
+        with self._lock :
+            entries = self._dirs.get(self._normPath(path))
+            if entries is None :
+                return None
+            return dict(sorted(entries.items(), key=lambda x : x[1] is not None))
+
+    # ---------------------------------------------------------------------------
+
+    def SetEntry(self, path, size=None) :
+        dirPath, name = self._splitPath(path)
+        with self._lock :
+            if dirPath in self._dirs :
+                self._dirs[dirPath][name] = size
+            if size is None :
+                self._removeSubTree(path)
+                self._dirs[self._normPath(path)] = { }
+
+    # ---------------------------------------------------------------------------
+
+    def RemoveEntry(self, path) :
+        dirPath, name = self._splitPath(path)
+        with self._lock :
+            if dirPath in self._dirs :
+                self._dirs[dirPath].pop(name, None)
+            self._removeSubTree(path)
+
+    # ---------------------------------------------------------------------------
+
+    def MoveEntry(self, srcPath, dstPath) :
+        srcDir, srcName = self._splitPath(srcPath)
+        dstDir, dstName = self._splitPath(dstPath)
+        srcPath         = self._normPath(srcPath)
+        dstPath         = self._normPath(dstPath)
+        with self._lock :
+            entries = self._dirs.get(srcDir)
+            if entries is None or srcName not in entries :
+                # Unknown element type, the directories concerned will be fetched again,
+                self._dirs.pop(dstDir, None)
+                self._removeSubTree(srcPath)
+                self._removeSubTree(dstPath)
+                return
+            size = entries.pop(srcName)
+            if dstDir in self._dirs :
+                self._dirs[dstDir][dstName] = size
+            self._removeSubTree(dstPath)
+            for dirPath in list(self._dirs) :
+                if dirPath == srcPath or dirPath.startswith(srcPath + '/') :
+                    self._dirs[dstPath + dirPath[len(srcPath):]] = self._dirs.pop(dirPath)
+
+    # ---------------------------------------------------------------------------
+
+    def InvalidateEntry(self, path) :
+        # After a failed operation, the element and its parent directory are forgotten,
+        dirPath, _ = self._splitPath(path)
+        with self._lock :
+            self._dirs.pop(dirPath, None)
+            self._removeSubTree(path)
+
+# ===============================================================================
+
+class ESP32HostMount :
+
+    # ---------------------------------------------------------------------------
+
+    def __init__(self, localPath, mountPoint) :
+        self._localPath  = realpath(localPath)
+        self._mountPoint = mountPoint
+        self._requests   = 0
+        self._bytesRead  = 0
+        self._handlers   = dict( stat     = self._stat,
+                                 ilistdir = self._ilistdir,
+                                 read     = self._read )
+
+    # ---------------------------------------------------------------------------
+
+    def GetLocalPath(self) :
+        return self._localPath
+
+    # ---------------------------------------------------------------------------
+
+    def GetMountPoint(self) :
+        return self._mountPoint
+
+    # ---------------------------------------------------------------------------
+
+    def _localFilename(self, path) :
+        # Device paths are relative to the mount point and cannot leave the local directory,
+        filename = realpath(pathJoin(self._localPath, *[x for x in path.split('/') if x]))
+        if filename != self._localPath and not filename.startswith(pathJoin(self._localPath, '')) :
+            raise OSError(EACCES, 'EACCES')
+        return filename
+
+    # ---------------------------------------------------------------------------
+
+    def _stat(self, path) :
+        st = stat(self._localFilename(path))
+        return jsonDumps([ (0x4000 if S_ISDIR(st.st_mode) else 0x8000),
+                           st.st_size,
+                           int(st.st_mtime) ]).encode()
+
+    # ---------------------------------------------------------------------------
+
+    def _ilistdir(self, path) :
+        entries = [ ]
+        for e in sorted(scandir(self._localFilename(path)), key=lambda e : e.name) :
+            if e.is_dir() :
+                entries.append([e.name, 0x4000, 0])
+            else :
+                entries.append([e.name, 0x8000, e.stat().st_size])
+        return jsonDumps(entries).encode()
+
+    # ---------------------------------------------------------------------------
+
+    def _read(self, path, offset, size) :
+        with open(self._localFilename(path), 'rb') as f :
+            f.seek(offset)
+            data = f.read(size)
+        self._bytesRead += len(data)
+        return data
+
+    # ---------------------------------------------------------------------------
+
+    def Serve(self, request) :
+        # Returns the response to a request line: a signed 32 bits size then the data,
+        # or the negative errno raised on the device as OSError,
+        self._requests += 1
+        try :
+            args    = jsonLoads(request)
+            handler = self._handlers.get(args[0])
+            if not handler :
+                raise OSError(EINVAL, 'EINVAL')
+            data = handler(*args[1:])
+            return pack('<i', len(data)) + data
+        except OSError as ex :
+            return pack('<i', -(ex.errno or EIO))
+        except Exception :
+            return pack('<i', -EINVAL)
+
+    # ---------------------------------------------------------------------------
+
+    def GetStats(self) :
+        return dict( localPath  = self._localPath,
+                     mountPoint = self._mountPoint,
+                     requests   = self._requests,
+                     bytesRead  = self._bytesRead )
+
+# ===============================================================================
+
+class ESP32StatsLock :
+
+    # ---------------------------------------------------------------------------
+
+    def __init__(self, name, onWait) :
+        self._lock         = allocate_lock()
+        self._name         = name
+        self._onWait       = onWait
+        self.Acquisitions  = 0
+
+    # ---------------------------------------------------------------------------
+
+    def acquire(self, blocking=True, timeout=-1) :
+        # Only the contended acquisitions are timed, the free ones are counted,
+        if not self._lock.acquire(False) :
+            if not blocking :
+                return False
+            startTime = time()
+            if not self._lock.acquire(True, timeout) :
+                return False
+            self._onWait(self._name, time() - startTime)
+        self.Acquisitions += 1
+        return True
+
+    # ---------------------------------------------------------------------------
+
+    def release(self) :
+        self._lock.release()
+
+    # ---------------------------------------------------------------------------
+
+    def locked(self) :
+        return self._lock.locked()
+
+    # ---------------------------------------------------------------------------
+
+    def __enter__(self) :
+        return self.acquire()
+
+    # ---------------------------------------------------------------------------
+
+    def __exit__(self, excType, excValue, traceback) :
+        self.release()
+
+# ===============================================================================
+
+def _timedREPL(method) :
+    # Records the duration of a public controller method as "repl.<Method>",
+    name = 'repl.' + method.__name__
+    @wraps(method)
+    def timed(self, *args, **kwargs) :
+        startTime = time()
+        r         = method(self, *args, **kwargs)
+        self._addLatency(name, time() - startTime)
+        return r
+    return timed
+
 # ===============================================================================
 
 class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    RAW_REPL_PROMPT          = ESP32REPLStreamParser.RAW_REPL_BANNER + b'>'
+    RAW_PASTE_RESULT_END     = b'\x04' + RAW_REPL_PROMPT
+
     BOOT_CONFIG_MPY_FILENAME = '_jamaBootCfg.py'
+    AGENT_MPY_FILENAME       = '_jamaAgent.py'
+    AGENT_VERSION            = 2
+    EXEC_MPY_FILENAME        = '_jamaExec.mpy'
+    PROG_CACHE_DIR           = '/.jama_cache'
+    PROG_CACHE_MIN_SIZE      = 1024
+    PROG_CACHE_MIN_FREE      = 128*1024
+    PROG_CACHE_MAX_FILES     = 32
+    PROG_CACHE_TIMEOUT_SEC   = 5
     
     DEFAULT_CODE_FILENAME    = '<TERMINAL>'
     STDIN_CODE_FILENAME      = '<stdin>'
     KILL_AFTER_INTERRUPT_SEC = 5
+    READER_IDLE_TIMEOUT_SEC  = 0.500
+
+    RESULT_TEXT              = 'text'
+    RESULT_LITERAL           = 'literal'
+    RESULT_JSON              = 'json'
+    RESULT_AUTO              = 'auto'
+
+    # Device function making a value JSON encodable (bytes as hex, str dict keys),
+    DEVICE_JSONABLE_FUNC     = ( 'def __j(v) :\n'                                      +
+                                 '  if isinstance(v, (bytes, bytearray)) :\n'          +
+                                 '    from ubinascii import hexlify\n'                 +
+                                 '    return hexlify(v).decode()\n'                    +
+                                 '  if isinstance(v, (list, tuple)) :\n'               +
+                                 '    return [__j(x) for x in v]\n'                    +
+                                 '  if isinstance(v, dict) :\n'                        +
+                                 '    return { str(k) : __j(x) for k, x in v.items() }\n' +
+                                 '  return v\n' )
 
     NVS_NAMESPACE_CONFIG     = "esp32Ctrl"
+    CONFIGURATIONS_KEYS      = dict( MCU = ('mcufreq',   int),
+                                     STA = ('ssid',      str),
+                                     AP  = ('apssid',    str),
+                                     ETH = ('ethdriver', str),
+                                     SD  = ('sdmountpt', str) )
+
+    TRANSFER_MODE_REPR       = 'repr'
+    TRANSFER_MODE_RAW        = 'raw'
+    TRANSFER_MODE_BASE64     = 'base64'
+    TRANSFER_MODE_DEFLATE    = 'deflate'
+    TRANSFER_MODE_AUTO       = 'auto'
+    TRANSFER_DEFLATE_WBITS   = 10
+    TRANSFER_DEFLATE_SAVING  = 0.1
+    TRANSFER_DEFLATE_SAMPLE  = 16*1024
+    TRANSFER_NO_DEFLATE_EXT  = ( '.gz', '.zip', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp3' )
+    TRANSFER_WINDOW          = 2
+    TRANSFER_TIMEOUT_SEC     = 3
+    TRANSFER_MAX_RETRIES     = 5
+    TRANSFER_DRAIN_SEC       = 0.200
+    TRANSFERS_STATS_MAX      = 50
+    STATS_LATENCY_BOUNDS_MS  = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+    STATS_SIZE_BOUNDS        = (1, 16, 64, 256, 1024, 4096, 16384, 65536)
+    STATS_RATE_BOUNDS        = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+    RESUME_HASH_TIMEOUT_SEC  = 30
+
+    # Checkpoints of interrupted transfers, shared by instances to resume after a reconnection,
+    _pendingTransfers        = { }
+    _pendingLock             = allocate_lock()
+
+    PROBE_TIMEOUT_SEC        = 1
+    ESPRESSIF_USB_VID        = 0x303A
+    USB_UART_BRIDGES_IDS     = ( (0x10C4, 0xEA60),      # Silicon Labs CP210x
+                                 (0x1A86, 0x7523),      # WCH CH340
+                                 (0x1A86, 0x55D4),      # WCH CH9102
+                                 (0x0403, 0x6001),      # FTDI FT232R
+                                 (0x0403, 0x6010),      # FTDI FT2232H
+                                 (0x0403, 0x6015) )     # FTDI FT231X
+
+    BAUDRATE_UPGRADE_RATES   = ( 921600, 460800, 230400 )
+    BAUDRATE_SWITCH_SEC      = 0.100
+    BAUDRATE_CONFIRM_SEC     = 1
+    BAUDRATE_LOST_SEC        = 0.500
+
+    SYNC_TO_DEVICE           = 'toDevice'
+    SYNC_FROM_DEVICE         = 'fromDevice'
+    SYNC_BOTH                = 'both'
+    SYNC_DEFAULT_EXCLUDES    = ( '__pycache__', '.*' )
+    SYNC_PROTECTED_PATHS     = ( '/boot.py',
+                                 '/' + BOOT_CONFIG_MPY_FILENAME,
+                                 '/' + AGENT_MPY_FILENAME,
+                                 '/' + EXEC_MPY_FILENAME,
+                                 PROG_CACHE_DIR )
+    SYNC_TREE_TIMEOUT_SEC    = 60
+    DIR_TREE_MAX_ENTRIES     = 2000
+
+    MOUNT_DEFAULT_POINT      = '/remote'
+    MOUNT_READ_AHEAD_SIZE    = 4096
+    MOUNT_TIMEOUT_SEC        = 5
 
     # ---------------------------------------------------------------------------
 
@@ -53,32 +716,112 @@ class ESP32Controller :
             r.append( dict( Device = port.device,
                             Name   = port.name,
                             Desc   = port.description,
-                            USB    = (True if port.pid else False) ) )
+                            USB    = (True if port.pid else False),
+                            VID    = port.vid,
+                            PID    = port.pid ) )
         return r
 
     # ---------------------------------------------------------------------------
 
+    @staticmethod
+    def _getSerialPortRank(port) :
+        # 0: Espressif native USB, 1: known USB-UART bridge, 2: other USB, 3: other serial,
+        if port['VID'] == ESP32Controller.ESPRESSIF_USB_VID :
+            return 0
+        if (port['VID'], port['PID']) in ESP32Controller.USB_UART_BRIDGES_IDS :
+            return 1
+        return (2 if port['USB'] else 3)
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _probeIdleREPL(devicePort, baudrate, timeoutSec) :
+        # Light handshake without CTRL-C: an idle REPL (friendly or raw) answers CTRL-B
+        # with the friendly prompt, a running program only gets one byte on its stdin,
+        try :
+            ser           = Serial()
+            ser.port      = devicePort
+            ser.baudrate  = baudrate
+            ser.timeout   = timeoutSec
+            ser.rts       = False
+            ser.dtr       = False
+            ser.exclusive = True
+            ser.open()
+        except :
+            return False
+        try :
+            ser.write(b'\x02')
+            ser.flush()
+            return ser.read_until(b'\r\n>>> ').endswith(b'\r\n>>> ')
+        except :
+            return False
+        finally :
+            ser.close()
+
+    # ---------------------------------------------------------------------------
+
     @staticmethod
     def GetFirstAvailableESP32Ctrl( baudrate          = 115200,
+                                    upgradeBaudrate   = False,
+                                    preferredPorts    = None,
+                                    probeTimeoutSec   = PROBE_TIMEOUT_SEC,
                                     onSerialConnError = None,
                                     onTerminalRecv    = None,
                                     onEndOfProgram    = None,
                                     onProgramError    = None,
                                     onProgramStopped  = None,
                                     onDeviceReset     = None ) :
-        for port in ESP32Controller.GetSerialPorts() :
+        # Preferred ports (last successful ones) come first, then by rank,
+        preferredPorts = (preferredPorts or [ ])
+        ports = [ ( (preferredPorts.index(port['Device']) if port['Device'] in preferredPorts else len(preferredPorts)),
+                    ESP32Controller._getSerialPortRank(port),
+                    port['Device'] )
+                  for port in ESP32Controller.GetSerialPorts() ]
+        ports = [ x[2] for x in sorted(ports) ]
+        # All ports get the light handshake concurrently, nothing is taken over,
+        cond    = Condition()
+        results = { }
+        def probe(devicePort) :
+            idle = ESP32Controller._probeIdleREPL(devicePort, baudrate, probeTimeoutSec)
+            with cond :
+                results[devicePort] = idle
+                cond.notify_all()
+        def decided() :
+            # The best idle port is known when all the ports before it have answered,
+            for devicePort in ports :
+                if devicePort not in results :
+                    return False
+                if results[devicePort] :
+                    return True
+            return True
+        for devicePort in ports :
+            start_new_thread(probe, (devicePort, ))
+        with cond :
+            cond.wait_for(decided)
+            idle = [ x for x in ports if results.get(x) ]
+        # Idle devices are connected first, the others (busy or not MicroPython) are then
+        # connected one by one in order, so only ports up to the chosen one are interrupted,
+        ports = idle + [ x for x in ports if x not in idle ]
+        for devicePort in ports :
             try :
-                esp32Ctrl = ESP32Controller( devicePort        = port['Device'],
+                esp32Ctrl = ESP32Controller( devicePort        = devicePort,
                                              baudrate          = baudrate,
+                                             connectTimeoutSec = probeTimeoutSec,
                                              onSerialConnError = onSerialConnError,
                                              onTerminalRecv    = onTerminalRecv,
                                              onEndOfProgram    = onEndOfProgram,
                                              onProgramError    = onProgramError,
                                              onProgramStopped  = onProgramStopped,
                                              onDeviceReset     = onDeviceReset )
-                return esp32Ctrl
             except :
-                pass
+                continue
+            if upgradeBaudrate :
+                try :
+                    esp32Ctrl.UpgradeBaudrate(upgradeBaudrate)
+                except :
+                    esp32Ctrl.Close()
+                    raise
+            return esp32Ctrl
         return None
 
     # ---------------------------------------------------------------------------
@@ -131,20 +874,90 @@ class ESP32Controller :
 
     @staticmethod
     def _macAddrToStr(macAddr) :
+        if isinstance(macAddr, str) :
+            macAddr = unhexlify(macAddr)
         return hexlify(macAddr, ':').decode().upper()
 
     # ---------------------------------------------------------------------------
 
+    @staticmethod
+    def _partitionsFromJSON(partitions) :
+        return [ tuple(x) for x in partitions ]
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _pinsStateFromJSON(pins) :
+        return { int(k) : v for k, v in pins.items() }
+
+    # ---------------------------------------------------------------------------
+
     @staticmethod
     def _fahrenheit2Celsius(f) :
         return (f - 32) * 5/9
 
     # ---------------------------------------------------------------------------
 
+    @staticmethod
+    def _memInfoToDict(mem) :
+        return dict( alloc = mem[0],
+                     free  = mem[1] )
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _mcuTempToDict(f) :
+        c = round(ESP32Controller._fahrenheit2Celsius(f)*10)/10
+        return dict( fahrenheit = f,
+                     celsius    = c )
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _platformInfoToDict(platform, uname, mpyVer) :
+        system, __, release, version, implem = uname
+        return dict( platform = (platform or 'N/A'),
+                     system   = system,
+                     release  = release,
+                     version  = version,
+                     implem   = implem,
+                     spiram   = (implem.upper().find('SPIRAM') >=0),
+                     mpyver   = '%s.%s' % (mpyVer & 0xff, mpyVer >> 8 & 3) )
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _wifiConfigToDict(ssid, conf) :
+        return dict( ssid    = ssid,
+                     ip      = conf[0],
+                     mask    = conf[1],
+                     gateway = conf[2],
+                     dns     = conf[3] )
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _ethInfoToDict(r) :
+        if r :
+            return dict( mac     = ESP32Controller._macAddrToStr(r[0]),
+                         enable  = (r[1] != 0 and r[1] != 2),
+                         linkup  = (r[1] == 3 or  r[1] == 5),
+                         gotip   = (r[1] == 5),
+                         ip      = r[2][0],
+                         mask    = r[2][1],
+                         gateway = r[2][2],
+                         dns     = r[2][3] )
+        return (None if r is None else dict())
+
+    # ---------------------------------------------------------------------------
+
     def __init__( self,
                   devicePort,
                   baudrate          = 115200,
                   connectTimeoutSec = 3,
+                  useRawPaste       = True,
+                  transferMode      = TRANSFER_MODE_AUTO,
+                  upgradeBaudrate   = False,
                   onConnProgress    = None,
                   onSerialConnError = None,
                   onTerminalRecv    = None,
@@ -164,12 +977,29 @@ class ESP32Controller :
         self._isConnected        = False
         self._threadRunning      = False
         self._threadReading      = False
+        self._threadStartReq     = None
+        self._rawPasteWinSize    = (None if useRawPaste else 0)
+        self._replResultEnd      = b'\x04>'
+        self._transferMode       = transferMode
+        self._transfersStats     = [ ]
+        self._deflateCaps        = None
+        self._agentVersion       = None
         self._inProcess          = False
         self._inCodeFileName     = None
-        self._lockProcess        = allocate_lock()
-        self._lockWrite          = allocate_lock()
-        self._lockRead           = allocate_lock()
-        self._threadReadingEvent = Event()
+        self._inCodeFilePath     = None
+        self._lockProcess        = Condition()
+        self._lockWrite          = ESP32StatsLock('lockWriteWait', self._addLatency)
+        self._lockRead           = ESP32StatsLock('lockReadWait',  self._addLatency)
+        self._threadCond         = Condition()
+        self._wakeupPipe         = None
+        self._lockStats          = allocate_lock()
+        self._opStats            = { }
+        self._statsStartTime     = time()
+        self._execSentTime       = None
+        self._readerWakeups      = 0
+        self._readerBytes        = 0
+        self._decodeErrors       = 0
+        self._hostMount          = None
 
         try :
             self._repl = Serial( port      = devicePort,
@@ -182,30 +1012,47 @@ class ESP32Controller :
             self._isConnected = True
         except :
             raise ESP32ControllerException('Cannot open serial port "%s".' % devicePort)
+
+        try :
+            # A pipe is added to the select on the serial fd to wake up the reader (not on Windows),
+            self._repl.fileno()
+            self._wakeupPipe = pipe()
+        except :
+            self._wakeupPipe = None
         
         if onConnProgress :
             onConnProgress()
 
         try :
+            self._flushPendingTransfer()
             self.InterruptProgram()
-            self._repl.rts = 0
-            self._repl.dtr = 0
+            try :
+                # Modem lines are not available on every port (pty, some USB bridges),
+                self._repl.rts = 0
+                self._repl.dtr = 0
+            except :
+                pass
             self._switchToRawMode(timeoutSec=connectTimeoutSec)
             machineNfo          = self._exeCodeREPL('import uos; [x.strip() for x in uos.uname().machine.split("with")]')
             self._machineModule = (machineNfo[0] if len(machineNfo) >= 1 else '')
             self._machineMCU    = (machineNfo[1] if len(machineNfo) >= 2 else '')
             self._ensureJamaObjExists()
+            self._detectAgent(lockRead=False)
         except ESP32ControllerSerialConnException :
             raise
         except :
             raise ESP32ControllerException('The device on the "%s" port is not compatible.' % devicePort)
+
+        if upgradeBaudrate :
+            self._upgradeBaudrate(upgradeBaudrate, lockRead=False)
             
         self._onSerialConnError = onSerialConnError
         
         try :
             start_new_thread(self._threadProcess, ())
-            while not self._threadRunning :
-                pass
+            with self._threadCond :
+                if not self._threadCond.wait_for(lambda : self._threadRunning, timeout=5) :
+                    raise Exception()
             self._threadStartReading()
         except :
             self._threadRunning = False
@@ -223,96 +1070,123 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    def _detectAgent(self, lockRead=True) :
+        modName = self.AGENT_MPY_FILENAME.rsplit('.', 1)[0]
+        try :
+            ver = self._exeCodeREPL( 'try :\n'                                 +
+                                     '  print(__import__(%s).VERSION)\n' % repr(modName) +
+                                     'except :\n'                              +
+                                     '  print(None)',
+                                     lockRead = lockRead )
+        except ESP32ControllerCodeException :
+            ver = None
+        self._agentVersion = (ver if ver == self.AGENT_VERSION else None)
+        return ver
+
+    # ---------------------------------------------------------------------------
+
+    def _agentCall(self, funcName, *args, timeoutSec=1) :
+        modName = self.AGENT_MPY_FILENAME.rsplit('.', 1)[0]
+        return self._exeCodeREPL( 'print(__import__(%s).call(%s))\n' % ( repr(modName),
+                                                                        ', '.join([repr(x) for x in (funcName, ) + args]) ),
+                                  timeoutSec   = timeoutSec,
+                                  resultFormat = self.RESULT_JSON )
+
+    # ---------------------------------------------------------------------------
+
     def _threadProcess(self) :
 
         def cleanREPLBuffer() :
             self._switchToNormalMode()
             self._switchToRawMode()
 
-        self._threadRunning = True
-        restarted           = False
+        parser = ESP32REPLStreamParser()
+        with self._threadCond :
+            self._threadRunning = True
+            self._threadCond.notify_all()
         while self._threadRunning :
-            inCode = False
-            b      = b''
-            Event.wait(self._threadReadingEvent)
-            Event.clear(self._threadReadingEvent)
+            with self._threadCond :
+                self._threadCond.wait_for( lambda : self._threadStartReq is not None or \
+                                                    not self._threadRunning )
+                inCode               = self._threadStartReq
+                self._threadStartReq = None
+            if inCode is None :
+                break
+            parser.Reset(inCode, mountRequests=(self._hostMount is not None))
             with self._lockRead :
-                self._threadReading = True
+                with self._threadCond :
+                    self._threadReading = True
+                    self._threadCond.notify_all()
+                if not self._wakeupPipe :
+                    self._repl.timeout = self.READER_IDLE_TIMEOUT_SEC
+                garbledTime = None
                 while self._threadRunning and self._threadReading :
                     try :
-                        count = self._repl.in_waiting
-                        if count > 0 :
-                            b += self._repl.read(count)
-                        if restarted :
-                            if b.endswith(b'\r\n>') :
-                                restarted = False
-                                b = b''
+                        x = self._threadWaitData()
+                        if self._repl.baudrate != self._baudrate :
+                            # Any reboot of the device (reset, RST button, watchdog, panic, deep-sleep wake)
+                            # brings its UART back to the initial baudrate: when nothing valid is received
+                            # for a while, the host follows and asks for the REPL banner again,
+                            if x and not self._isGarbled(x) :
+                                garbledTime = None
+                            elif x and garbledTime is None :
+                                garbledTime = time()
+                            elif garbledTime and time() - garbledTime >= self.BAUDRATE_LOST_SEC :
+                                garbledTime = None
+                                self._setHostBaudrate(self._baudrate)
+                                self._serialWrite(b'\x02')
+                        if not x :
                             continue
-                        if len(b) >= 6 and b.endswith(b'\r\n>>> ') :
-                            b = b.replace(b'\r\n>>> ', b'\r\n')
-                            restarted = True
-                        if not inCode and b.startswith(b'OK') :
-                            inCode = True
-                            b      = b[2:]
-                        if inCode and len(b) >= 3 :
-                            i = b.find(b'\x04>')
-                            if i >= 1 :
-                                if chr(b[i-1]) == '\x04' :
-                                    r = b[:i-1]
-                                    b = b[i+2:]
-                                    if r and self._onTerminalRecv :
-                                        self._onTerminalRecv(self, r.decode())
-                                    cleanREPLBuffer()
-                                    self._endProcess()
-                                    if self._onEndOfProgram :
-                                        self._onEndOfProgram(self)
-                                else :
-                                    i2 = b.rfind(b'\x04', 0, i)
-                                    if i2 != -1 :
-                                        r   = b[:i2]
-                                        err = b[i2+1:i].decode()
-                                        b   = b[i+2:]
-                                        if r and self._onTerminalRecv :
-                                            self._onTerminalRecv(self, r.decode())
-                                        errMsg = err.split('\r\n')
-                                        if len(errMsg) >= 3 :
-                                            errFile = errMsg[-3].strip()
-                                            errMsg  = errMsg[-2].strip()
-                                            if errFile.find(ESP32Controller.DEFAULT_CODE_FILENAME) == -1 :
-                                                if self._inCodeFileName :
-                                                    errFile = errFile.replace(self.STDIN_CODE_FILENAME, '<%s>' % self._inCodeFileName)
-                                                errMsg = errFile + '\r\n' + errMsg
-                                        else :
-                                            errMsg = err
-                                        cleanREPLBuffer()
-                                        self._endProcess()
-                                        if errMsg.find('KeyboardInterrupt:') >= 0 :
-                                            b = b''
-                                            if self._onProgramStopped :
-                                                self._onProgramStopped(self)
-                                        elif self._onProgramError :
-                                            self._onProgramError(self, errMsg)
+                        recvTime = time()
+                        for event, arg in parser.Feed(x) :
+                            if event == ESP32REPLStreamParser.EVENT_OUTPUT :
+                                if self._onTerminalRecv :
+                                    self._onTerminalRecv(self, arg)
+                                    self._addLatency('terminalRecv', time() - recvTime)
+                            elif event == ESP32REPLStreamParser.EVENT_END :
+                                cleanREPLBuffer()
+                                self._endProcess()
                                 inCode = False
-                        if b and b.find(b'\x04') == -1 :
-                            if self._onTerminalRecv :
-                                self._onTerminalRecv(self, b.decode())
-                            b = b''
-                            if not restarted :
-                                continue
-                        if restarted :
-                            self._endProcess()
-                            self._switchToRawMode()
-                            self._ensureJamaObjExists()
-                            if self._onDeviceReset :
-                                self._onDeviceReset(self)
-                            inCode    = False
-                            restarted = False
-                            continue
-                        sleep(0.030)
-                    except :
+                                # Latencies exclude the time spent in the callback,
+                                self._addLatency('endOfProgram', time() - recvTime)
+                                if self._execSentTime :
+                                    self._addLatency('execToEndOfProgram', time() - self._execSentTime)
+                                    self._execSentTime = None
+                                if self._onEndOfProgram :
+                                    self._onEndOfProgram(self)
+                            elif event == ESP32REPLStreamParser.EVENT_ERROR :
+                                if self._inCodeFilePath :
+                                    # Errors of a program run from a device file are reported as from stdin,
+                                    arg = arg.replace( '"%s"' % self._inCodeFilePath,
+                                                       '"%s"' % self.STDIN_CODE_FILENAME )
+                                errMsg = self._programErrorMessage(arg, self._inCodeFileName)
+                                cleanREPLBuffer()
+                                self._endProcess()
+                                inCode = False
+                                if errMsg.find('KeyboardInterrupt:') >= 0 :
+                                    if self._onProgramStopped :
+                                        self._onProgramStopped(self)
+                                    break
+                                elif self._onProgramError :
+                                    self._onProgramError(self, errMsg)
+                            elif event == ESP32REPLStreamParser.EVENT_REQUEST :
+                                self._serveMountRequest(arg)
+                            elif event == ESP32REPLStreamParser.EVENT_RESET :
+                                self._hostMount = None
+                                self._endProcess()
+                                self._switchToRawMode()
+                                self._ensureJamaObjExists()
+                                self._detectAgent(lockRead=False)
+                                inCode = False
+                                if self._onDeviceReset :
+                                    self._onDeviceReset(self)
+                    except :
                         self._repl.close()
-                        self._threadRunning = False
+                        with self._threadCond :
+                            self._threadRunning = False
+                            self._threadCond.notify_all()
                         self._isConnected   = False
+                        self._closeWakeupPipe()
                         if inCode :
                             self._endProcess()
                         if self._onSerialConnError :
@@ -321,64 +1195,319 @@ class ESP32Controller :
                     self._endProcess()
                 self._threadReading = False
 
+   # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _programErrorMessage(err, codeFilename) :
+        errMsg = err.split('\r\n')
+        if len(errMsg) >= 3 :
+            errFile = errMsg[-3].strip()
+            errMsg  = errMsg[-2].strip()
+            if errFile.find(ESP32Controller.DEFAULT_CODE_FILENAME) == -1 :
+                if codeFilename :
+                    errFile = errFile.replace(ESP32Controller.STDIN_CODE_FILENAME, '<%s>' % codeFilename)
+                errMsg = errFile + '\r\n' + errMsg
+            return errMsg
+        return err
+
    # ---------------------------------------------------------------------------
     
     def _endThread(self) :
-        self._threadRunning = False
+        with self._threadCond :
+            self._threadRunning = False
+            self._threadCond.notify_all()
+        self._threadWakeUp()
         with self._lockRead :
             pass
 
    # ---------------------------------------------------------------------------
 
-    def _threadStartReading(self) :
-        if self._threadRunning and not self._threadReading and not self._inProcess :
-            Event.set(self._threadReadingEvent)
-            while Event.is_set(self._threadReadingEvent) :
-                pass
+    def _threadWaitData(self) :
+        # Blocks until bytes are received, the reader is woken up or the idle timeout,
+        if self._wakeupPipe :
+            r = select([self._repl.fileno(), self._wakeupPipe[0]], [ ], [ ], self.READER_IDLE_TIMEOUT_SEC)[0]
+            self._readerWakeups += 1
+            if self._wakeupPipe[0] in r :
+                osRead(self._wakeupPipe[0], 64)
+            x = self._repl.in_waiting
+            b = (self._repl.read(x) if x else b'')
+        else :
+            b = self._repl.read(1)
+            self._readerWakeups += 1
+            if b :
+                x = self._repl.in_waiting
+                if x :
+                    b += self._repl.read(x)
+        self._readerBytes += len(b)
+        self._addBytes('serialRead', len(b))
+        return b
+
+   # ---------------------------------------------------------------------------
+
+    def _threadWakeUp(self) :
+        try :
+            if self._wakeupPipe :
+                osWrite(self._wakeupPipe[1], b'\x00')
+            else :
+                self._repl.cancel_read()
+        except :
+            pass
+
+   # ---------------------------------------------------------------------------
+
+    def _threadStartReading(self, inCode=False) :
+        if self._threadRunning and not self._threadReading and (inCode or not self._inProcess) :
+            startTime = time()
+            with self._threadCond :
+                self._threadStartReq = inCode
+                self._threadCond.notify_all()
+                self._threadCond.wait_for(lambda : self._threadReading or not self._threadRunning)
+            self._addLatency('threadStartReading', time() - startTime)
 
    # ---------------------------------------------------------------------------
 
     def _threadStopReading(self) :
         if self._threadReading and not self._inProcess :
+            startTime           = time()
             self._threadReading = False
+            self._threadWakeUp()
             with self._lockRead :
                 pass
+            self._addLatency('threadStopReading', time() - startTime)
 
    # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def ExecProgram(self, code, codeFilename=None, cbProgress=None, bufSize=2048) :
         if not code :
             return
         if not self._isConnected :
             self._raiseConnectionError()
+        self._threadStopReading()
         self._beginProcess()
         if not codeFilename :
             codeFilename = ESP32Controller.DEFAULT_CODE_FILENAME
         self._inCodeFileName = codeFilename
+        self._inCodeFilePath = None
         if code.find('\n') == -1 :
             code = 'exec(compile(%s,%s,"single"))' % (repr(code), repr(codeFilename))
-        data = code.encode()
-        size = len(data)
-        if size :
-            if cbProgress :
-                cbProgress(0, size)
-            progress = 0
-            with self._lockWrite :
-                while True :
-                    try :
-                        progress += self._repl.write(data[ progress : progress + bufSize ])
-                        self._repl.flush()
-                    except :
-                        self._raiseConnectionError()
+        try :
+            self._sendCodeToREPL(code.encode(), cbProgress, bufSize)
+        except :
+            self._endProcess()
+            self._threadStartReading()
+            raise
+        self._execSentTime = time()
+        self._threadStartReading(inCode=True)
+
+   # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _importProgramCode(dirPath, modName, removeFilename=None) :
+        # Device code running a program file as a module from the REPL: REPL globals stay
+        # readable by the program (through builtins) and its globals are copied back at the end,
+        return ( 'def __x(d, n, f) :\n'                                            +
+                 '  import sys, os, builtins\n'                                    +
+                 '  g = globals()\n'                                               +
+                 '  b = [ ]\n'                                                     +
+                 '  for k in g :\n'                                                +
+                 '    if not k.startswith("__") and not hasattr(builtins, k) :\n'  +
+                 '      try :\n'                                                   +
+                 '        setattr(builtins, k, g[k])\n'                            +
+                 '        b.append(k)\n'                                           +
+                 '      except :\n'                                                +
+                 '        pass\n'                                                  +
+                 '  sys.path.insert(0, d)\n'                                       +
+                 '  try :\n'                                                       +
+                 '    m = __import__(n)\n'                                         +
+                 '    for k in dir(m) :\n'                                         +
+                 '      if not k.startswith("__") :\n'                             +
+                 '        g[k] = getattr(m, k)\n'                                  +
+                 '  finally :\n'                                                   +
+                 '    sys.path.remove(d)\n'                                        +
+                 '    sys.modules.pop(n, None)\n'                                  +
+                 '    for k in b :\n'                                              +
+                 '      delattr(builtins, k)\n'                                    +
+                 '    if f :\n'                                                    +
+                 '      os.remove(f)\n'                                            +
+                 'try :\n'                                                         +
+                 '  __x(%s, %s, %s)\n' % (repr(dirPath), repr(modName), repr(removeFilename)) +
+                 'finally :\n'                                                     +
+                 '  del __x' )
+
+   # ---------------------------------------------------------------------------
+
+    def _getRootPath(self) :
+        return self._exeCodeREPL( 'from os import getcwd\n'             +
+                                  '__d = getcwd()\n'                    +
+                                  'print(repr(__d[:__d.index("/")]))\n' +
+                                  'del __d\n' )
+
+   # ---------------------------------------------------------------------------
+
+    def _removeStagedFile(self, path) :
+        # Drops a partially written program file so it is never imported,
+        try :
+            self._exeCodeREPL( 'import os\n'           +
+                               'try :\n'               +
+                               '  os.remove(%s)\n' % repr(path) +
+                               'except OSError :\n'    +
+                               '  pass' )
+        except ESP32ControllerSerialConnException :
+            raise
+        except ESP32ControllerException :
+            pass
+
+   # ---------------------------------------------------------------------------
+
+    @_timedREPL
+    def ExecMpyProgram(self, mpyData, codeFilename=None, cbProgress=None, bufSize=2048, code=None) :
+        # Runs precompiled bytecode: the .mpy is uploaded next to the flash root, imported and removed,
+        # when it cannot be staged (read-only or full flash) the source code, if given, is sent instead,
+        if not mpyData :
+            return
+        if not self._isConnected :
+            self._raiseConnectionError()
+        self._threadStopReading()
+        self._beginProcess()
+        self._inCodeFileName = (codeFilename or ESP32Controller.DEFAULT_CODE_FILENAME)
+        self._inCodeFilePath = None
+        staged = False
+        try :
+            rootPath       = self._getRootPath()
+            remoteFilename = rootPath + '/' + self.EXEC_MPY_FILENAME
+            try :
+                self._sendStream(BytesIO(mpyData), len(mpyData), remoteFilename, cbProgress, bufSize)
+                staged = True
+            except ESP32ControllerSerialConnException :
+                raise
+            except ESP32ControllerException :
+                if not code :
+                    raise
+                self._removeStagedFile(remoteFilename)
+            if staged :
+                self._sendCodeToREPL( self._importProgramCode( (rootPath or '/'),
+                                                               self.EXEC_MPY_FILENAME.rsplit('.', 1)[0],
+                                                               remoteFilename ).encode() )
+        except :
+            self._endProcess()
+            self._threadStartReading()
+            raise
+        if not staged :
+            self._endProcess()
+            self._threadStartReading()
+            return self.ExecProgram(code, codeFilename, cbProgress, bufSize)
+        self._execSentTime = time()
+        self._threadStartReading(inCode=True)
+
+   # ---------------------------------------------------------------------------
+
+    @_timedREPL
+    def ExecCachedProgram(self, code, codeFilename=None, cbProgress=None, bufSize=2048, mpyData=None) :
+        # Programs are kept on the device flash as PROG_CACHE_DIR/<sha>.py (or .mpy) and only
+        # sent when missing, they run from the file so the source is never held in RAM at once,
+        # the least recently used files are evicted to keep PROG_CACHE_MIN_FREE bytes free
+        # (nothing is evicted when the program cannot fit anyway), when the program cannot be
+        # staged on the flash (read-only or full) it is sent as usual,
+        if not code :
+            return
+        content = (mpyData or code.encode())
+        if not mpyData and ( code.find('\n') == -1 or code.find('__name__') >= 0 or \
+                             len(content) < self.PROG_CACHE_MIN_SIZE ) :
+            # Single lines are evaluated, "__main__" programs and small ones are simply pasted,
+            return self.ExecProgram(code, codeFilename, cbProgress, bufSize)
+        if not self._isConnected :
+            self._raiseConnectionError()
+        name = sha256(content).hexdigest()[:32]
+        ext  = ('.mpy' if mpyData else '.py')
+        self._threadStopReading()
+        self._beginProcess()
+        self._inCodeFileName = (codeFilename or ESP32Controller.DEFAULT_CODE_FILENAME)
+        self._inCodeFilePath = None
+        try :
+            try :
+                hit, stored, dirPath = self._exeCodeREPL( 'def __c(c, n, s, mf, mx) :\n'                     +
+                                                          '  import os\n'                                    +
+                                                          '  d = os.getcwd()\n'                              +
+                                                          '  d = d[:d.index("/")] + c\n'                     +
+                                                          '  try :\n'                                        +
+                                                          '    os.mkdir(d)\n'                                +
+                                                          '  except OSError :\n'                             +
+                                                          '    pass\n'                                       +
+                                                          '  try :\n'                                        +
+                                                          '    with open(d + "/.lru") as f :\n'              +
+                                                          '      l = f.read().split()\n'                     +
+                                                          '  except OSError :\n'                             +
+                                                          '    l = [ ]\n'                                    +
+                                                          '  o = list(l)\n'                                  +
+                                                          '  try :\n'                                        +
+                                                          '    h = (os.stat(d + "/" + n)[6] == s)\n'         +
+                                                          '  except OSError :\n'                             +
+                                                          '    h = False\n'                                  +
+                                                          '  if n in l :\n'                                  +
+                                                          '    l.remove(n)\n'                                +
+                                                          '  t = 0\n'                                        +
+                                                          '  for x in l :\n'                                 +
+                                                          '    try :\n'                                      +
+                                                          '      t += os.stat(d + "/" + x)[6]\n'             +
+                                                          '    except OSError :\n'                           +
+                                                          '      pass\n'                                     +
+                                                          '  v = os.statvfs(d)\n'                            +
+                                                          '  ok = h\n'                                       +
+                                                          '  while not ok and v[0] * v[3] + t - s >= mf :\n' +
+                                                          '    v = os.statvfs(d)\n'                          +
+                                                          '    ok = (v[0] * v[3] - s >= mf and len(l) < mx)\n' +
+                                                          '    if ok or not l :\n'                           +
+                                                          '      break\n'                                    +
+                                                          '    try :\n'                                      +
+                                                          '      os.remove(d + "/" + l.pop(0))\n'            +
+                                                          '    except OSError :\n'                           +
+                                                          '      pass\n'                                     +
+                                                          '  if ok :\n'                                      +
+                                                          '    l.append(n)\n'                                +
+                                                          '  if l != o :\n'                                  +
+                                                          '    with open(d + "/.lru", "w") as f :\n'         +
+                                                          '      f.write(" ".join(l))\n'                     +
+                                                          '  print(repr((h, ok, d)))\n'                      +
+                                                          '__c(%s, %s, %s, %s, %s)\n' % ( repr(self.PROG_CACHE_DIR),
+                                                                                         repr(name + ext),
+                                                                                         len(content),
+                                                                                         self.PROG_CACHE_MIN_FREE,
+                                                                                         self.PROG_CACHE_MAX_FILES ) +
+                                                          'del __c',
+                                                          timeoutSec = self.PROG_CACHE_TIMEOUT_SEC )
+            except ESP32ControllerCodeException :
+                # Cache directory cannot be written,
+                stored = False
+            if stored :
+                filePath = dirPath + '/' + name + ext
+                if hit :
                     if cbProgress :
-                        cbProgress(progress, size)
-                    if progress == size :
-                        try :
-                            self._repl.write(b'\x04')
-                            self._repl.flush()
-                        except :
-                            self._raiseConnectionError()
-                        break
+                        cbProgress(len(content), len(content))
+                else :
+                    try :
+                        self._sendStream(BytesIO(content), len(content), filePath, cbProgress, bufSize)
+                    except ESP32ControllerSerialConnException :
+                        raise
+                    except ESP32ControllerException :
+                        stored = False
+                        self._removeStagedFile(filePath)
+            if stored :
+                self._inCodeFilePath = filePath
+                self._sendCodeToREPL(self._importProgramCode(dirPath, name).encode())
+        except :
+            self._endProcess()
+            self._threadStartReading()
+            raise
+        if not stored :
+            # Not enough free flash or staging failed, the program is sent as usual,
+            self._endProcess()
+            self._threadStartReading()
+            if mpyData :
+                return self.ExecMpyProgram(mpyData, codeFilename, cbProgress, bufSize, code)
+            return self.ExecProgram(code, codeFilename, cbProgress, bufSize)
+        self._execSentTime = time()
+        self._threadStartReading(inCode=True)
 
    # ---------------------------------------------------------------------------
 
@@ -389,14 +1518,12 @@ class ESP32Controller :
             with self._lockWrite :
                 self._repl.write(b'\x03\x03')
                 self._repl.flush()
+            self._addBytes('serialWrite', 2)
         except :
             self._raiseConnectionError()
-        maxTime = (time() + self.KILL_AFTER_INTERRUPT_SEC)
-        while self._inProcess :
-            sleep(0.030)
-            if time() >= maxTime :
-                return False
-        return True
+        with self._lockProcess :
+            return self._lockProcess.wait_for( lambda : not self._inProcess,
+                                               timeout = self.KILL_AFTER_INTERRUPT_SEC )
 
     # ---------------------------------------------------------------------------
 
@@ -407,7 +1534,8 @@ class ESP32Controller :
             self._lockRead.acquire()
         savedTimeout = self._repl.timeout
         self._repl.timeout = (timeoutSec if timeoutSec else None) 
-        readErr = False
+        readErr   = False
+        startTime = time()
         try :
             b = self._repl.read_until(endBytes)
         except :
@@ -417,6 +1545,8 @@ class ESP32Controller :
         if readErr :
             self._raiseConnectionError()
         else :
+            self._addLatency('serialReadUntil', time() - startTime)
+            self._addBytes('serialRead', len(b))
             self._repl.timeout = savedTimeout
             if not b or not b.endswith(endBytes) :
                 raise ESP32ControllerException('Timeout...')
@@ -424,12 +1554,98 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    def _serialRead(self, size, timeoutSec=1, lockRead=True) :
+        if not self._isConnected :
+            self._raiseConnectionError()
+        if lockRead :
+            self._lockRead.acquire()
+        savedTimeout = self._repl.timeout
+        self._repl.timeout = (timeoutSec if timeoutSec else None)
+        readErr = False
+        try :
+            b = self._repl.read(size)
+        except :
+            readErr = True
+        if lockRead :
+            self._lockRead.release()
+        if readErr :
+            self._raiseConnectionError()
+        else :
+            self._addBytes('serialRead', len(b))
+            self._repl.timeout = savedTimeout
+            if len(b) != size :
+                raise ESP32ControllerException('Timeout...')
+            return b
+
+    # ---------------------------------------------------------------------------
+
+    def _serveMountRequest(self, request) :
+        # Called with the read lock held, so write errors are left to the caller,
+        # nothing is written to the program stdin without a mounted host directory,
+        if not self._hostMount :
+            return
+        r = self._hostMount.Serve(request)
+        with self._lockWrite :
+            self._repl.write(r)
+            self._repl.flush()
+        self._addBytes('serialWrite', len(r))
+
+    # ---------------------------------------------------------------------------
+
+    def _serialReadUntilServing(self, endBytes, timeoutSec=1, lockRead=True) :
+        # Same as _serialReadUntil but serves the host mount requests of the running code,
+        # the timeout is restarted after each request served,
+        if not self._isConnected :
+            self._raiseConnectionError()
+        if lockRead :
+            self._lockRead.acquire()
+        savedTimeout = self._repl.timeout
+        maxTime      = (time() + timeoutSec if timeoutSec else None)
+        buf          = b''
+        readErr      = False
+        try :
+            while True :
+                i = buf.find(b'\x18')
+                if i >= 0 :
+                    j = buf.find(b'\n', i)
+                    if j >= 0 :
+                        self._serveMountRequest(buf[i+1:j].rstrip(b'\r'))
+                        buf     = buf[:i] + buf[j+1:]
+                        maxTime = (time() + timeoutSec if timeoutSec else None)
+                        continue
+                elif buf.endswith(endBytes) :
+                    break
+                if maxTime is not None :
+                    if time() >= maxTime :
+                        break
+                    self._repl.timeout = (maxTime - time())
+                else :
+                    self._repl.timeout = None
+                b = self._repl.read(max(1, self._repl.in_waiting))
+                if not b :
+                    break
+                self._addBytes('serialRead', len(b))
+                buf += b
+        except :
+            readErr = True
+        if lockRead :
+            self._lockRead.release()
+        if readErr :
+            self._raiseConnectionError()
+        self._repl.timeout = savedTimeout
+        if not buf.endswith(endBytes) :
+            raise ESP32ControllerException('Timeout...')
+        return buf.decode()
+
+    # ---------------------------------------------------------------------------
+
     def _raiseConnectionError(self) :
         if self._isConnected :
             self._endThread()
             self._endProcess()
             self._repl.close()
             self._isConnected = False
+            self._closeWakeupPipe()
             if self._onSerialConnError :
                 self._onSerialConnError(self)
             raise ESP32ControllerSerialConnException('Serial connection error.')
@@ -449,6 +1665,7 @@ class ESP32Controller :
     def _endProcess(self) :
         with self._lockProcess :
             self._inProcess = False
+            self._lockProcess.notify_all()
 
     # ---------------------------------------------------------------------------
 
@@ -461,8 +1678,12 @@ class ESP32Controller :
             with self._lockWrite :
                 self._repl.write(b'\x01')
                 self._repl.flush()
+            self._addBytes('serialWrite', 1)
             try :
-                self._serialReadUntil(b'exit\r\n>', timeoutSec=0.250, lockRead=False)
+                r = self._serialReadUntil(b'exit\r\n>', timeoutSec=0.250, lockRead=False)
+                if r.endswith(self.RAW_PASTE_RESULT_END.decode()) :
+                    # Banner of an interrupted raw-paste execution, the answer to CTRL-A follows,
+                    self._serialReadUntil(b'exit\r\n>', timeoutSec=0.250, lockRead=False)
                 break
             except ESP32ControllerSerialConnException :
                 raise
@@ -476,7 +1697,7 @@ class ESP32Controller :
                     sleep(0.250)
                     x = self._repl.in_waiting
                     if x :
-                        self._repl.read(x)
+                        self._addBytes('serialRead', len(self._repl.read(x)))
                     else :
                         break
             except :
@@ -491,6 +1712,7 @@ class ESP32Controller :
             with self._lockWrite :
                 self._repl.write(b'\x02')
                 self._repl.flush()
+            self._addBytes('serialWrite', 1)
             self._serialReadUntil(b'\r\n>>> ', timeoutSec, lockRead=False)
         except :
             self._raiseConnectionError()
@@ -506,12 +1728,163 @@ class ESP32Controller :
                 self._onSerialConnError = None
                 try :
                     self.InterruptProgram()
+                    if self._repl.baudrate != self._baudrate :
+                        self._switchBaudrate(self._baudrate)
                     self._switchToNormalMode()
                 except :
                     pass
                 self._onSerialConnError = saveSCE
             self._repl.close()
             self._isConnected = False
+            self._closeWakeupPipe()
+
+    # ---------------------------------------------------------------------------
+
+    def _closeWakeupPipe(self) :
+        fds, self._wakeupPipe = self._wakeupPipe, None
+        for fd in (fds or ( )) :
+            try :
+                osClose(fd)
+            except :
+                pass
+
+    # ---------------------------------------------------------------------------
+
+    def _setHostBaudrate(self, baudrate) :
+        try :
+            self._repl.baudrate = baudrate
+        except :
+            self._raiseConnectionError()
+
+    # ---------------------------------------------------------------------------
+
+    def _switchBaudrate(self, baudrate, lockRead=True) :
+        # Returns True if switched, False if not confirmed and None if unsupported by the device,
+        oldBaudrate = self._repl.baudrate
+        self._sendCodeToREPL( ( 'def __b(new, old, mem, sec) :\n'                  +
+                                '  import sys, select, time, machine\n'            +
+                                '  def s(b) :\n'                                   +
+                                '    try :\n'                                      +
+                                '      machine.UART(0, baudrate=b)\n'              +
+                                '    except ValueError :\n'                        +
+                                '      if not mem :\n'                             +
+                                '        raise\n'                                  +
+                                '      d = (80000000 << 4) // b\n'                 +
+                                '      machine.mem32[0x3FF40014] = (d >> 4) | ((d & 0xF) << 20)\n' +
+                                '  s(old)\n'                                       +
+                                '  sys.stdout.buffer.write(b"\\x06")\n'          +
+                                '  time.sleep_ms(20)\n'                            +
+                                '  s(new)\n'                                       +
+                                '  p = select.poll()\n'                            +
+                                '  p.register(sys.stdin, select.POLLIN)\n'         +
+                                '  if p.poll(sec * 1000) and sys.stdin.buffer.read(1) == b"\\x06" :\n' +
+                                '    return True\n'                                +
+                                '  s(old)\n'                                       +
+                                '  return False\n'                                 +
+                                'try :\n'                                          +
+                                '  print(__b(%s, %s, %s, %s))\n' % ( baudrate,
+                                                                     oldBaudrate,
+                                                                     (self._machineMCU == 'ESP32'),
+                                                                     self.BAUDRATE_CONFIRM_SEC ) +
+                                'finally :\n'                                      +
+                                '  del __b' ).encode(), lockRead=lockRead )
+        r = self._serialRead(1, timeoutSec=3, lockRead=lockRead)
+        if r != b'\x06' :
+            try :
+                self._readREPLResult(timeoutSec=3, lockRead=lockRead, prefix=r.decode('ISO-8859-1'))
+            except ESP32ControllerCodeException :
+                pass
+            return None
+        sleep(self.BAUDRATE_SWITCH_SEC)
+        self._setHostBaudrate(baudrate)
+        self._serialWrite(b'\x06')
+        try :
+            if self._readREPLResult(timeoutSec=self.BAUDRATE_CONFIRM_SEC + 1, lockRead=lockRead) is True :
+                return True
+        except ESP32ControllerSerialConnException :
+            raise
+        except ESP32ControllerException :
+            pass
+        # Without confirmation, the device goes back to the previous baudrate by itself,
+        self._setHostBaudrate(oldBaudrate)
+        self._serialDrain(self.BAUDRATE_CONFIRM_SEC)
+        return False
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _isGarbled(data) :
+        # Data received at a wrong baudrate has NUL bytes or is not UTF-8 (beyond split characters),
+        return (data.find(b'\x00') >= 0 or data.decode('UTF-8', 'replace').count('\ufffd') > 2)
+
+    # ---------------------------------------------------------------------------
+
+    def _isBaudrateSwitchable(self) :
+        # Only the UART0 of an ESP32 carries the REPL link, on native USB ports (or other MCUs)
+        # machine.UART(0) would reconfigure an unrelated UART and report a fake baudrate,
+        if self._machineMCU != 'ESP32' :
+            return False
+        for port in self.GetSerialPorts() :
+            if port['Device'] == self._devicePort :
+                return (port['VID'] != self.ESPRESSIF_USB_VID)
+        return True
+
+    # ---------------------------------------------------------------------------
+
+    def _checkBaudrateLink(self, lockRead=True) :
+        pattern = bytes(range(256))
+        try :
+            r = self._exeCodeREPL('print(%s[::-1])' % repr(pattern), timeoutSec=2, lockRead=lockRead)
+            return (r == pattern[::-1])
+        except ESP32ControllerSerialConnException :
+            raise
+        except ESP32ControllerException :
+            self._serialDrain()
+            return False
+
+    # ---------------------------------------------------------------------------
+
+    def _upgradeBaudrate(self, baudrates, lockRead=True) :
+        if not self._isBaudrateSwitchable() :
+            return self._repl.baudrate
+        if baudrates is True :
+            baudrates = self.BAUDRATE_UPGRADE_RATES
+        elif isinstance(baudrates, int) :
+            baudrates = (baudrates, )
+        for baudrate in sorted(baudrates, reverse=True) :
+            oldBaudrate = self._repl.baudrate
+            if baudrate <= oldBaudrate :
+                break
+            switched = self._switchBaudrate(baudrate, lockRead)
+            if switched is None :
+                break
+            if switched and self._checkBaudrateLink(lockRead) :
+                break
+            # The link is not reliable at this baudrate and goes back to the previous one,
+            if switched :
+                self._switchBaudrate(oldBaudrate, lockRead)
+            if not self._checkBaudrateLink(lockRead) :
+                raise ESP32ControllerException('Cannot restore the serial link at %s bauds.' % oldBaudrate)
+        return self._repl.baudrate
+
+    # ---------------------------------------------------------------------------
+
+    @_timedREPL
+    def UpgradeBaudrate(self, baudrates=BAUDRATE_UPGRADE_RATES) :
+        if not self._isConnected :
+            self._raiseConnectionError()
+        self._threadStopReading()
+        self._beginProcess()
+        try :
+            return self._upgradeBaudrate(baudrates)
+        finally :
+            self._endProcess()
+            self._threadStartReading()
+
+    # ---------------------------------------------------------------------------
+
+    def GetBaudrate(self) :
+        return self._repl.baudrate
 
     # ---------------------------------------------------------------------------
 
@@ -540,31 +1913,239 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
-    def _exeCodeREPL(self, code, timeoutSec=1, lockRead=True) :
-        if not code :
-            return None
-        if not self._isConnected :
-            self._raiseConnectionError()
-        if code.find('\n') == -1 :
-            code = 'exec(compile(%s,"<ReplCmd>","single"))' % repr(code)
+    def _addStat(self, name, value, bounds, unit) :
+        # Counters and histogram of an operation, "bounds" are the upper limits of the buckets,
+        with self._lockStats :
+            x = self._opStats.get(name)
+            if not x :
+                x = self._opStats[name] = dict( unit   = unit,
+                                                bounds = bounds,
+                                                hist   = [0] * (len(bounds) + 1),
+                                                count  = 0,
+                                                total  = 0,
+                                                min    = value,
+                                                max    = value,
+                                                last   = 0 )
+            x['count'] += 1
+            x['total'] += value
+            x['last']   = value
+            x['min']    = min(x['min'], value)
+            x['max']    = max(x['max'], value)
+            x['hist'][bisect_left(bounds, value)] += 1
+
+    # ---------------------------------------------------------------------------
+
+    def _addLatency(self, name, sec) :
+        self._addStat(name, sec * 1000, self.STATS_LATENCY_BOUNDS_MS, 'ms')
+
+    # ---------------------------------------------------------------------------
+
+    def _addBytes(self, name, size) :
+        if size :
+            self._addStat(name, size, self.STATS_SIZE_BOUNDS, 'B')
+
+    # ---------------------------------------------------------------------------
+
+    def GetLatencyStats(self) :
+        r = dict( readerWakeups = self._readerWakeups,
+                  readerBytes   = self._readerBytes,
+                  decodeErrors  = self._decodeErrors )
+        with self._lockStats :
+            for name, x in self._opStats.items() :
+                if x['unit'] == 'ms' :
+                    r[name] = dict( count  = x['count'],
+                                    avgMs  = round(x['total'] / x['count'], 3),
+                                    maxMs  = round(x['max'],  3),
+                                    lastMs = round(x['last'], 3) )
+        return r
+
+    # ---------------------------------------------------------------------------
+
+    def GetStats(self) :
+        # Public methods working through the REPL are timed as "repl.<Method>",
+        # histograms are lists of [upperBound, count] with None for the last bucket,
+        ops = { }
+        with self._lockStats :
+            for name, x in self._opStats.items() :
+                ops[name] = dict( unit  = x['unit'],
+                                  count = x['count'],
+                                  total = round(x['total'], 3),
+                                  avg   = round(x['total'] / x['count'], 3),
+                                  min   = round(x['min'],  3),
+                                  max   = round(x['max'],  3),
+                                  last  = round(x['last'], 3),
+                                  hist  = [ [b, n] for b, n in zip(x['bounds'] + (None, ), x['hist']) ] )
+        return dict( time                  = round(time(), 3),
+                     elapsedSec            = round(time() - self._statsStartTime, 3),
+                     devicePort            = self._devicePort,
+                     baudrate              = self._repl.baudrate,
+                     bytesWritten          = ops.get('serialWrite', { }).get('total', 0),
+                     bytesRead             = ops.get('serialRead',  { }).get('total', 0),
+                     lockWriteAcquisitions = self._lockWrite.Acquisitions,
+                     lockReadAcquisitions  = self._lockRead.Acquisitions,
+                     readerWakeups         = self._readerWakeups,
+                     readerBytes           = self._readerBytes,
+                     decodeErrors          = self._decodeErrors,
+                     ops                   = ops )
+
+    # ---------------------------------------------------------------------------
+
+    def ResetStats(self) :
+        with self._lockStats :
+            self._opStats        = { }
+            self._statsStartTime = time()
+        self._lockWrite.Acquisitions = 0
+        self._lockRead.Acquisitions  = 0
+        self._readerWakeups          = 0
+        self._readerBytes            = 0
+        self._decodeErrors           = 0
+
+    # ---------------------------------------------------------------------------
+
+    def DumpStats(self, filename) :
+        # Appends the current stats as one JSON line for offline analysis,
+        with open(filename, 'a') as f :
+            f.write(jsonDumps(self.GetStats()) + '\n')
+
+    # ---------------------------------------------------------------------------
+
+    def GetRawPasteWindowSize(self) :
+        return self._rawPasteWinSize
+
+    # ---------------------------------------------------------------------------
+
+    def _serialWrite(self, data) :
         try :
             with self._lockWrite :
-                self._repl.write(code.encode() + b'\x04')
+                self._repl.write(data)
                 self._repl.flush()
         except :
             self._raiseConnectionError()
-        r = self._serialReadUntil(b'\x04>', timeoutSec=timeoutSec, lockRead=lockRead)
-        if len(r) >= 5 and r.startswith('OK') :
+        self._addBytes('serialWrite', len(data))
+
+    # ---------------------------------------------------------------------------
+
+    def _negotiateRawPaste(self, lockRead=True) :
+        self._serialWrite(b'\x05A\x01')
+        r = self._serialRead(2, lockRead=lockRead)
+        if r == b'R\x01' :
+            winSize = int.from_bytes(self._serialRead(2, lockRead=lockRead), 'little')
+            if self._rawPasteWinSize is None :
+                self._rawPasteWinSize = winSize
+            return winSize
+        if r == b'R\x00' :
+            # Raw-paste mode known but not supported, the raw REPL prompt follows,
+            self._serialReadUntil(b'>', lockRead=lockRead)
+        else :
+            # Old firmware, CTRL-A has restarted the raw REPL,
+            self._serialReadUntil(b'exit\r\n>', lockRead=lockRead)
+        self._rawPasteWinSize = 0
+        return 0
+
+    # ---------------------------------------------------------------------------
+
+    def _rawPasteWrite(self, data, winSize, cbProgress=None, bufSize=2048, lockRead=True) :
+        size      = len(data)
+        winRemain = winSize
+        progress  = 0
+        while progress < size :
+            while True :
+                try :
+                    waiting = self._repl.in_waiting
+                except :
+                    self._raiseConnectionError()
+                if winRemain and not waiting :
+                    break
+                b = self._serialRead(1, timeoutSec=3, lockRead=lockRead)
+                if b == b'\x01' :
+                    # The device has consumed a window and accepts the next one,
+                    winRemain += winSize
+                elif b == b'\x04' :
+                    # The device has aborted the transfer (compilation error),
+                    self._serialWrite(b'\x04')
+                    return
+                else :
+                    raise ESP32ControllerException('Data error during raw-paste transfer.')
+            buf = data[ progress : progress + min(winRemain, bufSize) ]
+            self._serialWrite(buf)
+            winRemain -= len(buf)
+            progress  += len(buf)
+            if cbProgress :
+                cbProgress(progress, size)
+        self._serialWrite(b'\x04')
+        # Waits for the end of data acknowledgement (window increments can precede it),
+        self._serialReadUntil(b'\x04', timeoutSec=3, lockRead=lockRead)
+
+    # ---------------------------------------------------------------------------
+
+    def _rawWrite(self, data, cbProgress=None, bufSize=2048, lockRead=True) :
+        size     = len(data)
+        progress = 0
+        while progress < size :
+            buf = data[ progress : progress + bufSize ]
+            self._serialWrite(buf)
+            progress += len(buf)
+            if cbProgress :
+                cbProgress(progress, size)
+        self._serialWrite(b'\x04')
+        if self._serialRead(2, timeoutSec=3, lockRead=lockRead) != b'OK' :
+            raise ESP32ControllerException('Data error on serial connection.')
+
+    # ---------------------------------------------------------------------------
+
+    def _sendCodeToREPL(self, data, cbProgress=None, bufSize=2048, lockRead=True) :
+        # After return, the device sends "<stdout>\x04<stderr>\x04>" in raw mode and
+        # "<stdout>\x04<stderr>\x04raw REPL; CTRL-B to exit\r\n>" in raw-paste mode,
+        if cbProgress :
+            cbProgress(0, len(data))
+        winSize = (self._negotiateRawPaste(lockRead) if self._rawPasteWinSize != 0 else 0)
+        if winSize :
+            self._replResultEnd = self.RAW_PASTE_RESULT_END
+            self._rawPasteWrite(data, winSize, cbProgress, bufSize, lockRead)
+        else :
+            self._replResultEnd = b'\x04>'
+            self._rawWrite(data, cbProgress, bufSize, lockRead)
+
+    # ---------------------------------------------------------------------------
+
+    def _decodeREPLResult(self, r, resultFormat) :
+        if resultFormat == self.RESULT_TEXT :
+            return r
+        startTime = time()
+        try :
+            if resultFormat == self.RESULT_JSON :
+                v = jsonLoads(r)
+            else :
+                v = literal_eval(r.strip())
+        except Exception as ex :
+            self._decodeErrors += 1
+            if resultFormat == self.RESULT_AUTO :
+                return r
+            raise ESP32ControllerDecodeException( 'Cannot decode %s result (%s): %s' % ( resultFormat,
+                                                                                        type(ex).__name__,
+                                                                                        repr(r[:80]) ) )
+        self._addLatency('decode%s' % resultFormat.capitalize(), time() - startTime)
+        return v
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _endsWithREPLPrompt(data) :
+        return data.endswith(b'\x04>') or data.endswith(ESP32Controller.RAW_PASTE_RESULT_END)
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _splitREPLResult(r) :
+        # Returns the stdout part of "<stdout>\x04<stderr>\x04>" or raises the error,
+        banner = ESP32Controller.RAW_REPL_PROMPT.decode()
+        if r.endswith('\x04' + banner) :
+            r = r[:-len(banner)] + '>'
+        if len(r) >= 3 :
             if r[-3] == '\x04' :
-                r = r[2:-3]
-                if r :
-                    try :
-                        return eval(r)
-                    except :
-                        return r
-                return None
-            elif r[2] == '\x04' :
-                r      = r[3:-2]
+                return r[:-3]
+            elif r[0] == '\x04' :
+                r      = r[1:-2]
                 errMsg = r.split('\r\n')
                 if len(errMsg) >= 2 :
                     errMsg = errMsg[-2].strip()
@@ -575,209 +2156,908 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
-    def ExeCodeREPL(self, code, timeoutSec=1) :
+    def _readREPLResult(self, timeoutSec=1, lockRead=True, prefix='', resultFormat=RESULT_LITERAL) :
+        if self._hostMount :
+            r = prefix + self._serialReadUntilServing(self._replResultEnd, timeoutSec=timeoutSec, lockRead=lockRead)
+        else :
+            r = prefix + self._serialReadUntil(self._replResultEnd, timeoutSec=timeoutSec, lockRead=lockRead)
+        r = self._splitREPLResult(r)
+        if r :
+            return self._decodeREPLResult(r, resultFormat)
+        return None
+
+    # ---------------------------------------------------------------------------
+
+    def _exeCodeREPL(self, code, timeoutSec=1, lockRead=True, resultFormat=RESULT_LITERAL) :
+        if not code :
+            return None
+        if not self._isConnected :
+            self._raiseConnectionError()
+        if code.find('\n') == -1 :
+            code = 'exec(compile(%s,"<ReplCmd>","single"))' % repr(code)
+        self._sendCodeToREPL(code.encode(), lockRead=lockRead)
+        return self._readREPLResult(timeoutSec, lockRead, resultFormat=resultFormat)
+
+    # ---------------------------------------------------------------------------
+
+    @_timedREPL
+    def ExeCodeREPL(self, code, timeoutSec=1, resultFormat=RESULT_AUTO) :
         if not code :
             return None
         self._threadStopReading()
         self._beginProcess()
         try :
-            return self._exeCodeREPL(code, timeoutSec)
+            return self._exeCodeREPL(code, timeoutSec, resultFormat=resultFormat)
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
-    def _sendFile(self, localFilename, remoteFilename, cbProgress=None, bufSize=2048) :
-        if not self._isConnected :
-            self._raiseConnectionError()
+    @staticmethod
+    def _buildTransferFrame(seq, data) :
+        h = pack('<HH', seq & 0xFFFF, len(data))
+        return h + pack('<I', crc32(data, crc32(h))) + data
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _isFramedTransferUnsupported(errMsg) :
+        return errMsg.startswith('ImportError') or errMsg.startswith('AttributeError')
+
+    # ---------------------------------------------------------------------------
+
+    def _serialDrain(self, idleSec=TRANSFER_DRAIN_SEC) :
+        r = b''
         try :
-            if cbProgress :
-                fileSize = stat(localFilename)[6]
-            f = open(localFilename, 'rb')
+            while True :
+                sleep(idleSec)
+                x = self._repl.in_waiting
+                if not x :
+                    self._addBytes('serialRead', len(r))
+                    return r
+                r += self._repl.read(x)
         except :
-            raise ESP32ControllerException('Cannot open local file "%s"' % localFilename)
+            self._raiseConnectionError()
+
+    # ---------------------------------------------------------------------------
+
+    def _addTransferStats(self, direction, remoteFilename, mode, size, payloadBytes, wireBytes, retries, startTime) :
+        sec   = max(time() - startTime, 0.001)
+        stats = dict( direction    = direction,
+                      filename     = remoteFilename,
+                      mode         = mode,
+                      size         = size,
+                      payloadBytes = payloadBytes,
+                      wireBytes    = wireBytes,
+                      ratio        = (round(size / payloadBytes, 2) if payloadBytes else 1.0),
+                      retries      = retries,
+                      seconds      = round(sec, 3),
+                      rate         = round(size / sec) )
+        self._transfersStats.append(stats)
+        if len(self._transfersStats) > self.TRANSFERS_STATS_MAX :
+            self._transfersStats.pop(0)
+        self._addStat(direction + 'Rate', stats['rate'], self.STATS_RATE_BOUNDS, 'B/s')
+        return stats
+
+    # ---------------------------------------------------------------------------
+
+    def _getDeflateCaps(self) :
+        # Bit 1: the device can inflate (deflate or uzlib module), bit 2: it can also compress,
+        if self._deflateCaps is None :
+            try :
+                self._deflateCaps = self._exeCodeREPL( 'def __c(w) :\n'                               +
+                                                       '  import io\n'                                +
+                                                       '  if not hasattr(io, "IOBase") :\n'           +
+                                                       '    return 0\n'                               +
+                                                       '  try :\n'                                    +
+                                                       '    import deflate\n'                         +
+                                                       '  except ImportError :\n'                     +
+                                                       '    try :\n'                                  +
+                                                       '      import uzlib\n'                         +
+                                                       '      return 1\n'                             +
+                                                       '    except ImportError :\n'                   +
+                                                       '      return 0\n'                             +
+                                                       '  try :\n'                                    +
+                                                       '    z = deflate.DeflateIO(io.BytesIO(), deflate.RAW, w)\n' +
+                                                       '    z.write(b"x")\n'                          +
+                                                       '    z.close()\n'                              +
+                                                       '    return 3\n'                               +
+                                                       '  except :\n'                                 +
+                                                       '    return 1\n'                               +
+                                                       'try :\n'                                      +
+                                                       '  print(__c(%s))\n' % self.TRANSFER_DEFLATE_WBITS +
+                                                       'finally :\n'                                  +
+                                                       '  del __c' )
+            except ESP32ControllerCodeException :
+                self._deflateCaps = 0
+        return self._deflateCaps
+
+    # ---------------------------------------------------------------------------
+
+    def _getTransferMode(self, transferMode, send, remoteFilename) :
+        mode = (transferMode or self._transferMode)
+        if mode == self.TRANSFER_MODE_AUTO and not send :
+            # Already compressed files are not worth deflating on the device side,
+            if remoteFilename.lower().endswith(self.TRANSFER_NO_DEFLATE_EXT) :
+                return self.TRANSFER_MODE_RAW
+        if mode in (self.TRANSFER_MODE_AUTO, self.TRANSFER_MODE_DEFLATE) :
+            if self._getDeflateCaps() & (1 if send else 2) :
+                return self.TRANSFER_MODE_DEFLATE
+            return self.TRANSFER_MODE_RAW
+        return mode
+
+    # ---------------------------------------------------------------------------
+
+    def _sendStreamRepr(self, stream, size, remoteFilename, cbProgress, bufSize, offset=0) :
         try :
-            self._exeCodeREPL('f=open(%s, "wb")' % repr(remoteFilename))
+            self._exeCodeREPL( 'f=open(%s, %s)\n' % (repr(remoteFilename), '"r+b"' if offset else '"wb"') +
+                               'f.seek(%s)' % offset )
         except ESP32ControllerCodeException :
             raise ESP32ControllerException('Cannot create remote file "%s"' % remoteFilename)
-        except :
-            raise
-        progress = 0
+        wireBytes = 0
+        progress  = 0
         while True :
-            try :
-                buf = f.read(bufSize)
-            except :
-                ESP32ControllerException('Cannot read content from local file "%s"' % localFilename)
+            buf = stream.read(bufSize)
             if not buf :
                 break
             progress += len(buf)
+            code      = 'f.write(%s)' % repr(buf)
+            wireBytes += len(code)
             try :
-                self._exeCodeREPL('f.write(%s)' % repr(buf), timeoutSec=3)
+                self._exeCodeREPL(code, timeoutSec=3)
             except ESP32ControllerCodeException :
                 raise ESP32ControllerException('Cannot write content to remote file "%s"' % remoteFilename)
-            except :
-                raise
             if cbProgress :
-                cbProgress(progress, fileSize)
+                cbProgress(progress, size)
         try :
             self._exeCodeREPL( 'f.close()\n' +
                                'del f' )
         except :
             pass
-        f.close()
+        return progress, wireBytes, 0
 
     # ---------------------------------------------------------------------------
 
-    def _recvFile(self, remoteFilename, localFilename, cbProgress=None, bufSize=2048) :
+    @staticmethod
+    def _framedSendCode(remoteFilename, b64, bufSize, wbits, offset=0) :
+        # Device program receiving framed data (see _buildTransferFrame) into a file,
+        return ( 'import sys, io, select, micropython\n'          +
+               'from binascii import crc32, a2b_base64\n'       +
+               'from struct import pack, unpack\n'              +
+               'def __t(path, b64, fs, wb, off) :\n'            +
+               '  i = sys.stdin.buffer\n'                       +
+               '  o = sys.stdout.buffer\n'                      +
+               '  p = select.poll()\n'                          +
+               '  p.register(sys.stdin, select.POLLIN)\n'       +
+               '  e = 0\n'                                      +
+               '  def rd(n) :\n'                                +
+               '    b = b""\n'                                  +
+               '    while len(b) < n :\n'                       +
+               '      b += i.read(n - len(b))\n'                +
+               '    return b\n'                                 +
+               '  def nak() :\n'                                +
+               '    o.write(pack("<BH", 0x15, e))\n'            +
+               '    while p.poll(100) :\n'                      +
+               '      i.read(1)\n'                              +
+               '  def rf() :\n'                                 +
+               '    nonlocal e\n'                               +
+               '    while True :\n'                             +
+               '      try :\n'                                  +
+               '        if b64 :\n'                             +
+               '          d = sys.stdin.readline()\n'           +
+               '          if not d.strip("\\x01\\x03\\n") :\n'     +
+               '            raise KeyboardInterrupt()\n'        +
+               '          d = a2b_base64(d)\n'                  +
+               '          h = d[:8]\n'                          +
+               '          d = d[8:]\n'                          +
+               '        else :\n'                               +
+               '          h = rd(8)\n'                          +
+               '          if not h.strip(b"\\x01\\x03") :\n'        +
+               '            raise KeyboardInterrupt()\n'        +
+               '        s, n, c = unpack("<HHI", h)\n'          +
+               '        if n > fs :\n'                          +
+               '          raise ValueError()\n'                 +
+               '        if not b64 :\n'                         +
+               '          d = rd(n)\n'                          +
+               '        if len(d) != n or crc32(d, crc32(h[:4])) != c :\n' +
+               '          raise ValueError()\n'                 +
+               '      except Exception :\n'                     +
+               '        nak()\n'                                +
+               '        continue\n'                             +
+               '      if s == e :\n'                            +
+               '        o.write(pack("<BH", 6, s))\n'           +
+               '        e = (e + 1) & 0xFFFF\n'                 +
+               '        return d\n'                             +
+               '      if (s - e) & 0xFFFF < 0x8000 :\n'         +
+               '        nak()\n'                                +
+               '      else :\n'                                 +
+               '        o.write(pack("<BH", 6, s))\n'           +
+               '  class S(io.IOBase if wb else object) :\n' +
+               '    def __init__(self) :\n'                     +
+               '      self.b = b""\n'                           +
+               '      self.eof = False\n'                       +
+               '    def readinto(self, b) :\n'                  +
+               '      if not self.b and not self.eof :\n'       +
+               '        self.b = rf()\n'                        +
+               '        self.eof = not self.b\n'                +
+               '      n = min(len(b), len(self.b))\n'           +
+               '      b[:n] = self.b[:n]\n'                     +
+               '      self.b = self.b[n:]\n'                    +
+               '      return n\n'                               +
+               '  with open(path, "r+b" if off else "wb") as f :\n' +
+               '    f.seek(off)\n'                              +
+               '    o.write(b"\\x06\\xff\\xff")\n'              +
+               '    if wb :\n'                                  +
+               '      s = S()\n'                                +
+               '      try :\n'                                  +
+               '        from deflate import DeflateIO, RAW\n'   +
+               '        z = DeflateIO(s, RAW, wb)\n'            +
+               '      except ImportError :\n'                   +
+               '        from uzlib import DecompIO\n'           +
+               '        z = DecompIO(s, -wb)\n'                 +
+               '      b = bytearray(fs)\n'                      +
+               '      m = memoryview(b)\n'                      +
+               '      while True :\n'                           +
+               '        n = z.readinto(b)\n'                    +
+               '        if not n :\n'                           +
+               '          break\n'                              +
+               '        f.write(m[:n])\n'                       +
+               '      while not s.eof :\n'                      +
+               '        s.eof = not rf()\n'                     +
+               '    else :\n'                                   +
+               '      while True :\n'                           +
+               '        d = rf()\n'                             +
+               '        if not d :\n'                           +
+               '          break\n'                              +
+               '        f.write(d)\n'                           +
+               'micropython.kbd_intr(-1)\n'                     +
+               'try :\n'                                        +
+               '  __t(%s, %s, %s, %s, %s)\n' % (repr(remoteFilename), b64, bufSize, wbits, offset) +
+               'finally :\n'                                    +
+               '  micropython.kbd_intr(3)\n'                    +
+               '  del __t' )
+
+    # ---------------------------------------------------------------------------
+
+    def _sendStreamFramed(self, stream, size, remoteFilename, cbProgress, bufSize, b64, wbits=None, offset=0) :
+        self._sendCodeToREPL(self._framedSendCode(remoteFilename, b64, bufSize, wbits, offset).encode())
+        r = self._serialRead(3, timeoutSec=3)
+        if r != b'\x06\xff\xff' :
+            try :
+                self._readREPLResult(timeoutSec=3, prefix=r.decode('ISO-8859-1'))
+            except ESP32ControllerCodeException as ex :
+                if self._isFramedTransferUnsupported(str(ex)) :
+                    return None
+                raise ESP32ControllerException('Cannot create remote file "%s"' % remoteFilename)
+            raise ESP32ControllerException('Data error on serial connection.')
+        window       = self.TRANSFER_WINDOW
+        pending      = { }
+        base         = 0
+        nextSeq      = 0
+        eof          = False
+        progress     = 0
+        errors       = 0
+        retries      = 0
+        wireBytes    = 0
+        payloadBytes = 0
+        while True :
+            while not eof and nextSeq - base < window :
+                buf   = stream.read(bufSize)
+                frame = self._buildTransferFrame(nextSeq, buf)
+                if b64 :
+                    frame = b2a_base64(frame)
+                pending[nextSeq] = (frame, len(buf))
+                self._serialWrite(frame)
+                wireBytes    += len(frame)
+                payloadBytes += len(buf)
+                nextSeq      += 1
+                eof           = not buf
+            if base == nextSeq :
+                break
+            try :
+                r = self._serialRead(3, timeoutSec=self.TRANSFER_TIMEOUT_SEC)
+            except ESP32ControllerSerialConnException :
+                raise
+            except ESP32ControllerException :
+                r = None
+            if r and r[0] == 0x06 :
+                seq = base + ((int.from_bytes(r[1:], 'little') - base) & 0xFFFF)
+                while base <= seq and base < nextSeq :
+                    progress += pending.pop(base)[1]
+                    base     += 1
+                    errors    = 0
+                if cbProgress :
+                    cbProgress(progress, size)
+                continue
+            if r and r[0] == 0x04 :
+                self._readREPLResult(timeoutSec=3, prefix=r.decode('ISO-8859-1'))
+                raise ESP32ControllerException('Data error on serial connection.')
+            # NAK, timeout or unexpected data: goes back to stop-and-wait and retransmits,
+            errors  += 1
+            retries += 1
+            if errors > self.TRANSFER_MAX_RETRIES :
+                raise ESP32ControllerException('Cannot write content to remote file "%s"' % remoteFilename)
+            window = 1
+            if r and r[0] == 0x15 :
+                base = base + ((int.from_bytes(r[1:], 'little') - base) & 0xFFFF)
+            self._serialDrain()
+            for seq in range(base, nextSeq) :
+                self._serialWrite(pending[seq][0])
+                wireBytes += len(pending[seq][0])
+        try :
+            self._readREPLResult(timeoutSec=3)
+        except ESP32ControllerCodeException :
+            raise ESP32ControllerException('Cannot write content to remote file "%s"' % remoteFilename)
+        return payloadBytes, wireBytes, retries
+
+    # ---------------------------------------------------------------------------
+
+    def _sendStream(self, stream, size, remoteFilename, cbProgress=None, bufSize=2048, transferMode=None, offset=0) :
         if not self._isConnected :
             self._raiseConnectionError()
+        startTime = time()
+        mode      = self._getTransferMode(transferMode, True, remoteFilename)
+        if cbProgress :
+            cbProgress(0, size)
+        zStream = None
+        if mode == self.TRANSFER_MODE_DEFLATE :
+            # Content is only sent deflated if a compressed sample of its beginning saves
+            # enough bytes, it is then compressed chunk by chunk while being sent,
+            sample = stream.read(self.TRANSFER_DEFLATE_SAMPLE)
+            z      = compressobj(9, DEFLATED, -self.TRANSFER_DEFLATE_WBITS)
+            if len(z.compress(sample) + z.flush()) <= len(sample) * (1 - self.TRANSFER_DEFLATE_SAVING) :
+                zStream = ESP32SendStream(stream, sample, self.TRANSFER_DEFLATE_WBITS)
+            else :
+                mode = self.TRANSFER_MODE_RAW
+            stream = ESP32SendStream(stream, sample)
+        r = None
+        if zStream :
+            def onProgress(progress, _) :
+                if cbProgress :
+                    cbProgress(min(zStream.GetSourcePos(progress), size), size)
+            r = self._sendStreamFramed( zStream, size, remoteFilename, onProgress, bufSize,
+                                        b64    = False,
+                                        wbits  = self.TRANSFER_DEFLATE_WBITS,
+                                        offset = offset )
+        elif mode != self.TRANSFER_MODE_REPR :
+            r = self._sendStreamFramed( stream, size, remoteFilename, cbProgress, bufSize,
+                                        b64    = (mode == self.TRANSFER_MODE_BASE64),
+                                        offset = offset )
+        if r is None and mode != self.TRANSFER_MODE_REPR :
+            self._transferMode = mode = self.TRANSFER_MODE_REPR
+        if r is None :
+            r = self._sendStreamRepr(stream, size, remoteFilename, cbProgress, bufSize, offset)
+        return self._addTransferStats('send', remoteFilename, mode, size, r[0], r[1], r[2], startTime)
+
+    # ---------------------------------------------------------------------------
+
+    def _recvStreamRepr(self, remoteFilename, cbProgress, bufSize, offset=0) :
         try :
-            if cbProgress :
-                fileSize = self._exeCodeREPL( 'from uos import stat\n' +
-                                              'print(stat(%s)[6])' % repr(remoteFilename) )
-            self._exeCodeREPL('f=open(%s, "rb")' % repr(remoteFilename))
+            size = self._exeCodeREPL( 'from uos import stat\n' +
+                                      'print(stat(%s)[6] - %s)' % (repr(remoteFilename), offset) )
+            self._exeCodeREPL( 'f=open(%s, "rb")\n' % repr(remoteFilename) +
+                               'f.seek(%s)' % offset )
         except ESP32ControllerCodeException :
             raise ESP32ControllerException('Cannot open remote file "%s"' % remoteFilename)
+        if cbProgress :
+            cbProgress(0, size)
+        wireBytes = 0
+        progress  = 0
+        try :
+            while True :
+                try :
+                    buf = self._exeCodeREPL('f.read(%s)' % bufSize, timeoutSec=3)
+                except ESP32ControllerCodeException :
+                    raise ESP32ControllerException('Cannot read content from remote file "%s"' % remoteFilename)
+                if not buf :
+                    break
+                wireBytes += len(repr(buf))
+                progress  += len(buf)
+                yield buf
+                if cbProgress :
+                    cbProgress(progress, size)
+        finally :
+            try :
+                self._exeCodeREPL( 'f.close()\n' +
+                                   'del f' )
+            except :
+                pass
+        return size, size, wireBytes, 0
+
+    # ---------------------------------------------------------------------------
+
+    def _recvStreamFramed(self, remoteFilename, cbProgress, bufSize, b64, wbits=None, offset=0) :
+        self._sendCodeToREPL( ( 'import sys, os, io, micropython\n'              +
+                                'from binascii import crc32, b2a_base64\n'       +
+                                'from struct import pack, unpack\n'              +
+                                'def __t(path, b64, fs, w, wb, off) :\n'         +
+                                '  i = sys.stdin.buffer\n'                       +
+                                '  o = sys.stdout.buffer\n'                      +
+                                '  def wr(b) :\n'                                +
+                                '    o.write(b2a_base64(b) if b64 else b)\n'     +
+                                '  def rd(n) :\n'                                +
+                                '    b = b""\n'                                  +
+                                '    while len(b) < n :\n'                       +
+                                '      b += i.read(n - len(b))\n'                +
+                                '    return b\n'                                 +
+                                '  class W(io.IOBase if wb else object) :\n'     +
+                                '    def __init__(self) :\n'                     +
+                                '      self.p = { }\n'                           +
+                                '      self.b = self.s = 0\n'                    +
+                                '      self.q = b""\n'                           +
+                                '    def write(self, d) :\n'                     +
+                                '      self.q += d\n'                            +
+                                '      while len(self.q) >= fs :\n'              +
+                                '        self.send(self.q[:fs])\n'               +
+                                '        self.q = self.q[fs:]\n'                 +
+                                '      return len(d)\n'                          +
+                                '    def send(self, d) :\n'                      +
+                                '      while self.s - self.b >= w :\n'           +
+                                '        self.wait()\n'                          +
+                                '      h = pack("<HH", self.s & 0xFFFF, len(d))\n' +
+                                '      d = h + pack("<I", crc32(d, crc32(h))) + d\n' +
+                                '      self.p[self.s] = d\n'                     +
+                                '      self.s += 1\n'                            +
+                                '      wr(d)\n'                                  +
+                                '    def wait(self) :\n'                         +
+                                '      c, k = unpack("<BH", rd(3))\n'            +
+                                '      if c != 6 and c != 0x15 :\n'              +
+                                '        raise KeyboardInterrupt()\n'            +
+                                '      k = self.b + ((k - self.b) & 0xFFFF)\n'   +
+                                '      if k < self.s :\n'                        +
+                                '        while self.b < k + (c == 6) :\n'        +
+                                '          del self.p[self.b]\n'                 +
+                                '          self.b += 1\n'                        +
+                                '        if c == 0x15 :\n'                       +
+                                '          for x in range(k, self.s) :\n'        +
+                                '            wr(self.p[x])\n'                    +
+                                '    def end(self) :\n'                          +
+                                '      if self.q :\n'                            +
+                                '        self.send(self.q)\n'                    +
+                                '      self.send(b"")\n'                         +
+                                '      while self.b < self.s :\n'                +
+                                '        self.wait()\n'                          +
+                                '  with open(path, "rb") as f :\n'               +
+                                '    f.seek(off)\n'                              +
+                                '    wr(pack("<BI", 6, os.stat(path)[6] - off))\n' +
+                                '    x = z = W()\n'                              +
+                                '    if wb :\n'                                  +
+                                '      from deflate import DeflateIO, RAW\n'     +
+                                '      z = DeflateIO(x, RAW, wb)\n'              +
+                                '    while True :\n'                             +
+                                '      d = f.read(fs)\n'                         +
+                                '      if not d :\n'                             +
+                                '        break\n'                                +
+                                '      z.write(d)\n'                             +
+                                '    if wb :\n'                                  +
+                                '      z.close()\n'                              +
+                                '    x.end()\n'                                  +
+                                'micropython.kbd_intr(-1)\n'                     +
+                                'try :\n'                                        +
+                                '  __t(%s, %s, %s, %s, %s, %s)\n' % ( repr(remoteFilename), b64, bufSize,
+                                                                     self.TRANSFER_WINDOW, wbits, offset ) +
+                                'finally :\n'                                    +
+                                '  micropython.kbd_intr(3)\n'                    +
+                                '  del __t' ).encode() )
+        try :
+            if b64 :
+                r = self._serialReadUntil(b'\n', timeoutSec=3)
+                if not r.startswith('\x04') :
+                    r = a2b_base64(r)
+            else :
+                r = self._serialRead(5, timeoutSec=3)
+                if r[0] == 0x04 :
+                    r = r.decode('ISO-8859-1')
+        except ESP32ControllerSerialConnException :
+            raise
         except :
+            raise ESP32ControllerException('Data error on serial connection.')
+        if isinstance(r, str) :
+            try :
+                self._readREPLResult(timeoutSec=3, prefix=r)
+            except ESP32ControllerCodeException as ex :
+                if self._isFramedTransferUnsupported(str(ex)) :
+                    return None
+                raise ESP32ControllerException('Cannot open remote file "%s"' % remoteFilename)
+            raise ESP32ControllerException('Data error on serial connection.')
+        size = int.from_bytes(r[1:5], 'little')
+        if cbProgress :
+            cbProgress(0, size)
+        try :
+            r = yield from self._recvFramesLoop(remoteFilename, cbProgress, bufSize, b64, wbits, size)
+        except GeneratorExit :
+            self._abortRecvStreamFramed()
+            raise
+        return (size, ) + r
+
+    # ---------------------------------------------------------------------------
+
+    def _abortRecvStreamFramed(self) :
+        # Reader closed before the end: the device stops on any code other than ACK or NAK,
+        self._serialWrite(pack('<BH', 0x18, 0))
+        r = b''
+        for _ in range(self.TRANSFER_MAX_RETRIES) :
+            r += self._serialDrain()
+            if self._endsWithREPLPrompt(r) :
+                return
+        raise ESP32ControllerException('Data error on serial connection.')
+
+    # ---------------------------------------------------------------------------
+
+    def _recvFramesLoop(self, remoteFilename, cbProgress, bufSize, b64, wbits, size) :
+        dz           = (decompressobj(-wbits) if wbits else None)
+        expSeq       = 0
+        progress     = 0
+        errors       = 0
+        retries      = 0
+        wireBytes    = 5
+        payloadBytes = 0
+        while True :
+            try :
+                if b64 :
+                    frame = a2b_base64(self._serialReadUntil(b'\n', timeoutSec=self.TRANSFER_TIMEOUT_SEC))
+                    wireBytes += (len(frame) + 2) // 3 * 4 + 1
+                    h, buf = frame[:8], frame[8:]
+                    seq, n, crc = unpack('<HHI', h)
+                else :
+                    h = self._serialRead(8, timeoutSec=self.TRANSFER_TIMEOUT_SEC)
+                    seq, n, crc = unpack('<HHI', h)
+                    if n > bufSize :
+                        raise ValueError()
+                    buf = (self._serialRead(n, timeoutSec=self.TRANSFER_TIMEOUT_SEC) if n else b'')
+                    wireBytes += 8 + n
+                if len(buf) != n or crc32(buf, crc32(h[:4])) != crc :
+                    raise ValueError()
+            except ESP32ControllerSerialConnException :
+                raise
+            except :
+                errors  += 1
+                retries += 1
+                if errors > self.TRANSFER_MAX_RETRIES or self._endsWithREPLPrompt(self._serialDrain()) :
+                    raise ESP32ControllerException('Cannot read content from remote file "%s"' % remoteFilename)
+                self._serialWrite(pack('<BH', 0x15, expSeq & 0xFFFF))
+                continue
+            if seq == expSeq & 0xFFFF :
+                errors = 0
+                self._serialWrite(pack('<BH', 0x06, seq))
+                expSeq       += 1
+                payloadBytes += n
+                if dz :
+                    buf = (dz.decompress(buf) if n else dz.flush())
+                if buf :
+                    progress += len(buf)
+                    yield buf
+                    if cbProgress :
+                        cbProgress(progress, size)
+                if not n :
+                    break
+        try :
+            self._readREPLResult(timeoutSec=3)
+        except ESP32ControllerCodeException :
+            raise ESP32ControllerException('Cannot read content from remote file "%s"' % remoteFilename)
+        return payloadBytes, wireBytes, retries
+
+    # ---------------------------------------------------------------------------
+
+    def _recvStreamChunks(self, remoteFilename, cbProgress=None, bufSize=2048, transferMode=None, offset=0) :
+        # Generator of the received data chunks, returns the transfer stats,
+        if not self._isConnected :
+            self._raiseConnectionError()
+        startTime = time()
+        mode      = self._getTransferMode(transferMode, False, remoteFilename)
+        r         = None
+        if mode != self.TRANSFER_MODE_REPR :
+            r = yield from self._recvStreamFramed( remoteFilename, cbProgress, bufSize,
+                                                   b64    = (mode == self.TRANSFER_MODE_BASE64),
+                                                   wbits  = ( self.TRANSFER_DEFLATE_WBITS
+                                                              if mode == self.TRANSFER_MODE_DEFLATE else None ),
+                                                   offset = offset )
+            if r is None :
+                self._transferMode = mode = self.TRANSFER_MODE_REPR
+        if r is None :
+            r = yield from self._recvStreamRepr(remoteFilename, cbProgress, bufSize, offset)
+        return self._addTransferStats('recv', remoteFilename, mode, r[0], r[1], r[2], r[3], startTime)
+
+    # ---------------------------------------------------------------------------
+
+    def _recvStream(self, remoteFilename, onData, cbProgress=None, bufSize=2048, transferMode=None, offset=0) :
+        chunks = self._recvStreamChunks(remoteFilename, cbProgress, bufSize, transferMode, offset)
+        while True :
+            try :
+                buf = next(chunks)
+            except StopIteration as ex :
+                return ex.value
+            onData(buf)
+
+    # ---------------------------------------------------------------------------
+
+    def _flushPendingTransfer(self) :
+        # A transfer program cut by a disconnection can still wait for frame data on the device,
+        # CTRL-C bytes fill the frame being read and are then seen as a header to stop it,
+        with ESP32Controller._pendingLock :
+            sizes = [ cp['bufSize'] for cp in ESP32Controller._pendingTransfers.values()
+                      if cp['port'] == self._devicePort ]
+        if sizes :
+            self._serialWrite(b'\x03' * (max(sizes) + 16) + b'\n')
+
+    # ---------------------------------------------------------------------------
+
+    def _getTransferID(self, direction, remoteFilename) :
+        return '%s:%s:%s' % (self._devicePort, direction, remoteFilename)
+
+    # ---------------------------------------------------------------------------
+
+    def _saveCheckpoint(self, direction, localFilename, remoteFilename, size, offset, digest, transferMode, bufSize) :
+        transferID = self._getTransferID(direction, remoteFilename)
+        with ESP32Controller._pendingLock :
+            ESP32Controller._pendingTransfers[transferID] = dict( id             = transferID,
+                                                                  port           = self._devicePort,
+                                                                  direction      = direction,
+                                                                  localFilename  = localFilename,
+                                                                  remoteFilename = remoteFilename,
+                                                                  size           = size,
+                                                                  offset         = offset,
+                                                                  sha256         = digest,
+                                                                  transferMode   = transferMode,
+                                                                  bufSize        = bufSize,
+                                                                  localMTime     = stat(localFilename).st_mtime_ns,
+                                                                  time           = time() )
+
+    # ---------------------------------------------------------------------------
+
+    def _removeCheckpoint(self, direction, remoteFilename) :
+        with ESP32Controller._pendingLock :
+            ESP32Controller._pendingTransfers.pop(self._getTransferID(direction, remoteFilename), None)
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _getLocalPrefixHash(localFilename, length) :
+        h = sha256()
+        with open(localFilename, 'rb') as f :
+            while length :
+                buf = f.read(min(length, 65536))
+                if not buf :
+                    break
+                h.update(buf)
+                length -= len(buf)
+        return h.hexdigest()
+
+    # ---------------------------------------------------------------------------
+
+    def _getRemotePrefixHash(self, remoteFilename, length) :
+        # Returns the remote file size, the hashed length (up to length) and its sha256,
+        return self._exeCodeREPL( 'def __h(p, n) :\n'                        +
+                                  '  import os\n'                            +
+                                  '  from hashlib import sha256\n'           +
+                                  '  from binascii import hexlify\n'         +
+                                  '  s = os.stat(p)[6]\n'                    +
+                                  '  r = n = min(n, s)\n'                    +
+                                  '  h = sha256()\n'                         +
+                                  '  m = memoryview(bytearray(1024))\n'      +
+                                  '  with open(p, "rb") as f :\n'            +
+                                  '    while r :\n'                          +
+                                  '      x = f.readinto(m[:min(r, 1024)])\n' +
+                                  '      if not x :\n'                       +
+                                  '        break\n'                          +
+                                  '      h.update(m[:x])\n'                  +
+                                  '      r -= x\n'                           +
+                                  '  return [s, n - r, hexlify(h.digest()).decode()]\n' +
+                                  'print(__h(%s, %s))\n' % (repr(remoteFilename), length) +
+                                  'del __h',
+                                  timeoutSec = self.RESUME_HASH_TIMEOUT_SEC )
+
+    # ---------------------------------------------------------------------------
+
+    def _getResumeOffset(self, direction, localFilename, remoteFilename) :
+        # The checkpoint offset is only trusted if the data before it is identical on both sides,
+        with ESP32Controller._pendingLock :
+            cp = ESP32Controller._pendingTransfers.get(self._getTransferID(direction, remoteFilename))
+        if not cp or cp['localFilename'] != localFilename or not cp['offset'] :
+            return 0
+        try :
+            localSize = stat(localFilename)[6]
+            if direction == 'send' :
+                if localSize != cp['size'] :
+                    return 0
+                length = cp['offset']
+            else :
+                length = min(cp['offset'], localSize)
+            remoteSize, length, digest = self._getRemotePrefixHash(remoteFilename, length)
+            if direction == 'recv' and remoteSize != cp['size'] :
+                return 0
+            if length == cp['offset'] and stat(localFilename).st_mtime_ns == cp['localMTime'] :
+                localDigest = cp['sha256']
+            else :
+                localDigest = self._getLocalPrefixHash(localFilename, length)
+            return (length if digest == localDigest else 0)
+        except ESP32ControllerSerialConnException :
             raise
+        except :
+            return 0
+
+    # ---------------------------------------------------------------------------
+
+    def _sendFile(self, localFilename, remoteFilename, cbProgress=None, bufSize=2048, transferMode=None, resumable=False) :
+        try :
+            fileSize = stat(localFilename)[6]
+            f = open(localFilename, 'rb')
+        except :
+            raise ESP32ControllerException('Cannot open local file "%s"' % localFilename)
+        try :
+            offset = (self._getResumeOffset('send', localFilename, remoteFilename) if resumable else 0)
+            done   = [ 0 ]
+            def onProgress(progress, size) :
+                done[0] = progress
+                if cbProgress :
+                    cbProgress(offset + progress, fileSize)
+            f.seek(offset)
+            try :
+                stats = self._sendStream(f, fileSize - offset, remoteFilename, onProgress, bufSize, transferMode, offset)
+            except :
+                if resumable and offset + done[0] :
+                    # The device ACKs a frame before writing it, so the acknowledged offset may be ahead
+                    # of the file: resuming is only safe because _getResumeOffset re-hashes the device prefix,
+                    self._saveCheckpoint( 'send', localFilename, remoteFilename, fileSize, offset + done[0],
+                                          self._getLocalPrefixHash(localFilename, offset + done[0]),
+                                          transferMode, bufSize )
+                raise
+            if resumable :
+                self._removeCheckpoint('send', remoteFilename)
+            stats['offset'] = offset
+            return stats
+        finally :
+            f.close()
+
+    # ---------------------------------------------------------------------------
+
+    def _recvFile(self, remoteFilename, localFilename, cbProgress=None, bufSize=2048, transferMode=None, resumable=False) :
+        offset = (self._getResumeOffset('recv', localFilename, remoteFilename) if resumable else 0)
         try :
-            f = open(localFilename, 'wb')
+            f = open(localFilename, ('r+b' if offset else 'wb'))
+            f.seek(offset)
+            f.truncate()
         except :
             raise ESP32ControllerException('Cannot create local file "%s"' % localFilename)
-        progress = 0
-        while True :
+        try :
+            h        = sha256()
+            done     = [ 0 ]
+            fileSize = [ 0 ]
+            f.seek(0)
+            while f.tell() < offset :
+                h.update(f.read(min(offset - f.tell(), 65536)))
+            def onData(buf) :
+                f.write(buf)
+                h.update(buf)
+                done[0] += len(buf)
+            def onProgress(progress, size) :
+                fileSize[0] = offset + size
+                if cbProgress :
+                    cbProgress(offset + progress, offset + size)
             try :
-                buf = self._exeCodeREPL('f.read(%s)' % bufSize, timeoutSec=3)
-            except ESP32ControllerCodeException :
-                raise ESP32ControllerException('Cannot read content from remote file "%s"' % remoteFilename)
+                stats = self._recvStream(remoteFilename, onData, onProgress, bufSize, transferMode, offset)
             except :
+                if resumable and offset + done[0] :
+                    self._saveCheckpoint( 'recv', localFilename, remoteFilename, fileSize[0], offset + done[0],
+                                          h.hexdigest(), transferMode, bufSize )
                 raise
-            if not buf :
-                break
-            progress += len(buf)
-            try :
-                f.write(buf)
-            except :
-                ESP32ControllerException('Cannot write content to local file "%s"' % localFilename)
-            if cbProgress :
-                cbProgress(progress, fileSize)
-        f.close()
-        try :
-            self._exeCodeREPL( 'f.close()\n' +
-                               'del f' )
-        except :
-            pass
+            if resumable :
+                self._removeCheckpoint('recv', remoteFilename)
+            stats['offset'] = offset
+            return stats
+        finally :
+            f.close()
 
     # ---------------------------------------------------------------------------
 
-    def SendFile(self, localFilename, remoteFilename, cbProgress=None, bufSize=2048
-    ) :
+    @_timedREPL
+    def SendFile(self, localFilename, remoteFilename, cbProgress=None, bufSize=2048, transferMode=None) :
         self._threadStopReading()
         self._beginProcess()
         try :
-            self._sendFile(localFilename, remoteFilename, cbProgress, bufSize)
+            return self._sendFile(localFilename, remoteFilename, cbProgress, bufSize, transferMode, resumable=True)
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
-    def RecvFile(self, remoteFilename, localFilename, cbProgress=None, bufSize=2048) :
+    @_timedREPL
+    def RecvFile(self, remoteFilename, localFilename, cbProgress=None, bufSize=2048, transferMode=None) :
         self._threadStopReading()
         self._beginProcess()
         try :
-            self._recvFile(remoteFilename, localFilename, cbProgress, bufSize)
+            return self._recvFile(remoteFilename, localFilename, cbProgress, bufSize, transferMode, resumable=True)
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
-    def GetFileContent(self, remoteFilename, cbProgress=None, bufSize=2048) :
+    @_timedREPL
+    def OpenRemoteFile(self, remoteFilename, cbProgress=None, bufSize=2048, transferMode=None) :
+        # The device stays busy until the returned file is read to the end or closed,
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
+        def onClose() :
+            self._endProcess()
+            self._threadStartReading()
         try :
-            try :
-                if cbProgress :
-                    fileSize = self._exeCodeREPL( 'from uos import stat\n' +
-                                                  'print(stat(%s)[6])' % repr(remoteFilename) )
-                    if not fileSize :
-                        return
-                    cbProgress(0, fileSize, b'')
-                self._exeCodeREPL('f=open(%s, "rb")' % repr(remoteFilename))
-            except ESP32ControllerCodeException :
-                raise ESP32ControllerException('Cannot open remote file "%s"' % remoteFilename)
-            except :
-                raise
-            content  = b''
-            progress = 0
-            while True :
-                try :
-                    buf = self._exeCodeREPL('f.read(%s)' % bufSize, timeoutSec=3)
-                except ESP32ControllerCodeException :
-                    raise ESP32ControllerException('Cannot read content from remote file "%s"' % remoteFilename)
-                except :
-                    raise
-                if not buf :
-                    break
-                content  += buf
+            chunks = self._recvStreamChunks(remoteFilename, cbProgress, bufSize, transferMode)
+        except :
+            onClose()
+            raise
+        return ESP32RemoteFile(chunks, onClose)
+
+    # ---------------------------------------------------------------------------
+
+    def GetPendingTransfers(self) :
+        with ESP32Controller._pendingLock :
+            return [ dict(cp) for cp in ESP32Controller._pendingTransfers.values()
+                     if cp['port'] == self._devicePort ]
+
+    # ---------------------------------------------------------------------------
+
+    def CancelPendingTransfer(self, transferID) :
+        with ESP32Controller._pendingLock :
+            return ESP32Controller._pendingTransfers.pop(transferID, None) is not None
+
+    # ---------------------------------------------------------------------------
+
+    def ResumePendingTransfer(self, transferID, cbProgress=None, bufSize=2048) :
+        with ESP32Controller._pendingLock :
+            cp = ESP32Controller._pendingTransfers.get(transferID)
+        if not cp :
+            raise ESP32ControllerException('No pending transfer "%s".' % transferID)
+        if cp['direction'] == 'send' :
+            return self.SendFile(cp['localFilename'], cp['remoteFilename'], cbProgress, bufSize, cp['transferMode'])
+        return self.RecvFile(cp['remoteFilename'], cp['localFilename'], cbProgress, bufSize, cp['transferMode'])
+
+    # ---------------------------------------------------------------------------
+
+    def GetFileContent(self, remoteFilename, cbProgress=None, bufSize=2048, transferMode=None) :
+        fileSize = [ 0 ]
+        def onProgress(progress, size) :
+            if not progress :
+                fileSize[0] = size
+                if cbProgress and size :
+                    cbProgress(0, size, b'')
+        content  = [ ]
+        progress = 0
+        with self.OpenRemoteFile(remoteFilename, onProgress, bufSize, transferMode) as f :
+            for buf in f :
+                content.append(buf)
                 progress += len(buf)
                 if cbProgress :
-                    cbProgress(progress, fileSize, buf)
-            try :
-                self._exeCodeREPL( 'f.close()\n' +
-                                   'del f' )
-            except :
-                pass
-            return content
-        finally :
-            self._endProcess()
-            self._threadStartReading()
+                    cbProgress(progress, fileSize[0], buf)
+        return b''.join(content)
 
     # ---------------------------------------------------------------------------
 
-    def PutFileContent(self, remoteFilename, contentData, cbProgress=None, bufSize=2048) :
+    @_timedREPL
+    def PutFileContent(self, remoteFilename, contentData, cbProgress=None, bufSize=2048, transferMode=None) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            try :
-                self._exeCodeREPL('f=open(%s, "wb")' % repr(remoteFilename))
-            except ESP32ControllerCodeException :
-                raise ESP32ControllerException('Cannot create remote file "%s"' % remoteFilename)
-            except :
-                raise
-            fileSize = len(contentData)
-            if fileSize :
-                if cbProgress :
-                    cbProgress(0, fileSize)
-                progress = 0
-                while True :
-                    try :
-                        progress += self._exeCodeREPL('f.write(%s)' % contentData[ progress : progress + bufSize ], timeoutSec=3)
-                    except ESP32ControllerCodeException :
-                        raise ESP32ControllerException('Cannot write content to remote file "%s"' % remoteFilename)
-                    except :
-                        raise
-                    if cbProgress :
-                        cbProgress(progress, fileSize)
-                    if progress == fileSize :
-                        break
-            try :
-                self._exeCodeREPL( 'f.close()\n' +
-                                   'del f' )
-            except :
-                pass
+            self._sendStream( BytesIO(contentData), len(contentData), remoteFilename,
+                              cbProgress, bufSize, transferMode )
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    def GetTransfersStats(self) :
+        return list(self._transfersStats)
+
+    # ---------------------------------------------------------------------------
+
+    @_timedREPL
     def SaveCfgKeys(self, keysValues) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -811,6 +3091,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def CheckCfgKeys(self, keysAndTypes) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -840,6 +3121,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def RemoveCfgKeys(self, keys) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -861,6 +3143,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetFlashRootPath(self) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -877,21 +3160,25 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetListDir(self, path) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            entries = self._exeCodeREPL( 'from os import ilistdir\n' +
-                                         '__ent = [ ]\n'             +
-                                         '__x = None\n'              +
-                                         'for __x in ilistdir(%s) :\n' % repr(path) +
-                                         '  __ent.append(__x)\n'     +
-                                         'print(__ent)\n'            +
-                                         'del __x\n'                 +
-                                         'del __ent\n',
-                                         timeoutSec = 3 )
+            if self._agentVersion :
+                entries = self._agentCall('listDir', path, timeoutSec=3)
+            else :
+                entries = self._exeCodeREPL( 'from os import ilistdir\n' +
+                                             '__ent = [ ]\n'             +
+                                             '__x = None\n'              +
+                                             'for __x in ilistdir(%s) :\n' % repr(path) +
+                                             '  __ent.append(__x)\n'     +
+                                             'print(__ent)\n'            +
+                                             'del __x\n'                 +
+                                             'del __ent\n',
+                                             timeoutSec = 3 )
             entries.sort( key = lambda entry: (entry[1] == 0x8000) )
             r = { }
             for x in entries :
@@ -903,6 +3190,63 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
+    def GetDirTree(self, path, maxEntries=DIR_TREE_MAX_ENTRIES, maxDepth=None, mtimes=True) :
+        # Walks the directories breadth first in one REPL round trip and returns
+        # { dirPath : { name : (size or None for a directory, mtime) } } for each fully listed one,
+        # maxDepth=1 only lists path and mtimes=False saves a stat per entry (mtimes are 0),
+        if not self._isConnected :
+            self._raiseConnectionError()
+        self._threadStopReading()
+        self._beginProcess()
+        try :
+            r = self._exeCodeREPL( 'def __tr(root, mx, md, mt) :\n'                 +
+                                   '  import os\n'                                  +
+                                   '  q = [ (root, 1) ]\n'                          +
+                                   '  c = 0\n'                                      +
+                                   '  while q and c < mx :\n'                       +
+                                   '    d, n = q.pop(0)\n'                          +
+                                   '    e = [x for x in os.ilistdir(d)]\n'          +
+                                   '    print("l\\t0\\t0\\t" + d)\n'               +
+                                   '    for x in e :\n'                             +
+                                   '      p = d.rstrip("/") + "/" + x[0]\n'         +
+                                   '      m = 0\n'                                  +
+                                   '      try :\n'                                  +
+                                   '        if mt :\n'                              +
+                                   '          m = os.stat(p)[8]\n'                  +
+                                   '      except :\n'                               +
+                                   '        pass\n'                                 +
+                                   '      if x[1] == 0x4000 :\n'                    +
+                                   '        if not md or n < md :\n'                +
+                                   '          q.append((p, n + 1))\n'               +
+                                   '        print("d\\t0\\t%d\\t%s" % (m, p))\n'     +
+                                   '      else :\n'                                 +
+                                   '        print("f\\t%d\\t%d\\t%s" % (x[3], m, p))\n' +
+                                   '    c += len(e)\n'                              +
+                                   '__tr(%s, %s, %s, %s)\n' % (repr(path), maxEntries, maxDepth, mtimes) +
+                                   'del __tr',
+                                   timeoutSec   = self.SYNC_TREE_TIMEOUT_SEC,
+                                   resultFormat = self.RESULT_TEXT )
+        finally :
+            self._endProcess()
+            self._threadStartReading()
+        tree    = { }
+        entries = None
+        for line in (r or '').split('\r\n') :
+            rec = line.split('\t', 3)
+            if len(rec) != 4 :
+                continue
+            t, size, mtime, p = rec
+            if t == 'l' :
+                # Records that follow belong to this directory,
+                entries = tree[p] = { }
+            elif entries is not None :
+                entries[p.rsplit('/', 1)[-1]] = ((int(size) if t == 'f' else None), int(mtime))
+        return tree
+
+    # ---------------------------------------------------------------------------
+
+    @_timedREPL
     def CreateDir(self, path) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -917,6 +3261,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def RenameFileOrDir(self, srcPath, dstPath) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -931,31 +3276,412 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    def _deleteFileOrRecurDir(self, path) :
+        self._exeCodeREPL( 'import os\n'                         +
+                           'def __rm(path) :\n'                  +
+                           '  if os.stat(path)[0] == 0x8000 :\n' +
+                           '    os.remove(path)\n'               +
+                           '  else :\n'                          +
+                           '    for f in os.listdir(path) :\n'   +
+                           '      __rm(path + "/" + f)\n'        +
+                           '    os.rmdir(path)\n'                +
+                           '__rm(%s)\n' % repr(path)             +
+                           'del __rm\n',
+                           timeoutSec = 5 )
+
+    # ---------------------------------------------------------------------------
+
+    @_timedREPL
     def DeleteFileOrRecurDir(self, path) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            self._exeCodeREPL( 'import os\n'                         +
-                               'def __rm(path) :\n'                  +
-                               '  if os.stat(path)[0] == 0x8000 :\n' +
-                               '    os.remove(path)\n'               +
-                               '  else :\n'                          +
-                               '    for f in os.listdir(path) :\n'   +
-                               '      __rm(path + "/" + f)\n'        +
-                               '    os.rmdir(path)\n'                +
-                               '__rm(%s)\n' % repr(path)             +
-                               'del __rm\n',
-                               timeoutSec = 5 )
+            self._deleteFileOrRecurDir(path)
+        finally :
+            self._endProcess()
+            self._threadStartReading()
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _isSyncExcluded(relPath, excludes) :
+        for name in relPath.split('/') :
+            for pattern in excludes :
+                if fnmatch(name, pattern) :
+                    return True
+        return False
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _isSyncProtected(remotePath, relPath) :
+        # Jama system files of the device are never overwritten nor deleted by a sync,
+        path = '/' + (remotePath.strip('/') + '/' + relPath).strip('/')
+        for x in ESP32Controller.SYNC_PROTECTED_PATHS :
+            if path == x or path.startswith(x + '/') :
+                return True
+        return False
+
+    # ---------------------------------------------------------------------------
+
+    def _getLocalTree(self, localPath, excludes) :
+        # Returns { relPath: (size, sha256) } with (None, None) for directories,
+        # excluded trees are pruned from the walk and excluded files are never hashed,
+        if not isdir(localPath) :
+            return None
+        tree = { }
+        for dirPath, dirNames, fileNames in walk(localPath) :
+            relDir = relpath(dirPath, localPath).replace('\\', '/')
+            relDir = ('' if relDir == '.' else relDir + '/')
+            dirNames[:] = [ x for x in dirNames if not self._isSyncExcluded(x, excludes) ]
+            for name in dirNames :
+                tree[relDir + name] = (None, None)
+            for name in fileNames :
+                if self._isSyncExcluded(name, excludes) :
+                    continue
+                h = sha256()
+                with open(pathJoin(dirPath, name), 'rb') as f :
+                    while True :
+                        buf = f.read(65536)
+                        if not buf :
+                            break
+                        h.update(buf)
+                tree[relDir + name] = (stat(pathJoin(dirPath, name))[6], h.hexdigest())
+        return tree
+
+    # ---------------------------------------------------------------------------
+
+    def _getRemoteTree(self, remotePath, excludes) :
+        # The whole device tree (sizes and sha256 digests) is fetched in one REPL round trip,
+        tree = self._exeCodeREPL( 'def __tr(root) :\n'                          +
+                                  '  import os\n'                               +
+                                  '  from binascii import hexlify\n'            +
+                                  '  try :\n'                                   +
+                                  '    from hashlib import sha256\n'            +
+                                  '  except ImportError :\n'                    +
+                                  '    sha256 = None\n'                         +
+                                  '  try :\n'                                   +
+                                  '    if os.stat(root)[0] != 0x4000 :\n'       +
+                                  '      return None\n'                         +
+                                  '  except OSError :\n'                        +
+                                  '    return None\n'                           +
+                                  '  b = bytearray(1024)\n'                     +
+                                  '  m = memoryview(b)\n'                       +
+                                  '  r = [ ]\n'                                 +
+                                  '  def h(p) :\n'                              +
+                                  '    if not sha256 :\n'                       +
+                                  '      return None\n'                         +
+                                  '    s = sha256()\n'                          +
+                                  '    with open(p, "rb") as f :\n'             +
+                                  '      while True :\n'                        +
+                                  '        n = f.readinto(b)\n'                 +
+                                  '        if not n :\n'                        +
+                                  '          break\n'                           +
+                                  '        s.update(m[:n])\n'                   +
+                                  '    return hexlify(s.digest()).decode()\n'   +
+                                  '  def w(d, rel) :\n'                         +
+                                  '    for e in os.ilistdir(d) :\n'             +
+                                  '      p = d.rstrip("/") + "/" + e[0]\n'      +
+                                  '      if e[1] == 0x4000 :\n'                 +
+                                  '        r.append((rel + e[0], None, None))\n' +
+                                  '        w(p, rel + e[0] + "/")\n'            +
+                                  '      else :\n'                              +
+                                  '        r.append((rel + e[0], e[3], h(p)))\n' +
+                                  '  w(root, "")\n'                             +
+                                  '  return r\n'                                +
+                                  'import ujson\n'                              +
+                                  'print(ujson.dumps(__tr(%s)))\n' % repr(remotePath) +
+                                  'del __tr',
+                                  timeoutSec   = self.SYNC_TREE_TIMEOUT_SEC,
+                                  resultFormat = self.RESULT_JSON )
+        if tree is None :
+            return None
+        return { x[0] : (x[1], x[2]) for x in tree if not self._isSyncExcluded(x[0], excludes) }
+
+    # ---------------------------------------------------------------------------
+
+    def _planSync(self, localTree, remoteTree, direction, delete, conflictWinner) :
+        actions   = [ ]
+        unchanged = 0
+        deleted   = [ ]
+        for path in sorted(set(localTree) | set(remoteTree)) :
+            l = localTree.get(path)
+            r = remoteTree.get(path)
+            if l and r and l[0] is None and r[0] is None :
+                continue
+            if l and r and l[1] and l == r :
+                unchanged += 1
+                continue
+            if direction == self.SYNC_BOTH :
+                toDevice = ( (conflictWinner == self.SYNC_TO_DEVICE) if l and r else bool(l) )
+            else :
+                toDevice = (direction == self.SYNC_TO_DEVICE)
+            src, dst   = ((l, r) if toDevice else (r, l))
+            side       = ('Remote' if toDevice else 'Local')
+            if any(path.startswith(x + '/') for x in deleted) :
+                continue
+            if not src :
+                if delete and direction != self.SYNC_BOTH :
+                    actions.append(('delete' + side, path))
+                    deleted.append(path)
+                continue
+            if dst and (src[0] is None) != (dst[0] is None) :
+                actions.append(('delete' + side, path))
+                deleted.append(path)
+            if src[0] is None :
+                actions.append(('create%sDir' % side, path))
+            else :
+                actions.append((('upload' if toDevice else 'download'), path))
+        return actions, unchanged
+
+    # ---------------------------------------------------------------------------
+
+    @_timedREPL
+    def SyncDir( self,
+                 localPath,
+                 remotePath,
+                 direction      = SYNC_TO_DEVICE,
+                 delete         = False,
+                 dryRun         = False,
+                 excludes       = SYNC_DEFAULT_EXCLUDES,
+                 conflictWinner = SYNC_TO_DEVICE,
+                 cbProgress     = None,
+                 transferMode   = None ) :
+        if not self._isConnected :
+            self._raiseConnectionError()
+        startTime = time()
+        localTree = self._getLocalTree(localPath, excludes)
+        if localTree is None and direction != self.SYNC_FROM_DEVICE :
+            raise ESP32ControllerException('Cannot open local directory "%s"' % localPath)
+        self._threadStopReading()
+        self._beginProcess()
+        try :
+            remoteTree = self._getRemoteTree(remotePath, excludes)
+            if remoteTree is None and direction != self.SYNC_TO_DEVICE :
+                raise ESP32ControllerException('Cannot open remote directory "%s"' % remotePath)
+            for tree in (localTree, remoteTree) :
+                for path in [ x for x in (tree or { }) if self._isSyncProtected(remotePath, x) ] :
+                    del tree[path]
+            actions, unchanged = self._planSync( (localTree or { }), (remoteTree or { }),
+                                                 direction, delete, conflictWinner )
+            if remoteTree is None :
+                actions.insert(0, ('createRemoteDir', ''))
+            elif localTree is None :
+                actions.insert(0, ('createLocalDir', ''))
+            size = 0
+            for action, path in actions :
+                if action == 'upload' :
+                    size += localTree[path][0]
+                elif action == 'download' :
+                    size += remoteTree[path][0]
+            if not dryRun :
+                for i, (action, path) in enumerate(actions) :
+                    lp = (pathJoin(localPath, *path.split('/')) if path else localPath)
+                    rp = (remotePath.rstrip('/') + '/' + path if path else remotePath)
+                    if action == 'upload' :
+                        self._sendFile(lp, rp, transferMode=transferMode)
+                    elif action == 'download' :
+                        self._recvFile(rp, lp, transferMode=transferMode)
+                    elif action == 'createRemoteDir' :
+                        self._exeCodeREPL( 'from os import mkdir\n' +
+                                           'mkdir(%s)' % repr(rp) )
+                    elif action == 'createLocalDir' :
+                        makedirs(lp, exist_ok=True)
+                    elif action == 'deleteRemote' :
+                        self._deleteFileOrRecurDir(rp)
+                    elif action == 'deleteLocal' :
+                        if isdir(lp) :
+                            rmtree(lp)
+                        else :
+                            osRemove(lp)
+                    if cbProgress :
+                        cbProgress(i + 1, len(actions))
+        finally :
+            self._endProcess()
+            self._threadStartReading()
+        return dict( dryRun    = dryRun,
+                     actions   = actions,
+                     unchanged = unchanged,
+                     size      = size,
+                     seconds   = round(time() - startTime, 3) )
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _mountCode(mountPoint, readAhead, chdir) :
+        # Device VFS forwarding stat/ilistdir/open to the host over the REPL link,
+        # requests are "\x18" + JSON line on stdout and responses are read on stdin,
+        return ( 'def __m(mp, ra, cd) :\n'                               +
+                 '  import os, io, sys, json, micropython\n'             +
+                 '  from struct import unpack\n'                         +
+                 '  i = sys.stdin.buffer\n'                              +
+                 '  o = sys.stdout.buffer\n'                             +
+                 '  def rd(n) :\n'                                       +
+                 '    b = b""\n'                                         +
+                 '    while len(b) < n :\n'                              +
+                 '      b += i.read(n - len(b))\n'                       +
+                 '    return b\n'                                        +
+                 '  def rq(*a) :\n'                                      +
+                 '    micropython.kbd_intr(-1)\n'                        +
+                 '    try :\n'                                           +
+                 '      o.write(b"\\x18" + json.dumps(a).encode() + b"\\n")\n' +
+                 '      n = unpack("<i", rd(4))[0]\n'                    +
+                 '      if n < 0 :\n'                                    +
+                 '        raise OSError(-n)\n'                           +
+                 '      return rd(n)\n'                                  +
+                 '    finally :\n'                                       +
+                 '      micropython.kbd_intr(3)\n'                       +
+                 '  class F(io.IOBase) :\n'                              +
+                 '    def __init__(self, p, b, t) :\n'                   +
+                 '      self.p = p\n'                                    +
+                 '      self.b = b\n'                                    +
+                 '      self.i = 0\n'                                    +
+                 '      self.o = len(b)\n'                               +
+                 '      self.e = len(b) < ra\n'                          +
+                 '      self.t = t\n'                                    +
+                 '    def ioctl(self, r, a) :\n'                         +
+                 '      return 0\n'                                      +
+                 '    def readinto(self, b) :\n'                         +
+                 '      if self.i >= len(self.b) :\n'                    +
+                 '        if self.e :\n'                                 +
+                 '          return 0\n'                                  +
+                 '        n = max(len(b), ra)\n'                         +
+                 '        self.b = rq("read", self.p, self.o, n)\n'      +
+                 '        self.i = 0\n'                                  +
+                 '        self.o += len(self.b)\n'                       +
+                 '        self.e = len(self.b) < n\n'                    +
+                 '      n = min(len(b), len(self.b) - self.i)\n'         +
+                 '      b[:n] = self.b[self.i:self.i+n]\n'               +
+                 '      self.i += n\n'                                   +
+                 '      return n\n'                                      +
+                 '    def read(self, n=-1) :\n'                          +
+                 '      r = b""\n'                                       +
+                 '      while n < 0 or len(r) < n :\n'                   +
+                 '        b = bytearray(ra if n < 0 else n - len(r))\n'  +
+                 '        x = self.readinto(b)\n'                        +
+                 '        if not x :\n'                                  +
+                 '          break\n'                                     +
+                 '        r += b[:x]\n'                                  +
+                 '      return (r.decode() if self.t else r)\n'          +
+                 '    def readline(self) :\n'                            +
+                 '      r = b""\n'                                       +
+                 '      b = bytearray(1)\n'                              +
+                 '      while self.readinto(b) :\n'                      +
+                 '        r += b\n'                                      +
+                 '        if b[0] == 10 :\n'                             +
+                 '          break\n'                                     +
+                 '      return (r.decode() if self.t else r)\n'          +
+                 '    def close(self) :\n'                               +
+                 '      self.b = b""\n'                                  +
+                 '      self.e = True\n'                                 +
+                 '    def __enter__(self) :\n'                           +
+                 '      return self\n'                                   +
+                 '    def __exit__(self, *a) :\n'                        +
+                 '      self.close()\n'                                  +
+                 '  class V :\n'                                         +
+                 '    def __init__(self) :\n'                            +
+                 '      self.c = "/"\n'                                  +
+                 '    def ab(self, p) :\n'                               +
+                 '      return (p if p.startswith("/") else self.c.rstrip("/") + "/" + p)\n' +
+                 '    def mount(self, ro, mk) :\n'                       +
+                 '      pass\n'                                          +
+                 '    def umount(self) :\n'                              +
+                 '      pass\n'                                          +
+                 '    def chdir(self, p) :\n'                            +
+                 '      p = self.ab(p)\n'                                +
+                 '      if self.stat(p)[0] != 0x4000 :\n'                +
+                 '        raise OSError(20)\n'                           +
+                 '      self.c = p\n'                                    +
+                 '    def getcwd(self) :\n'                              +
+                 '      return self.c\n'                                 +
+                 '    def ilistdir(self, p) :\n'                         +
+                 '      for x in json.loads(rq("ilistdir", self.ab(p))) :\n' +
+                 '        yield (x[0], x[1], 0, x[2])\n'                 +
+                 '    def stat(self, p) :\n'                             +
+                 '      m, s, t = json.loads(rq("stat", self.ab(p)))\n'  +
+                 '      return (m, 0, 0, 0, 0, 0, s, t, t, t)\n'         +
+                 '    def statvfs(self, p) :\n'                          +
+                 '      return (0, 0, 0, 0, 0, 0, 0, 0, 0, 255)\n'       +
+                 '    def open(self, p, m) :\n'                          +
+                 '      if [x for x in "wax+" if x in m] :\n'            +
+                 '        raise OSError(30)\n'                           +
+                 '      p = self.ab(p)\n'                                +
+                 '      return F(p, rq("read", p, 0, ra), "b" not in m)\n' +
+                 '    def mkdir(self, p) :\n'                            +
+                 '      raise OSError(30)\n'                             +
+                 '    remove = rmdir = mkdir\n'                          +
+                 '    def rename(self, a, b) :\n'                        +
+                 '      raise OSError(30)\n'                             +
+                 '  try :\n'                                             +
+                 '    os.umount(mp)\n'                                   +
+                 '  except OSError :\n'                                  +
+                 '    pass\n'                                            +
+                 '  os.mount(V(), mp)\n'                                 +
+                 '  if cd :\n'                                           +
+                 '    os.chdir(mp)\n'                                    +
+                 '__m(%s, %s, %s)\n' % (repr(mountPoint), readAhead, chdir) +
+                 'del __m' )
+
+    # ---------------------------------------------------------------------------
+
+    @_timedREPL
+    def MountHostDir(self, localPath, mountPoint=MOUNT_DEFAULT_POINT, chdir=True, readAheadSize=MOUNT_READ_AHEAD_SIZE) :
+        # Mounts a host directory read-only on the device, files are served on demand by this controller,
+        if not self._isConnected :
+            self._raiseConnectionError()
+        if not isdir(localPath) :
+            raise ESP32ControllerException('Cannot open local directory "%s"' % localPath)
+        mountPoint = '/' + mountPoint.strip('/')
+        self._threadStopReading()
+        self._beginProcess()
+        try :
+            self._hostMount = ESP32HostMount(localPath, mountPoint)
+            try :
+                self._exeCodeREPL( self._mountCode(mountPoint, readAheadSize, chdir),
+                                   timeoutSec = self.MOUNT_TIMEOUT_SEC )
+            except :
+                self._hostMount = None
+                raise
+        finally :
+            self._endProcess()
+            self._threadStartReading()
+
+    # ---------------------------------------------------------------------------
+
+    @_timedREPL
+    def UnmountHostDir(self) :
+        if not self._hostMount :
+            return
+        if not self._isConnected :
+            self._raiseConnectionError()
+        mountPoint = self._hostMount.GetMountPoint()
+        self._threadStopReading()
+        self._beginProcess()
+        try :
+            self._exeCodeREPL( 'import os\n'                                 +
+                               'if os.getcwd().startswith(%s) :\n' % repr(mountPoint) +
+                               '  os.chdir("/")\n'                           +
+                               'try :\n'                                     +
+                               '  os.umount(%s)\n' % repr(mountPoint)        +
+                               'except OSError :\n'                          +
+                               '  pass' )
         finally :
+            self._hostMount = None
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    def GetHostMount(self) :
+        # Returns the local path, mount point and requests stats or None,
+        return (self._hostMount.GetStats() if self._hostMount else None)
+
+    # ---------------------------------------------------------------------------
+
     def GetAvailableModules(self) :
-        r = self.ExeCodeREPL('help("modules")')
+        r = self.ExeCodeREPL('help("modules")', resultFormat=self.RESULT_TEXT)
         modList = [ ]
         for line in r.split('\r\n') :
             if line != 'Plus any modules on the filesystem' :
@@ -968,6 +3694,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def CreateBootConfig(self) :
         rootPath = self.GetFlashRootPath()
         self._threadStopReading()
@@ -998,6 +3725,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def CheckBootConfig(self) :
         rootPath = self.GetFlashRootPath()
         self._threadStopReading()
@@ -1015,6 +3743,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def RemoveBootConfig(self) :
         rootPath = self.GetFlashRootPath()
         self._threadStopReading()
@@ -1045,12 +3774,51 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
+    def InstallAgent(self) :
+        rootPath = self.GetFlashRootPath()
+        self._threadStopReading()
+        self._beginProcess()
+        try :
+            self._sendFile(self.AGENT_MPY_FILENAME, '%s/%s' % (rootPath, self.AGENT_MPY_FILENAME))
+            modName = self.AGENT_MPY_FILENAME.rsplit('.', 1)[0]
+            self._exeCodeREPL( 'import sys\n' +
+                               'sys.modules.pop(%s, None)' % repr(modName) )
+            return (self._detectAgent() == self.AGENT_VERSION)
+        finally :
+            self._endProcess()
+            self._threadStartReading()
+
+    # ---------------------------------------------------------------------------
+
+    @_timedREPL
+    def RemoveAgent(self) :
+        rootPath = self.GetFlashRootPath()
+        self._threadStopReading()
+        self._beginProcess()
+        try :
+            modName = self.AGENT_MPY_FILENAME.rsplit('.', 1)[0]
+            self._agentVersion = None
+            self._exeCodeREPL( 'import os, sys\n'                            +
+                               'sys.modules.pop(%s, None)\n' % repr(modName) +
+                               'try :\n'                                     +
+                               '  os.remove(%s)\n' % repr('%s/%s' % (rootPath, self.AGENT_MPY_FILENAME)) +
+                               'except :\n'                                  +
+                               '  pass',
+                               timeoutSec = 3 )
+        finally :
+            self._endProcess()
+            self._threadStartReading()
+
+    # ---------------------------------------------------------------------------
+
+    def GetAgentVersion(self) :
+        return self._agentVersion
+
+    # ---------------------------------------------------------------------------
+
     def CheckAllConfigurations(self) :
-        x = dict( MCU = ('mcufreq',   int),
-                  STA = ('ssid',      str),
-                  AP  = ('apssid',    str),
-                  ETH = ('ethdriver', str),
-                  SD  = ('sdmountpt', str) )
+        x = self.CONFIGURATIONS_KEYS
         keysAndTypes = dict()
         for n in list(x.values()) :
             keysAndTypes[n[0]] = n[1]
@@ -1073,6 +3841,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def ScanWiFiNetworks(self) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1095,6 +3864,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def WiFiConnect(self, ssid, key=None) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1151,6 +3921,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def WifiOpenAP(self, ssid, auth=None, key='', maxcli=3) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1190,20 +3961,25 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetWiFiActive(self, ap=False) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            return self._exeCodeREPL( 'import network\n' +
-                                      'print(network.WLAN(network.%s).active())' % ('AP_IF' if ap else 'STA_IF') )
+            if self._agentVersion :
+                return self._agentCall('wifiActive', ap)
+            else :
+                return self._exeCodeREPL( 'import network\n' +
+                                          'print(network.WLAN(network.%s).active())' % ('AP_IF' if ap else 'STA_IF') )
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def CloseWiFi(self, ap=False) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1218,55 +3994,63 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetWiFiMacAddr(self, ap=False) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            macAddr = self._exeCodeREPL( 'import network\n' +
-                                         'print(network.WLAN(network.%s).config("mac"))' % ('AP_IF' if ap else 'STA_IF') )
-            return self._macAddrToStr(macAddr)
+            if self._agentVersion :
+                return self._macAddrToStr(self._agentCall('wifiMacAddr', ap))
+            else :
+                macAddr = self._exeCodeREPL( 'import network\n' +
+                                             'print(network.WLAN(network.%s).config("mac"))' % ('AP_IF' if ap else 'STA_IF') )
+                return self._macAddrToStr(macAddr)
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetWiFiConfig(self, ap=False) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            self._exeCodeREPL('import network')
-            interf = ('AP_IF' if ap else 'STA_IF')
-            try :
-                ssid = self._exeCodeREPL('network.WLAN(network.%s).config("ssid")' % interf)
-            except :
-                ssid = self._exeCodeREPL('network.WLAN(network.%s).config("essid")' % interf)
-            conf = self._exeCodeREPL('network.WLAN(network.%s).ifconfig()' % interf)
-            return dict( ssid    = ssid,
-                         ip      = conf[0],
-                         mask    = conf[1],
-                         gateway = conf[2],
-                         dns     = conf[3] )
+            if self._agentVersion :
+                ssid, conf = self._agentCall('wifiConfig', ap)
+            else :
+                self._exeCodeREPL('import network')
+                interf = ('AP_IF' if ap else 'STA_IF')
+                try :
+                    ssid = self._exeCodeREPL('network.WLAN(network.%s).config("ssid")' % interf)
+                except :
+                    ssid = self._exeCodeREPL('network.WLAN(network.%s).config("essid")' % interf)
+                conf = self._exeCodeREPL('network.WLAN(network.%s).ifconfig()' % interf)
+            return self._wifiConfigToDict(ssid, conf)
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetAPClientsAddr(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            r = self._exeCodeREPL( 'import network\n' +
-                                    'print(network.WLAN(network.AP_IF).status("stations"))' )
+            if self._agentVersion :
+                r = self._agentCall('apClientsAddr')
+            else :
+                r = [ x[0] for x in self._exeCodeREPL( 'import network\n' +
+                                                       'print(network.WLAN(network.AP_IF).status("stations"))' ) ]
             for i in range(len(r)) :
-                r[i] = self._macAddrToStr(r[i][0])
+                r[i] = self._macAddrToStr(r[i])
             return r
         finally :
             self._endProcess()
@@ -1274,37 +4058,32 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetETHInfo(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            r = self._exeCodeREPL( 'import network\n'                +
-                                   'if hasattr(network, "LAN") :\n'  +
-                                   '  try :\n'                       +
-                                   '    __lan = network.LAN()\n'     +
-                                   '    print([__lan.config("mac"), __lan.status(), __lan.ifconfig()])\n' +
-                                   '    del __lan\n'                 +
-                                   '  except :\n'                    +
-                                   '    print([ ])' )
-            if r :
-                return dict( mac     = self._macAddrToStr(r[0]),
-                             enable  = (r[1] != 0 and r[1] != 2),
-                             linkup  = (r[1] == 3 or  r[1] == 5),
-                             gotip   = (r[1] == 5),
-                             ip      = r[2][0],
-                             mask    = r[2][1],
-                             gateway = r[2][2],
-                             dns     = r[2][3] )
+            if self._agentVersion :
+                r = self._agentCall('ethInfo')
             else :
-                return (None if r is None else dict())
+                r = self._exeCodeREPL( 'import network\n'                +
+                                       'if hasattr(network, "LAN") :\n'  +
+                                       '  try :\n'                       +
+                                       '    __lan = network.LAN()\n'     +
+                                       '    print([__lan.config("mac"), __lan.status(), __lan.ifconfig()])\n' +
+                                       '    del __lan\n'                 +
+                                       '  except :\n'                    +
+                                       '    print([ ])' )
+            return self._ethInfoToDict(r)
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def InitETHDriver(self, driverName, phyAddr, mdcPinNum, mdioPinNum, powerPinNum=None) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1340,6 +4119,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def EnableETHInterface(self) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1365,6 +4145,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def DisableETHInterface(self) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1390,21 +4171,26 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetBLEActive(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            return self._exeCodeREPL( 'import bluetooth\n' +
-                                      'print(bluetooth.BLE().active())',
-                                      timeoutSec = 3 )
+            if self._agentVersion :
+                return self._agentCall('bleActive', timeoutSec=3)
+            else :
+                return self._exeCodeREPL( 'import bluetooth\n' +
+                                          'print(bluetooth.BLE().active())',
+                                          timeoutSec = 3 )
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def CloseBLE(self) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1420,6 +4206,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetBLEMacAddr(self, ap=False) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1442,108 +4229,125 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetInternetOk(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            return self._exeCodeREPL( 'import network\n'                                               +
-                                      'try :\n'                                                        +
-                                      '  __lanOk = network.LAN().status() == 5\n'                      +
-                                      'except :\n'                                                     +
-                                      '  __lanOk = False\n'                                            +
-                                      'if __lanOk or network.WLAN(network.STA_IF).isconnected() :\n'   +
-                                      '  import socket\n'                                              +
-                                      '  __s = socket.socket()\n'                                      +
-                                      '  try :\n'                                                      +
-                                      '    __s.connect(socket.getaddrinfo("google.com", 80)[0][-1])\n' +
-                                      '    __s.close()\n'                                              +
-                                      '    print(True)\n'                                              +
-                                      '  except :\n'                                                   +
-                                      '    print(False)\n'                                             +
-                                      '  del __s\n'                                                    +
-                                      'else :\n'                                                       +
-                                      '  print(False)\n'                                               +
-                                      'del __lanOk',
-                                      timeoutSec = 7 )
+            if self._agentVersion :
+                return self._agentCall('internetOk', timeoutSec=7)
+            else :
+                return self._exeCodeREPL( 'import network\n'                                               +
+                                          'try :\n'                                                        +
+                                          '  __lanOk = network.LAN().status() == 5\n'                      +
+                                          'except :\n'                                                     +
+                                          '  __lanOk = False\n'                                            +
+                                          'if __lanOk or network.WLAN(network.STA_IF).isconnected() :\n'   +
+                                          '  import socket\n'                                              +
+                                          '  __s = socket.socket()\n'                                      +
+                                          '  try :\n'                                                      +
+                                          '    __s.connect(socket.getaddrinfo("google.com", 80)[0][-1])\n' +
+                                          '    __s.close()\n'                                              +
+                                          '    print(True)\n'                                              +
+                                          '  except :\n'                                                   +
+                                          '    print(False)\n'                                             +
+                                          '  del __s\n'                                                    +
+                                          'else :\n'                                                       +
+                                          '  print(False)\n'                                               +
+                                          'del __lanOk',
+                                          timeoutSec = 7 )
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetNetworksMinInfo(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            return self._exeCodeREPL( 'import network\n' +
-                                      '__r = dict()\n'   +
-                                      'try :\n'          +
-                                      '  __r["staRSSI"] = network.WLAN(network.STA_IF).status("rssi")\n' +
-                                      'except :\n'       +
-                                      '  pass\n'         +
-                                      'try :\n'          +
-                                      '  __r["apStaCount"] = len(network.WLAN(network.AP_IF).status("stations"))\n' +
-                                      'except :\n'       +
-                                      '  pass\n'         +
-                                      'try :\n'          +
-                                      '  __r["ethStatus"] = network.LAN().status()\n' +
-                                      'except :\n'       +
-                                      '  pass\n'         +
-                                      'print(__r)\n'     +
-                                      'del __r' )
+            if self._agentVersion :
+                return self._agentCall('networksMinInfo')
+            else :
+                return self._exeCodeREPL( 'import network\n' +
+                                          '__r = dict()\n'   +
+                                          'try :\n'          +
+                                          '  __r["staRSSI"] = network.WLAN(network.STA_IF).status("rssi")\n' +
+                                          'except :\n'       +
+                                          '  pass\n'         +
+                                          'try :\n'          +
+                                          '  __r["apStaCount"] = len(network.WLAN(network.AP_IF).status("stations"))\n' +
+                                          'except :\n'       +
+                                          '  pass\n'         +
+                                          'try :\n'          +
+                                          '  __r["ethStatus"] = network.LAN().status()\n' +
+                                          'except :\n'       +
+                                          '  pass\n'         +
+                                          'print(__r)\n'     +
+                                          'del __r' )
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetMemInfo(self, gcCollect=False) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            self._exeCodeREPL('import gc')
-            if gcCollect :
-                self._exeCodeREPL('gc.collect()', timeoutSec=3)
-            mem = self._exeCodeREPL('[gc.mem_alloc(), gc.mem_free()]')
-            return dict( alloc = mem[0],
-                         free  = mem[1] )
+            if self._agentVersion :
+                mem = self._agentCall('memInfo', gcCollect, timeoutSec=3)
+            else :
+                self._exeCodeREPL('import gc')
+                if gcCollect :
+                    self._exeCodeREPL('gc.collect()', timeoutSec=3)
+                mem = self._exeCodeREPL('[gc.mem_alloc(), gc.mem_free()]')
+            return self._memInfoToDict(mem)
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetMCUTemp(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            f = self._exeCodeREPL( 'from esp32 import raw_temperature\n' +
-                                   'print(raw_temperature())' )
-            c = round(self._fahrenheit2Celsius(f)*10)/10
-            return dict( fahrenheit = f,
-                         celsius    = c )
+            if self._agentVersion :
+                f = self._agentCall('mcuTemp')
+            else :
+                f = self._exeCodeREPL( 'from esp32 import raw_temperature\n' +
+                                       'print(raw_temperature())' )
+            return self._mcuTempToDict(f)
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetUptimeMin(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            ms = self._exeCodeREPL( 'from time import ticks_ms\n' +
-                                    'print(ticks_ms())' )
+            if self._agentVersion :
+                ms = self._agentCall('uptimeMs')
+            else :
+                ms = self._exeCodeREPL( 'from time import ticks_ms\n' +
+                                        'print(ticks_ms())' )
             return round(ms / 1000 / 60)
         finally :
             self._endProcess()
@@ -1551,122 +4355,375 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetUniqueID(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            return self._exeCodeREPL( 'import machine, ubinascii\n' +
-                                      'print(repr(ubinascii.hexlify(machine.unique_id()).decode()))' )
+            if self._agentVersion :
+                return self._agentCall('uniqueID')
+            else :
+                return self._exeCodeREPL( 'import machine, ubinascii\n' +
+                                          'print(repr(ubinascii.hexlify(machine.unique_id()).decode()))' )
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetMHzFreq(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            return self._exeCodeREPL( 'from machine import freq\n' +
-                                      'print(freq())' ) // 1000000
+            if self._agentVersion :
+                return self._agentCall('freq') // 1000000
+            else :
+                return self._exeCodeREPL( 'from machine import freq\n' +
+                                          'print(freq())' ) // 1000000
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetFlashSize(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            return self._exeCodeREPL( 'from esp import flash_size\n' +
-                                      'print(flash_size())' )
+            if self._agentVersion :
+                return self._agentCall('flashSize')
+            else :
+                return self._exeCodeREPL( 'from esp import flash_size\n' +
+                                          'print(flash_size())' )
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetPlatformInfo(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            try :
-                platform = self._exeCodeREPL( 'import uplatform\n' +
-                                              'print(repr(uplatform.platform()))' )
-            except :
-                platform = 'N/A'
-            self._exeCodeREPL('import uos, sys')
-            system, __, release, version, implem = self._exeCodeREPL('tuple(uos.uname())')
-            try :
-                mpyVer = self._exeCodeREPL('sys.implementation.mpy')
-            except :
-                mpyVer = self._exeCodeREPL('sys.implementation._mpy')
-            return dict( platform = platform,
-                         system   = system,
-                         release  = release,
-                         version  = version,
-                         implem   = implem,
-                         spiram   = (implem.upper().find('SPIRAM') >=0),
-                         mpyver   = '%s.%s' % (mpyVer & 0xff, mpyVer >> 8 & 3) )
+            if self._agentVersion :
+                platform, uname, mpyVer = self._agentCall('platformInfo')
+            else :
+                try :
+                    platform = self._exeCodeREPL( 'import uplatform\n' +
+                                                  'print(repr(uplatform.platform()))' )
+                except :
+                    platform = 'N/A'
+                self._exeCodeREPL('import uos, sys')
+                uname = self._exeCodeREPL('tuple(uos.uname())')
+                try :
+                    mpyVer = self._exeCodeREPL('sys.implementation.mpy')
+                except :
+                    mpyVer = self._exeCodeREPL('sys.implementation._mpy')
+            return self._platformInfoToDict(platform, uname, mpyVer)
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetPartitions(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            return self._exeCodeREPL( 'from esp32 import Partition\n' +
-                                      '__p = [ ]\n' +
-                                      '__x = None\n' +
-                                      'for __x in Partition.find(Partition.TYPE_APP) :\n'  +
-                                      '  __p.append(__x.info())\n' +
-                                      'for __x in Partition.find(Partition.TYPE_DATA) :\n' +
-                                      '  __p.append(__x.info())\n' +
-                                      'del __x\n'    +
-                                      'print(__p)\n' +
-                                      'del __p' )
+            if self._agentVersion :
+                return self._partitionsFromJSON(self._agentCall('partitions'))
+            else :
+                return self._exeCodeREPL( 'from esp32 import Partition\n' +
+                                          '__p = [ ]\n' +
+                                          '__x = None\n' +
+                                          'for __x in Partition.find(Partition.TYPE_APP) :\n'  +
+                                          '  __p.append(__x.info())\n' +
+                                          'for __x in Partition.find(Partition.TYPE_DATA) :\n' +
+                                          '  __p.append(__x.info())\n' +
+                                          'del __x\n'    +
+                                          'print(__p)\n' +
+                                          'del __p' )
         finally :
             self._endProcess()
             self._threadStartReading()
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetPinsState(self) :
         if not self._isConnected :
             self._raiseConnectionError()
         self._threadStopReading()
         self._beginProcess()
         try :
-            return self._exeCodeREPL( 'from machine import Pin\n'     +
-                                      '__p = { }\n'                   +
-                                      'for i in range(50) :\n'        +
-                                      '  try :\n'                     +
-                                      '    __p[i] = Pin(i).value()\n' +
-                                      '  except :\n'                  +
-                                      '    pass\n'                    +
-                                      'print(__p)\n'                  +
-                                      'del __p\n',
-                                      timeoutSec = 3 )
+            if self._agentVersion :
+                return self._pinsStateFromJSON(self._agentCall('pinsState', timeoutSec=3))
+            else :
+                return self._exeCodeREPL( 'from machine import Pin\n'     +
+                                          '__p = { }\n'                   +
+                                          'for i in range(50) :\n'        +
+                                          '  try :\n'                     +
+                                          '    __p[i] = Pin(i).value()\n' +
+                                          '  except :\n'                  +
+                                          '    pass\n'                    +
+                                          'print(__p)\n'                  +
+                                          'del __p\n',
+                                          timeoutSec = 3 )
+        finally :
+            self._endProcess()
+            self._threadStartReading()
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _infoQueries() :
+        macToStr = ESP32Controller._macAddrToStr
+        wlanCfg  = ( 'import network\n'                             +
+                     'x = network.WLAN(network.%s)\n'               +
+                     'try :\n'                                      +
+                     '  v = x.config("ssid")\n'                     +
+                     'except :\n'                                   +
+                     '  v = x.config("essid")\n'                    +
+                     'v = [v, x.ifconfig()]' )
+        cfgCheck = ''.join([ ( 'try :\n'                            +
+                               '  x.%s(%s)\n' % ( 'get_i32' if _type == int else 'get_blob',
+                                                  repr(key) if _type == int else '%s, bytearray(256)' % repr(key) ) +
+                               '  v.append(%s)\n' % repr(cfgName)   +
+                               'except :\n'                         +
+                               '  pass\n' )
+                             for cfgName, (key, _type) in ESP32Controller.CONFIGURATIONS_KEYS.items() ])
+        # name : (agent function and args or None, device code setting v, host conversion or None),
+        return {
+            'UniqueID'          : ( ('uniqueID', ),
+                                    'import machine, ubinascii\n' +
+                                    'v = ubinascii.hexlify(machine.unique_id()).decode()',
+                                    None ),
+            'MHzFreq'           : ( ('freq', ),
+                                    'from machine import freq\n' +
+                                    'v = freq()',
+                                    lambda v : v // 1000000 ),
+            'FlashSize'         : ( ('flashSize', ),
+                                    'from esp import flash_size\n' +
+                                    'v = flash_size()',
+                                    None ),
+            'PlatformInfo'      : ( ('platformInfo', ),
+                                    'import uos, sys\n'                +
+                                    'try :\n'                          +
+                                    '  import uplatform\n'             +
+                                    '  p = uplatform.platform()\n'     +
+                                    'except :\n'                       +
+                                    '  p = None\n'                     +
+                                    'try :\n'                          +
+                                    '  m = sys.implementation.mpy\n'   +
+                                    'except :\n'                       +
+                                    '  m = sys.implementation._mpy\n'  +
+                                    'v = [p, tuple(uos.uname()), m]',
+                                    lambda v : ESP32Controller._platformInfoToDict(*v) ),
+            'Partitions'        : ( ('partitions', ),
+                                    'from esp32 import Partition\n' +
+                                    'v = [x.info() for x in Partition.find(Partition.TYPE_APP)] + \\\n' +
+                                    '    [x.info() for x in Partition.find(Partition.TYPE_DATA)]',
+                                    ESP32Controller._partitionsFromJSON ),
+            'PinsState'         : ( ('pinsState', ),
+                                    'from machine import Pin\n'     +
+                                    'v = { }\n'                     +
+                                    'for i in range(50) :\n'        +
+                                    '  try :\n'                     +
+                                    '    v[i] = Pin(i).value()\n'   +
+                                    '  except :\n'                  +
+                                    '    pass',
+                                    ESP32Controller._pinsStateFromJSON ),
+            'AllConfigurations' : ( None,
+                                    'import os\n'                   +
+                                    'from esp32 import NVS\n'       +
+                                    'v = [ ]\n'                     +
+                                    'd = os.getcwd()\n'             +
+                                    'try :\n'                       +
+                                    '  os.stat(d[:d.index("/")] + %s)\n' % repr('/' + ESP32Controller.BOOT_CONFIG_MPY_FILENAME) +
+                                    '  v.append("BOOT")\n'          +
+                                    'except :\n'                    +
+                                    '  pass\n'                      +
+                                    'x = NVS(%s)\n' % repr(ESP32Controller.NVS_NAMESPACE_CONFIG) +
+                                    cfgCheck,
+                                    None ),
+            'MemInfo'           : ( ('memInfo', ),
+                                    'import gc\n' +
+                                    'v = [gc.mem_alloc(), gc.mem_free()]',
+                                    ESP32Controller._memInfoToDict ),
+            'MCUTemp'           : ( ('mcuTemp', ),
+                                    'from esp32 import raw_temperature\n' +
+                                    'v = raw_temperature()',
+                                    ESP32Controller._mcuTempToDict ),
+            'UptimeMin'         : ( ('uptimeMs', ),
+                                    'from time import ticks_ms\n' +
+                                    'v = ticks_ms()',
+                                    lambda v : round(v / 1000 / 60) ),
+            'NetworksMinInfo'   : ( ('networksMinInfo', ),
+                                    'import network\n' +
+                                    'v = dict()\n'     +
+                                    'try :\n'          +
+                                    '  v["staRSSI"] = network.WLAN(network.STA_IF).status("rssi")\n' +
+                                    'except :\n'       +
+                                    '  pass\n'         +
+                                    'try :\n'          +
+                                    '  v["apStaCount"] = len(network.WLAN(network.AP_IF).status("stations"))\n' +
+                                    'except :\n'       +
+                                    '  pass\n'         +
+                                    'try :\n'          +
+                                    '  v["ethStatus"] = network.LAN().status()\n' +
+                                    'except :\n'       +
+                                    '  pass',
+                                    None ),
+            'WiFiSTAActive'     : ( ('wifiActive', False),
+                                    'import network\n' +
+                                    'v = network.WLAN(network.STA_IF).active()',
+                                    None ),
+            'WiFiAPActive'      : ( ('wifiActive', True),
+                                    'import network\n' +
+                                    'v = network.WLAN(network.AP_IF).active()',
+                                    None ),
+            'WiFiSTAMacAddr'    : ( ('wifiMacAddr', False),
+                                    'import network\n' +
+                                    'v = network.WLAN(network.STA_IF).config("mac")',
+                                    macToStr ),
+            'WiFiAPMacAddr'     : ( ('wifiMacAddr', True),
+                                    'import network\n' +
+                                    'v = network.WLAN(network.AP_IF).config("mac")',
+                                    macToStr ),
+            'WiFiSTAConfig'     : ( ('wifiConfig', False),
+                                    wlanCfg % 'STA_IF',
+                                    lambda v : ESP32Controller._wifiConfigToDict(*v) ),
+            'WiFiAPConfig'      : ( ('wifiConfig', True),
+                                    wlanCfg % 'AP_IF',
+                                    lambda v : ESP32Controller._wifiConfigToDict(*v) ),
+            'APClientsAddr'     : ( ('apClientsAddr', ),
+                                    'import network\n' +
+                                    'v = [x[0] for x in network.WLAN(network.AP_IF).status("stations")]',
+                                    lambda v : [macToStr(x) for x in v] ),
+            'ETHInfo'           : ( ('ethInfo', ),
+                                    'import network\n'               +
+                                    'v = None\n'                     +
+                                    'if hasattr(network, "LAN") :\n' +
+                                    '  try :\n'                      +
+                                    '    x = network.LAN()\n'        +
+                                    '    v = [x.config("mac"), x.status(), x.ifconfig()]\n' +
+                                    '  except :\n'                   +
+                                    '    v = [ ]',
+                                    ESP32Controller._ethInfoToDict ),
+            'BLEActive'         : ( ('bleActive', ),
+                                    'import bluetooth\n' +
+                                    'v = bluetooth.BLE().active()',
+                                    None ),
+            'BLEMacAddr'        : ( None,
+                                    'import bluetooth\n'          +
+                                    'x = bluetooth.BLE()\n'       +
+                                    'a = x.active()\n'            +
+                                    'if not a :\n'                +
+                                    '  x.active(True)\n'          +
+                                    'v = x.config("mac")[1]\n'    +
+                                    'if not a :\n'                +
+                                    '  x.active(False)',
+                                    macToStr ),
+            'InternetOk'        : ( ('internetOk', ),
+                                    'import network\n'                                               +
+                                    'try :\n'                                                        +
+                                    '  l = network.LAN().status() == 5\n'                            +
+                                    'except :\n'                                                     +
+                                    '  l = False\n'                                                  +
+                                    'v = False\n'                                                    +
+                                    'if l or network.WLAN(network.STA_IF).isconnected() :\n'         +
+                                    '  import socket\n'                                              +
+                                    '  x = socket.socket()\n'                                        +
+                                    '  try :\n'                                                      +
+                                    '    x.connect(socket.getaddrinfo("google.com", 80)[0][-1])\n'   +
+                                    '    v = True\n'                                                 +
+                                    '  except :\n'                                                   +
+                                    '    pass\n'                                                     +
+                                    '  x.close()',
+                                    None )
+        }
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _buildInfosCode(names, agentModName=None) :
+        queries = ESP32Controller._infoQueries()
+        code    = 'def __q() :\n' + \
+                  '  r = [ ]\n'
+        if agentModName :
+            code += '  g = __import__(%s)\n' % repr(agentModName)
+        for name in names :
+            if name not in queries :
+                raise ValueError('Unknown info "%s".' % name)
+            agentCall, devCode, __ = queries[name]
+            if agentModName and agentCall :
+                devCode = 'v = g.%s(%s)' % (agentCall[0], ', '.join([repr(x) for x in agentCall[1:]]))
+            code += '  try :\n'                                                    + \
+                    ''.join(['    %s\n' % line for line in devCode.split('\n')])   + \
+                    '    r.append((1, v))\n'                                       + \
+                    '  except Exception as ex :\n'                                 + \
+                    '    r.append((0, "%s: %s" % (type(ex).__name__, ex)))\n'
+        code += '  return r\n'
+        if agentModName :
+            code += 'print(__import__(%s).dumps(__q()))\n' % repr(agentModName) + \
+                    'del __q'
+        else :
+            code += ESP32Controller.DEVICE_JSONABLE_FUNC + \
+                    'import ujson\n'                     + \
+                    'print(ujson.dumps(__j(__q())))\n'   + \
+                    'del __q, __j'
+        return code
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _infosFromResults(names, results, raiseOnError) :
+        queries = ESP32Controller._infoQueries()
+        r       = { }
+        for name, (ok, value) in zip(names, results) :
+            if ok :
+                convert = queries[name][2]
+                r[name] = (convert(value) if convert else value)
+            elif raiseOnError :
+                raise ESP32ControllerCodeException(value)
+            else :
+                r[name] = ESP32ControllerCodeException(value)
+        return r
+
+    # ---------------------------------------------------------------------------
+
+    @_timedREPL
+    def GetInfos(self, names, timeoutSec=10, raiseOnError=True) :
+        if not self._isConnected :
+            self._raiseConnectionError()
+        agentModName = ( self.AGENT_MPY_FILENAME.rsplit('.', 1)[0] if self._agentVersion else None )
+        code         = self._buildInfosCode(names, agentModName)
+        self._threadStopReading()
+        self._beginProcess()
+        try :
+            results = self._exeCodeREPL(code, timeoutSec=timeoutSec, resultFormat=self.RESULT_JSON)
         finally :
             self._endProcess()
             self._threadStartReading()
+        return self._infosFromResults(names, results, raiseOnError)
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def SetFreq(self, freq) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1711,6 +4768,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def InitSDCardAndGetSize(self) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1739,6 +4797,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def FormatSDCard(self) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1761,6 +4820,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def GetSDCardConf(self) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1781,6 +4841,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def MountSDCardFileSystem(self, mountPointName='/sd') :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1815,6 +4876,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def UmountSDCardFileSystem(self) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1838,6 +4900,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def ReleaseSDCard(self) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1860,6 +4923,8 @@ class ESP32Controller :
             self._raiseConnectionError()
         self.ExecProgram( 'from machine import reset\n' +
                           'reset()' )
+        # The device restarts its REPL UART at the initial baudrate,
+        self._setHostBaudrate(self._baudrate)
 
     # ---------------------------------------------------------------------------
 
@@ -1873,6 +4938,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def ImportModule(self, moduleName) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -1886,6 +4952,7 @@ class ESP32Controller :
 
     # ---------------------------------------------------------------------------
 
+    @_timedREPL
     def InstallPackage(self, packageName) :
         if not self._isConnected :
             self._raiseConnectionError()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright © 2023 Jean-Christophe Bos (jczic.bos@gmail.com)
+"""
+
+from   hashlib  import sha256
+import subprocess
+import tempfile
+import os
+import conf
+
+if conf.IS_MACOS :
+    import macOSPaths
+elif conf.IS_LINUX :
+    import linuxPaths
+
+_mpyCross = [ ]
+_version  = None
+
+class LaunchMpyCrossException(Exception) :
+    pass
+
+# ------------------------------------------------------------------------
+
+def GetVersion() :
+    # Returns the .mpy version emitted by mpy-cross (like "6.2") or None,
+    global _version
+    if _mpyCross and not _version :
+        try :
+            proc = subprocess.Popen( _mpyCross + [ '--version' ],
+                                     stdout = subprocess.PIPE,
+                                     stderr = subprocess.PIPE )
+            out  = proc.communicate()[0].decode()
+            idx  = out.find('mpy v')
+            if idx >= 0 :
+                _version = out[idx+5:].split()[0]
+        except :
+            raise LaunchMpyCrossException()
+    return _version
+
+# ------------------------------------------------------------------------
+
+def IsCompatible(mpyVer) :
+    # Bytecode only .mpy files load on any device having the same major version,
+    version = GetVersion()
+    if version and mpyVer :
+        return version.split('.')[0] == str(mpyVer).split('.')[0]
+    return False
+
+# ------------------------------------------------------------------------
+
+def Compile(source, sourceName, mpyVer) :
+    # Returns the .mpy bytecode of source or None if it cannot be compiled for mpyVer,
+    # results are cached on disk by source hash and device mpy version,
+    if not IsCompatible(mpyVer) :
+        return None
+    if isinstance(source, str) :
+        source = source.encode()
+    key = sha256( source             + b'\x00' +
+                  sourceName.encode() + b'\x00' +
+                  GetVersion().encode() ).hexdigest()
+    cacheFilename = conf.DIRECTORY_MPY_CACHE / ('%s-%s.mpy' % (key, mpyVer))
+    try :
+        return cacheFilename.read_bytes()
+    except OSError :
+        pass
+    with tempfile.TemporaryDirectory() as tmpDir :
+        srcFilename = os.path.join(tmpDir, 'code.py')
+        mpyFilename = os.path.join(tmpDir, 'code.mpy')
+        with open(srcFilename, 'wb') as f :
+            f.write(source)
+        try :
+            # No shell here, the source name may contain "<" and ">",
+            proc = subprocess.Popen( _mpyCross + [ '-s', sourceName, '-o', mpyFilename, srcFilename ],
+                                     stdout = subprocess.PIPE,
+                                     stderr = subprocess.PIPE )
+            proc.communicate()
+        except :
+            raise LaunchMpyCrossException()
+        if proc.returncode != 0 :
+            # Syntax errors are left to the device that reports them as usual,
+            return None
+        with open(mpyFilename, 'rb') as f :
+            data = f.read()
+    try :
+        os.makedirs(conf.DIRECTORY_MPY_CACHE, exist_ok=True)
+        tmpFilename = cacheFilename.with_suffix('.tmp')
+        tmpFilename.write_bytes(data)
+        os.replace(tmpFilename, cacheFilename)
+    except OSError :
+        pass
+    return data
+
+# ------------------------------------------------------------------------
+
+def _setMpyCrossWin32() :
+    global _mpyCross
+    for launch in ( [ 'mpy-cross' ], [ 'python', '-m', 'mpy_cross' ], [ 'py', '-m', 'mpy_cross' ] ) :
+        _mpyCross = launch
+        try :
+            if GetVersion() :
+                return
+        except :
+            pass
+    _mpyCross = [ ]
+
+# ------------------------------------------------------------------------
+
+if conf.IS_MACOS :
+    mpyCrossFilename = macOSPaths.GetFilePathFromFilename('mpy-cross')
+    if mpyCrossFilename :
+        _mpyCross = [ mpyCrossFilename ]
+elif conf.IS_LINUX :
+    mpyCrossFilename = linuxPaths.GetFilePathFromFilename('mpy-cross')
+    if mpyCrossFilename :
+        _mpyCross = [ mpyCrossFilename ]
+elif conf.IS_WIN32 :
+    _setMpyCrossWin32()
@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+
+# ============================================= #
+#                                               #
+# Copyright © 2023 JC`zic (Jean-Christophe Bos) #
+#             jczic.bos@gmail.com               #
+#                                               #
+# ============================================= #
+
+
+from   time              import time, strftime, localtime
+from   os                import makedirs, listdir, remove, scandir, sep
+from   os.path           import join as pathJoin, isdir, isfile, getsize, dirname
+from   shutil            import rmtree
+from   bisect            import bisect_right
+from   zlib              import compressobj, decompressobj, DEFLATED
+from   json              import loads as jsonLoads, dumps as jsonDumps
+from   threading         import Condition
+from   _thread           import start_new_thread
+import re
+
+
+# ===============================================================================
+# ===( OutputCaptureException )==================================================
+# ===============================================================================
+
+class OutputCaptureException(Exception) :
+    pass
+
+# ===============================================================================
+# ===( OutputCapture )===========================================================
+# ===============================================================================
+
+class OutputCapture :
+
+    # A session directory holds gzip segments made of one gzip member per block of output
+    # and an index with one JSON line per block:
+    #   [ segment, compressed offset, compressed size, offset, size, first time, last time ]
+    # Blocks are compressed and written by a thread, Write() only buffers the output,
+    # the disk budget is shared by all the sessions of the root path,
+
+    BLOCK_BYTES              = 64*1024
+    BLOCK_SEC                = 1
+    SEGMENT_BYTES            = 16*1024*1024
+    MAX_BYTES                = 1024*1024*1024
+    MAX_QUEUED_BYTES         = 4*1024*1024
+    INDEX_FILENAME           = 'index.jsonl'
+    SEGMENT_FILENAME         = 'segment-%05d.gz'
+    SESSION_TIME_FORMAT      = '%Y%m%d-%H%M%S'
+
+    # ---------------------------------------------------------------------------
+
+    def __init__( self,
+                  rootPath,
+                  deviceName,
+                  blockBytes   = BLOCK_BYTES,
+                  blockSec     = BLOCK_SEC,
+                  segmentBytes = SEGMENT_BYTES,
+                  maxBytes     = MAX_BYTES ) :
+        self._rootPath     = str(rootPath)
+        self._deviceName   = self._safeName(deviceName)
+        self._sessionName  = strftime(self.SESSION_TIME_FORMAT, localtime())
+        self._sessionPath  = pathJoin(self._rootPath, self._deviceName, self._sessionName)
+        i = 1
+        while isdir(self._sessionPath) :
+            # Reconnected within the same second,
+            i += 1
+            self._sessionPath = pathJoin(self._rootPath, self._deviceName, '%s-%d' % (self._sessionName, i))
+        self._sessionName  = self._sessionPath.rsplit(sep, 1)[-1]
+        self._blockBytes   = blockBytes
+        self._blockSec     = blockSec
+        self._segmentBytes = segmentBytes
+        self._maxBytes     = maxBytes
+        self._block        = [ ]
+        self._blockSize    = 0
+        self._blockTimes   = None
+        self._queue        = [ ]
+        self._queueSize    = 0
+        self._writing      = False
+        self._droppedSize  = 0
+        self._segment      = 0
+        self._segmentSize  = 0
+        self._segmentsDisk = { }
+        self._oldSegments  = None
+        self._oldSize      = 0
+        self._offset       = 0
+        self._cond         = Condition()
+        self._closed       = False
+        try :
+            makedirs(self._sessionPath, exist_ok=True)
+        except OSError :
+            raise OutputCaptureException('Cannot create capture directory "%s".' % self._sessionPath)
+        start_new_thread(self._threadWrite, ())
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _safeName(name) :
+        return re.sub(r'[^\w.-]+', '_', str(name)).strip('_') or 'device'
+
+    # ---------------------------------------------------------------------------
+
+    def GetSessionID(self) :
+        return self._deviceName + '/' + self._sessionName
+
+    # ---------------------------------------------------------------------------
+
+    def Write(self, text) :
+        # Capture sink of TerminalOutput, called with the whole terminal output (reader thread),
+        if not text :
+            return
+        data = text.encode('UTF-8')
+        now  = time()
+        with self._cond :
+            if self._closed :
+                return
+            self._block.append(data)
+            self._blockSize += len(data)
+            if self._blockTimes :
+                self._blockTimes[1] = now
+            else :
+                self._blockTimes = [ now, now ]
+            if self._blockSize >= self._blockBytes or now - self._blockTimes[0] >= self._blockSec :
+                self._queueBlock()
+
+    # ---------------------------------------------------------------------------
+
+    def _queueBlock(self) :
+        # Must be called with the condition held,
+        if not self._blockSize :
+            return
+        if self._queueSize + self._blockSize > self.MAX_QUEUED_BYTES :
+            # The disk does not keep up, the block is dropped rather than the memory growing,
+            self._droppedSize += self._blockSize
+        else :
+            self._queue.append((b''.join(self._block), self._blockTimes[0], self._blockTimes[1]))
+            self._queueSize += self._blockSize
+        self._block      = [ ]
+        self._blockSize  = 0
+        self._blockTimes = None
+        self._cond.notify_all()
+
+    # ---------------------------------------------------------------------------
+
+    def _threadWrite(self) :
+        while True :
+            with self._cond :
+                self._cond.wait_for(lambda : self._queue or self._closed)
+                if not self._queue :
+                    break
+                data, t0, t1     = self._queue.pop(0)
+                self._queueSize -= len(data)
+                self._writing    = True
+            try :
+                self._writeBlock(data, t0, t1)
+            except Exception :
+                pass
+            with self._cond :
+                self._writing = False
+                self._cond.notify_all()
+
+    # ---------------------------------------------------------------------------
+
+    def _writeBlock(self, data, t0, t1) :
+        if self._segmentSize >= self._segmentBytes :
+            self._segment    += 1
+            self._segmentSize = 0
+        z        = compressobj(6, DEFLATED, 31)
+        zData    = z.compress(data) + z.flush()
+        filename = pathJoin(self._sessionPath, self.SEGMENT_FILENAME % self._segment)
+        try :
+            with open(filename, 'ab') as f :
+                zOffset = f.tell()
+                f.write(zData)
+            with open(pathJoin(self._sessionPath, self.INDEX_FILENAME), 'a') as f :
+                f.write(jsonDumps([ self._segment, zOffset, len(zData),
+                                    self._offset, len(data),
+                                    round(t0, 3), round(t1, 3) ]) + '\n')
+        except OSError :
+            return
+        with self._cond :
+            self._offset += len(data)
+            self._segmentsDisk[self._segment] = zOffset + len(zData)
+        self._segmentSize += len(data)
+        self._applyRetention()
+
+    # ---------------------------------------------------------------------------
+
+    def _loadOldSegments(self) :
+        # Segments of the previous sessions, the oldest first,
+        self._oldSegments = [ ]
+        self._oldSize     = 0
+        for devicePath in scandir(self._rootPath) :
+            if not devicePath.is_dir() :
+                continue
+            for sessionPath in scandir(devicePath.path) :
+                if not sessionPath.is_dir() or sessionPath.path == self._sessionPath :
+                    continue
+                for entry in scandir(sessionPath.path) :
+                    if entry.name.startswith('segment-') :
+                        st = entry.stat()
+                        self._oldSegments.append((st.st_mtime, entry.path, st.st_size))
+                        self._oldSize += st.st_size
+        self._oldSegments.sort()
+
+    # ---------------------------------------------------------------------------
+
+    def _applyRetention(self) :
+        # Oldest segments of all the sessions are removed once the captures exceed the budget,
+        # their index lines stay and are reported as dropped when read, empty sessions are removed,
+        if self._oldSegments is None :
+            try :
+                self._loadOldSegments()
+            except OSError :
+                self._oldSegments = [ ]
+        while self._oldSegments and self._oldSize + sum(self._segmentsDisk.values()) > self._maxBytes :
+            mtime, filename, size = self._oldSegments.pop(0)
+            self._oldSize -= size
+            try :
+                remove(filename)
+                sessionPath = dirname(filename)
+                if not any(x.startswith('segment-') for x in listdir(sessionPath)) :
+                    rmtree(sessionPath, ignore_errors=True)
+            except OSError :
+                pass
+        while sum(self._segmentsDisk.values()) > self._maxBytes and len(self._segmentsDisk) > 1 :
+            with self._cond :
+                segment = min(self._segmentsDisk)
+                del self._segmentsDisk[segment]
+            try :
+                remove(pathJoin(self._sessionPath, self.SEGMENT_FILENAME % segment))
+            except OSError :
+                pass
+
+    # ---------------------------------------------------------------------------
+
+    def Flush(self, wait=True) :
+        # Queues the current block and can wait until everything queued is on disk,
+        with self._cond :
+            self._queueBlock()
+            if wait :
+                self._cond.wait_for(lambda : not self._queue and not self._writing)
+
+    # ---------------------------------------------------------------------------
+
+    def Close(self) :
+        with self._cond :
+            if self._closed :
+                return
+            self._queueBlock()
+            self._closed = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda : not self._queue and not self._writing)
+
+    # ---------------------------------------------------------------------------
+
+    def GetStats(self) :
+        with self._cond :
+            return dict( session     = self.GetSessionID(),
+                         size        = self._offset + self._queueSize + self._blockSize,
+                         diskSize    = sum(self._segmentsDisk.values()),
+                         segments    = len(self._segmentsDisk),
+                         droppedSize = self._droppedSize )
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def GetSessions(rootPath) :
+        # Returns all the captured sessions, the most recent first,
+        sessions = [ ]
+        if not isdir(rootPath) :
+            return sessions
+        for deviceName in listdir(rootPath) :
+            devicePath = pathJoin(rootPath, deviceName)
+            if not isdir(devicePath) :
+                continue
+            for sessionName in listdir(devicePath) :
+                try :
+                    reader = OutputCaptureReader(pathJoin(devicePath, sessionName))
+                except OutputCaptureException :
+                    continue
+                startTime, endTime = reader.GetTimeRange()
+                sessions.append( dict( id        = deviceName + '/' + sessionName,
+                                       device    = deviceName,
+                                       session   = sessionName,
+                                       size      = reader.GetSize(),
+                                       diskSize  = reader.GetDiskSize(),
+                                       startTime = startTime,
+                                       endTime   = endTime ) )
+        return sorted(sessions, key=lambda x : x['session'], reverse=True)
+
+# ===============================================================================
+# ===( OutputCaptureReader )=====================================================
+# ===============================================================================
+
+class OutputCaptureReader :
+
+    SEARCH_LINE_MAX_LEN      = 256
+
+    # ---------------------------------------------------------------------------
+
+    def __init__(self, sessionPath) :
+        self._sessionPath = sessionPath
+        self._index       = [ ]
+        try :
+            with open(pathJoin(sessionPath, OutputCapture.INDEX_FILENAME), 'r') as f :
+                for line in f :
+                    try :
+                        self._index.append(jsonLoads(line))
+                    except ValueError :
+                        # Last line of a session being written,
+                        break
+        except OSError :
+            raise OutputCaptureException('Cannot open capture session "%s".' % sessionPath)
+        self._offsets = [ x[3] for x in self._index ]
+
+    # ---------------------------------------------------------------------------
+
+    def GetSize(self) :
+        if self._index :
+            return self._index[-1][3] + self._index[-1][4]
+        return 0
+
+    # ---------------------------------------------------------------------------
+
+    def GetDiskSize(self) :
+        size = 0
+        for segment in set(x[0] for x in self._index) :
+            filename = pathJoin(self._sessionPath, OutputCapture.SEGMENT_FILENAME % segment)
+            if isfile(filename) :
+                size += getsize(filename)
+        return size
+
+    # ---------------------------------------------------------------------------
+
+    def GetTimeRange(self) :
+        if self._index :
+            return self._index[0][5], self._index[-1][6]
+        return None, None
+
+    # ---------------------------------------------------------------------------
+
+    def GetOffsetAtTime(self, t) :
+        # Offset of the first block written at or after t,
+        for block in self._index :
+            if block[6] >= t :
+                return block[3]
+        return self.GetSize()
+
+    # ---------------------------------------------------------------------------
+
+    def _readBlock(self, block) :
+        # Returns the uncompressed data of a block or None if its segment was removed,
+        filename = pathJoin(self._sessionPath, OutputCapture.SEGMENT_FILENAME % block[0])
+        try :
+            with open(filename, 'rb') as f :
+                f.seek(block[1])
+                zData = f.read(block[2])
+            return decompressobj(31).decompress(zData)
+        except Exception :
+            return None
+
+    # ---------------------------------------------------------------------------
+
+    def Read(self, offset, size) :
+        # Returns a page of output, offset moves forward past removed segments,
+        i       = max(bisect_right(self._offsets, offset) - 1, 0)
+        data    = [ ]
+        dataLen = 0
+        first   = None
+        t       = None
+        while i < len(self._index) and dataLen < size :
+            block = self._index[i]
+            i    += 1
+            if block[3] + block[4] <= offset :
+                continue
+            b = self._readBlock(block)
+            if b is None :
+                if first is None :
+                    offset = block[3] + block[4]
+                continue
+            if first is None :
+                first  = max(offset, block[3])
+                t      = block[5]
+                b      = b[first - block[3]:]
+            data.append(b)
+            dataLen += len(b)
+        data = b''.join(data)[:size]
+        if first is None :
+            first = min(max(offset, 0), self.GetSize())
+        return dict( offset = first,
+                     size   = len(data),
+                     time   = t,
+                     text   = data.decode('UTF-8', 'replace') )
+
+    # ---------------------------------------------------------------------------
+
+    def Search(self, pattern, regex=False, ignoreCase=True, maxResults=100, offset=0) :
+        # Scans the blocks one by one and returns the matching lines with their offsets,
+        flags = (re.IGNORECASE if ignoreCase else 0)
+        if regex :
+            expr = re.compile(pattern.encode('UTF-8'), flags)
+        else :
+            expr = re.compile(re.escape(pattern.encode('UTF-8')), flags)
+        results   = [ ]
+        carry     = b''
+        carryOffs = None
+        i         = max(bisect_right(self._offsets, offset) - 1, 0)
+        while i < len(self._index) and len(results) < maxResults :
+            block = self._index[i]
+            i    += 1
+            b     = self._readBlock(block)
+            if b is None :
+                carry = b''
+                continue
+            if not carry :
+                carryOffs = block[3]
+            data  = carry + b
+            lines = data.split(b'\n')
+            carry = lines.pop()
+            pos   = carryOffs
+            for line in lines :
+                if pos >= offset and expr.search(line) :
+                    results.append( dict( offset = pos,
+                                          time   = block[5],
+                                          line   = line.rstrip(b'\r')[:self.SEARCH_LINE_MAX_LEN]
+                                                       .decode('UTF-8', 'replace') ) )
+                    if len(results) >= maxResults :
+                        break
+                pos += len(line) + 1
+            carryOffs = pos
+        if carry and len(results) < maxResults and carryOffs >= offset and expr.search(carry) :
+            results.append( dict( offset = carryOffs,
+                                  time   = self._index[-1][5],
+                                  line   = carry.rstrip(b'\r')[:self.SEARCH_LINE_MAX_LEN]
+                                                .decode('UTF-8', 'replace') ) )
+        return results
+
+# ===============================================================================
+# ===============================================================================
+# ===============================================================================
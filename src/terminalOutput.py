@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+# ============================================= #
+#                                               #
+# Copyright © 2023 JC`zic (Jean-Christophe Bos) #
+#             jczic.bos@gmail.com               #
+#                                               #
+# ============================================= #
+
+
+from   time              import time, sleep
+from   threading         import Condition
+from   _thread           import allocate_lock, start_new_thread
+
+
+# ===============================================================================
+# ===( TerminalOutput )==========================================================
+# ===============================================================================
+
+class TerminalOutput :
+
+    BATCH_SEC                = 0.016
+    MAX_BYTES_PER_SEC        = 128*1024
+    MAX_PENDING_BYTES        = 256*1024
+    DROPPED_MARKER           = '\r\n[... %s bytes dropped ...]\r\n'
+
+    # ---------------------------------------------------------------------------
+
+    def __init__( self,
+                  onFlush,
+                  batchSec        = BATCH_SEC,
+                  maxBytesPerSec  = MAX_BYTES_PER_SEC,
+                  maxPendingBytes = MAX_PENDING_BYTES ) :
+        self._onFlush         = onFlush
+        self._batchSec        = batchSec
+        self._maxBytesPerSec  = maxBytesPerSec
+        self._maxPendingBytes = maxPendingBytes
+        self._pending         = [ ]
+        self._pendingSize     = 0
+        self._droppedSize     = 0
+        self._writtenSize     = 0
+        self._doneSize        = 0
+        self._budget          = maxBytesPerSec * batchSec
+        self._budgetTime      = time()
+        self._captureSinks    = [ ]
+        self._lock            = allocate_lock()
+        self._lockFlush       = allocate_lock()
+        self._cond            = Condition()
+        self._running         = False
+        self._stats           = dict( recvBytes    = 0,
+                                      sentBytes    = 0,
+                                      droppedBytes = 0,
+                                      batches      = 0 )
+
+    # ---------------------------------------------------------------------------
+
+    def Start(self) :
+        with self._cond :
+            if self._running :
+                return
+            self._running = True
+        start_new_thread(self._threadFlush, ())
+
+    # ---------------------------------------------------------------------------
+
+    def Close(self) :
+        with self._cond :
+            self._running = False
+            self._cond.notify_all()
+        self.Flush()
+
+    # ---------------------------------------------------------------------------
+
+    def AddCaptureSink(self, sink) :
+        # Sinks are called with the whole output, before batching and rate limiting,
+        with self._lock :
+            if sink not in self._captureSinks :
+                self._captureSinks.append(sink)
+
+    # ---------------------------------------------------------------------------
+
+    def RemoveCaptureSink(self, sink) :
+        with self._lock :
+            if sink in self._captureSinks :
+                self._captureSinks.remove(sink)
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def _charStart(data, i) :
+        # Moves a cut position in UTF-8 data back to the start of its character,
+        while 0 < i < len(data) and (data[i] & 0xC0) == 0x80 :
+            i -= 1
+        return i
+
+    # ---------------------------------------------------------------------------
+
+    def _dropOldest(self, size) :
+        # Drops at least size bytes of the oldest pending output, on a character boundary,
+        data = b''.join(self._pending)
+        while size < len(data) and (data[size] & 0xC0) == 0x80 :
+            size += 1
+        self._pending      = ([ data[size:] ] if size < len(data) else [ ])
+        self._pendingSize -= size
+        self._droppedSize += size
+        self._doneSize    += size
+
+    # ---------------------------------------------------------------------------
+
+    def Write(self, text) :
+        # Sizes and limits are all counted in UTF-8 bytes,
+        if not text :
+            return
+        data = text.encode('UTF-8', 'replace')
+        with self._lock :
+            sinks = list(self._captureSinks)
+            self._stats['recvBytes'] += len(data)
+            self._pending.append(data)
+            self._pendingSize += len(data)
+            self._writtenSize += len(data)
+            # The UI is falling behind, the oldest pending output is dropped,
+            if self._pendingSize > self._maxPendingBytes :
+                self._dropOldest(self._pendingSize - self._maxPendingBytes)
+        for sink in sinks :
+            try :
+                sink(text)
+            except :
+                pass
+
+    # ---------------------------------------------------------------------------
+
+    def _takePending(self) :
+        # Takes the pending output allowed by the rate budget, the rest stays pending,
+        with self._lock :
+            now = time()
+            self._budget     = min( self._budget + (now - self._budgetTime) * self._maxBytesPerSec,
+                                    self._maxBytesPerSec )
+            self._budgetTime = now
+            if not self._pendingSize and not self._droppedSize :
+                return None
+            budget = max(int(self._budget), 0)
+            data   = b''.join(self._pending)
+            size = self._charStart(data, min(len(data), budget))
+            if size <= 0 and not self._droppedSize :
+                return None
+            rest = data[size:]
+            text = data[:size].decode('UTF-8', 'replace')
+            self._pending     = ([ rest ] if rest else [ ])
+            self._pendingSize = len(rest)
+            self._budget     -= size
+            self._doneSize   += size
+            if self._droppedSize :
+                text = (self.DROPPED_MARKER % self._droppedSize) + text
+                self._stats['droppedBytes'] += self._droppedSize
+                self._droppedSize = 0
+            self._stats['sentBytes'] += size
+            self._stats['batches']   += 1
+            return text
+
+    # ---------------------------------------------------------------------------
+
+    def _flush(self) :
+        # The lock keeps batches in order between the flush thread and Flush(),
+        with self._lockFlush :
+            text = self._takePending()
+            if text :
+                self._onFlush(text)
+
+    # ---------------------------------------------------------------------------
+
+    def Flush(self) :
+        # Sends the output written so far in budgeted batches, waiting for the rate limit,
+        # output written meanwhile is left to the flush thread,
+        with self._lock :
+            target = self._writtenSize
+        while True :
+            self._flush()
+            with self._lock :
+                if self._doneSize >= target :
+                    return
+            sleep(self._batchSec)
+
+    # ---------------------------------------------------------------------------
+
+    def _threadFlush(self) :
+        while True :
+            with self._cond :
+                self._cond.wait_for(lambda : not self._running, timeout=self._batchSec)
+                if not self._running :
+                    break
+            try :
+                self._flush()
+            except :
+                pass
+
+    # ---------------------------------------------------------------------------
+
+    def GetStats(self) :
+        with self._lock :
+            return dict(self._stats, pendingBytes=self._pendingSize)
+
+# ===============================================================================
+# ===============================================================================
+# ===============================================================================